@@ -2,17 +2,43 @@ import streamlit as st
 import gspread
 from oauth2client.service_account import ServiceAccountCredentials
 from datetime import datetime
+from collections import namedtuple
 import pandas as pd
 import time
 import math
+import atexit
+import queue
+import threading
+
+from storage import GoogleSheetsStorage, SQLiteStorage, WriteThroughStorage
+from write_queue import WriteBehindQueue, DeadLetters
+from settlement_job import SettlementJob, Checkpoint
+from sync import DeltaSync, fetch_tables
+from columnar import to_frame
+from snapshot import SnapshotPoller, merge_overlay
+from warmstart import SnapshotStore, BackgroundTask
+from ratelimit import QuotaGovernor, GovernedStorage, RateLimited
+from ledger import Ledger, InsufficientFunds, DuplicateBet
+from odds import OddsBook, teams_key
+from leaderboard import Leaderboard
+from metrics import Metrics, InstrumentedStorage
+from coord import make_coordinator, default_owner
 
 # --- [0] 기본 설정 ---
 st.set_page_config(page_title="DDC 승부예측 챌린지", page_icon="⚽", layout="wide")
+rerun_started = time.perf_counter() # 화면 재실행 시간 측정용
 
-# --- [1] 구글 시트 연결 설정 (완벽한 캐싱 적용) ---
-# 이 함수는 앱이 실행되는 동안 딱 1번만 실행됩니다. (새로고침 해도 실행 안 됨)
-@st.cache_resource
-def get_google_sheets():
+# --- [1] 저장소 연결 설정 (완벽한 캐싱 적용) ---
+# secrets.toml 의 [storage] 섹션으로 백엔드 선택
+#   backend = "gsheets" (기본) | "sqlite" (로컬 단독) | "mirror" (구글 시트 + 로컬 SQLite 미러)
+#   sqlite_path = "ddc.sqlite3"
+def get_storage_config():
+    try:
+        return dict(st.secrets.get("storage", {}))
+    except Exception:
+        return {}
+
+def open_spreadsheet():
     # 1. 인증
     scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
     key_dict = dict(st.secrets["gcp_service_account"])
@@ -22,246 +48,413 @@ def get_google_sheets():
     
     # 2. 시트 열기 (이 부분이 API를 많이 먹는데, 캐싱으로 막음!)
     url = "https://docs.google.com/spreadsheets/d/1Q4YJBhdUEHwYdMFMSFqbhyNG73z6l2rCObsKALol7IM/edit?gid=0#gid=0" 
-    sh = client.open_by_url(url)
-    
-    # 3. 워크시트 객체 반환
-    ws_users = sh.worksheet("Users")
-    ws_matches = sh.worksheet("Matches")
-    ws_bets = sh.worksheet("Bets")
+    return client.open_by_url(url)
+
+# 서버(레플리카) 여러 개가 같이 쓰는 조정 상태: 동기화 쿨타임 / 호출 제한 버킷 / 스냅샷 버전 / 정산 락
+# secrets.toml 의 [coord]
+#   backend = "local" (기본, 서버 1개) | "sqlite" (path = 공유 볼륨의 파일) | "redis" (url = "redis://...")
+@st.cache_resource
+def get_coordinator():
     try:
-        ws_teams = sh.worksheet("Teams")
-    except:
-        ws_teams = None
-        
-    return ws_users, ws_matches, ws_bets, ws_teams
+        conf = dict(st.secrets.get("coord", {}))
+    except Exception:
+        conf = {}
+    return make_coordinator(conf)
+
+SERVER_ID = default_owner() # 이 프로세스 이름 (락 주인 표시용)
+# 서버가 여러 개면 (공유 조정 백엔드) 원장은 Ledger 시트가 기준, 서버마다 들고 있는 원장과 Users 시트 B열은 캐시
+#   - 가입할 때 Users 행 번호를 짐작하지 않음 (다른 서버도 같은 행을 짐작함) -> 다음 스냅샷에서 받음
+#   - 스냅샷에서 처음 본 유저는 임시 계좌 (시트에 OPENING 을 안 씀, 원장을 다시 읽을 때 시트 기록으로 대체)
+MULTI_SERVER = get_coordinator().backend != "local"
+
+# 구글 API 할당량 관리 (토큰 버킷). secrets.toml 의 [quota] 로 조정
+#   read_per_minute = 60, write_per_minute = 60, bets_per_minute = 6
+@st.cache_resource
+def get_quota_governor():
+    try:
+        conf = dict(st.secrets.get("quota", {}))
+    except Exception:
+        conf = {}
+    return QuotaGovernor(
+        read_per_minute=conf.get("read_per_minute", 60),
+        write_per_minute=conf.get("write_per_minute", 60),
+        bets_per_minute=conf.get("bets_per_minute", 6),
+        coordinator=get_coordinator(), # 서버가 여러 개여도 할당량은 전체 기준
+    )
 
-# 이제 연결 객체를 캐시에서 꺼내 씁니다. (API 호출 0회)
-try:
-    ws_users, ws_matches, ws_bets, ws_teams = get_google_sheets()
-except Exception as e:
-    st.error(f"⚠️ 구글 시트 연결 오류: {e}")
-    st.stop()
+# 이 함수는 앱이 실행되는 동안 딱 1번만 실행됩니다. (새로고침 해도 실행 안 됨)
+# API 호출 계측 (시트 / 메서드 / 호출 함수별 호출 수, 지연, 429) + 재실행 시간
+# secrets.toml 의 [metrics] textfile = "/var/lib/node_exporter/ddc.prom" 이면 주기적으로 내보냄
+@st.cache_resource
+def get_metrics():
+    return Metrics()
 
+def get_metrics_config():
+    try:
+        return dict(st.secrets.get("metrics", {}))
+    except Exception:
+        return {}
+
+def open_storage():
+    conf = get_storage_config()
+    backend = conf.get("backend", "gsheets")
+    sqlite_path = conf.get("sqlite_path", "ddc.sqlite3")
+    
+    if backend == "sqlite":
+        # 구글 API 없이 로컬 SQLite 만 사용 (오프라인/테스트용)
+        return SQLiteStorage(sqlite_path)
+    
+    # 구글 시트 호출은 전부 할당량 버킷을 거침 (SQLite 미러는 제한 없음)
+    # 계측은 버킷 안쪽: 버킷 대기 시간은 빼고 실제 API 호출만 잼
+    sheets = GovernedStorage(
+        InstrumentedStorage(GoogleSheetsStorage(open_spreadsheet()), get_metrics()), get_quota_governor()
+    )
+    if backend == "mirror":
+        # 쓰기는 시트+SQLite 둘 다, find/cell 조회는 SQLite 에서 바로
+        storage = WriteThroughStorage(sheets, SQLiteStorage(sqlite_path))
+        storage.bootstrap()
+        return storage
+    return sheets
+
+# 저장소 + 워크시트(처럼 쓰는 테이블) 객체. ledger 는 Ledger 시트 (없으면 None)
+Connection = namedtuple("Connection", "storage users matches bets teams ledger")
+
+def connect():
+    """시트 인증 / 워크시트 찾기 / 원장 읽기 (백그라운드 스레드에서 호출되므로 st.* 사용 X)"""
+    storage = open_storage()
+    conn = Connection(storage, *storage.tables(), storage.table("Ledger"))
+    records = conn.ledger.get_all_records() if conn.ledger else []
+    opening_balances = {}
+    for u in conn.users.get_all_records():
+        opening_balances.setdefault(str(u['nickname']), u['balance'])
+    # 시트 기록으로 원장을 다시 맞춤. 원장 기록이 없는 유저는 지금 Users 잔액에서 시작
+    opening = get_ledger().reload(records, opening_balances)
+    if conn.ledger:
+        for entry in opening:
+            get_write_queue().append_row(conn.ledger, entry.row())
+    return conn
 
-# --- [2] 헬퍼 함수: API 호출 없이 행 번호 찾기 (핵심!) ---
+# 이 함수는 앱이 실행되는 동안 딱 1번만 실행됩니다. (새로고침 해도 실행 안 됨)
+# 재시작 직후 첫 화면은 디스크 스냅샷으로 바로 그리고, 시트 연결은 백그라운드에서 (성공할 때까지 재시도)
+@st.cache_resource
+def get_backend():
+    return BackgroundTask(connect, name="storage-connect").start()
 
-def get_row_index(dataframe, column_name, value):
-    """
-    구글 시트에 'find'를 요청하지 않고, 
-    이미 받아온 데이터프레임에서 몇 번째 줄인지 계산함.
-    (헤더가 1행이므로, 인덱스+2가 실제 시트 행 번호)
-    """
-    try:
-        # 데이터프레임에서 해당 값의 인덱스 찾기
-        idx = dataframe[dataframe[column_name].astype(str) == str(value)].index[0]
-        return idx + 2 # 0-based index + 1(헤더) + 1(행번호보정)
-    except:
-        return None
+def get_connection(timeout=60):
+    """연결될 때까지 기다렸다가 Connection (쓰기 / 정산 / 동기화용, 화면 첫 렌더링에서는 쓰지 않음)"""
+    return get_backend().wait(timeout)
 
-# --- [3] 핵심 로직 ---
+# 쓰기 지연 큐: 베팅/가입/경기등록 쓰기를 모아서 1초마다 (또는 200건마다) 한 번에 전송
+# 끝내 못 보낸 쓰기는 버리지 않고 write_deadletter.jsonl 에 남김 (관리자 화면에 건수 표시)
+@st.cache_resource
+def get_write_queue():
+    wq = WriteBehindQueue(max_batch=200, max_delay=1.0, dead_letters=DeadLetters("write_deadletter.jsonl"))
+    atexit.register(wq.close, 10) # 서버 종료 시 남은 쓰기 모두 전송
+    return wq
+
+write_queue = get_write_queue()
 
-def create_new_user(nickname):
-    ws_users.append_row([nickname, 3000])
-    return {'nickname': nickname, 'balance': 3000}
+# --- [2] 헬퍼: API 호출 없이 행 번호 찾기 (핵심!) ---
+# 행 번호/잔액/내 베팅은 스냅샷마다 한 번 만들어 두는 해시 인덱스(snapshot.index)에서 O(1)로 찾음
+#   index.user_row(nick) -> 시트 행, index.user_bets(nick) -> {match_id: 베팅}
+# 잔액은 원장(ledger)이 기준: ledger.balance(nick)
 
-# 잔액 업데이트 (읽기 없이 바로 쓰기)
-def update_balance_optimized(nickname, amount, user_df):
-    row_idx = get_row_index(user_df, 'nickname', nickname)
+# 쓰기 큐에 못 넣었을 때 (큐가 가득 참 / 아직 연결 전) -> 원장은 되돌리고 화면에 다시 시도 안내
+SAVE_ERRORS = (queue.Full, TimeoutError)
+
+def persist_ledger_entry(entry, balance, also=()):
+    """
+    원장 기록을 시트에 저장 (쓰기 큐). Users 시트 B열은 원장 잔액을 보여주는 캐시.
+    also: 같이 나가야 하는 쓰기 (베팅 행 / 가입 행). 전부 큐에 들어가거나 하나도 안 들어감.
+    유저 락 안에서 불리므로 연결을 기다리지 않음 (연결 전이면 바로 TimeoutError).
+    """
+    conn = get_connection(timeout=0)
+    writes = list(also)
+    if conn.ledger:
+        writes.insert(0, (conn.ledger, "append", entry.row()))
+    snap = get_snapshot_poller().current(timeout=0)
+    row_idx = snap.index.user_row(entry.nickname) if snap else None
     if row_idx:
-        # 현재 잔액 계산 (메모리상에서)
-        current_bal = int(user_df.loc[user_df['nickname'] == nickname, 'balance'].values[0])
-        new_bal = current_bal + amount
-        
-        # 구글 시트에 바로 덮어쓰기 (Read X, Write O)
-        # B열(2번째 열) 업데이트
-        ws_users.update_cell(row_idx, 2, new_bal)
-        return new_bal
-    return None
+        writes.append((conn.users, "update", (row_idx, 2, balance)))
+    write_queue.put_many(writes)
+    if row_idx:
+        snap.index.set_balance(entry.nickname, balance)
 
-# 베팅 실행
-def place_bet_optimized(nickname, match_id, choice, amount, user_df):
-    # 1. 잔액 차감 (최적화 버전)
-    new_bal = update_balance_optimized(nickname, -amount, user_df)
-    
-    # 2. 베팅 내역 기록 (Write only)
-    ws_bets.append_row([
-        nickname, match_id, choice, amount, str(datetime.now())
-    ])
-    return new_bal
-
-def calculate_auto_odds(home_elo, away_elo):
-    diff = home_elo - away_elo
-    prob_home = 1 / (1 + 10 ** (-diff / 400))
-    prob_draw = 0.30 * (1 - abs(prob_home - 0.5) * 2)
-    real_prob_home = prob_home * (1 - prob_draw)
-    real_prob_away = (1 - prob_home) * (1 - prob_draw)
-    
-    MAX_ODDS = 5.0
-    odds_home = min(MAX_ODDS, max(1.05, round(1 / real_prob_home, 2)))
-    odds_draw = min(MAX_ODDS, max(1.05, round(1 / prob_draw, 2)))
-    odds_away = min(MAX_ODDS, max(1.05, round(1 / real_prob_away, 2)))
-    return odds_home, odds_draw, odds_away
-
-def update_team_elo_advanced(home_team, away_team, result, h_xg, a_xg, h_pass, a_pass, h_ppda, a_ppda):
-    # (기존 로직 유지)
-    K = 32
-    try:
-        # 여기서는 어쩔 수 없이 find를 쓰지만, 관리자만 쓰는 기능이라 괜찮음
-        cell_h = ws_teams.find(home_team)
-        cell_a = ws_teams.find(away_team)
-        elo_h = int(ws_teams.cell(cell_h.row, 2).value)
-        elo_a = int(ws_teams.cell(cell_a.row, 2).value)
-        
-        diff = elo_h - elo_a
-        expected_h = 1 / (1 + 10 ** (-diff / 400))
-        expected_a = 1 - expected_h
-        
-        if result == 'HOME': actual_h, actual_a = 1, 0
-        elif result == 'DRAW': actual_h, actual_a = 0.5, 0.5
-        else: actual_h, actual_a = 0, 1
-        
-        base_change_h = K * (actual_h - expected_h)
-        
-        W_XG, W_PPDA, W_PASS = 10.0, 1.0, 0.1
-        performance_bonus = ((h_xg - a_xg) * W_XG) + ((h_pass - a_pass) * W_PASS) + ((a_ppda - h_ppda) * W_PPDA)
-        
-        total_change = base_change_h + performance_bonus
-        new_elo_h = round(elo_h + total_change)
-        new_elo_a = round(elo_a - total_change)
-        
-        ws_teams.update_cell(cell_h.row, 2, new_elo_h)
-        ws_teams.update_cell(cell_a.row, 2, new_elo_a)
-        st.toast(f"📊 {home_team} {new_elo_h}({int(total_change):+})")
-    except:
-        pass
+# 랭킹표: 원장 잔액이 바뀔 때마다 그 유저 한 명만 자리 이동 (매 화면 정렬 X)
+@st.cache_resource
+def get_leaderboard():
+    return Leaderboard()
 
-def run_admin_settlement():
-    # 정산은 관리자만 하므로 API 호출 좀 해도 됨
-    st.info("정산 시작...")
-    matches = pd.DataFrame(ws_matches.get_all_records())
-    bets = pd.DataFrame(ws_bets.get_all_records())
-    
-    # 유저 데이터 미리 로딩 (row index 찾기용)
-    users_df = pd.DataFrame(ws_users.get_all_records())
-    
-    if 'is_settled' not in matches.columns:
-        st.error("'is_settled' 헤더 없음")
-        return
+@st.cache_resource
+def get_ledger():
+    ledger = Ledger(persist=persist_ledger_entry, on_change=get_leaderboard().set)
+    # 시트를 읽기 전에는 디스크 스냅샷의 Users 잔액으로 임시 계좌 (연결되면 connect() 가 시트 기록으로 바꿈)
+    snap = get_snapshot_poller().current(timeout=0)
+    if snap is not None and not snap.users.empty:
+        balances = pd.to_numeric(snap.users['balance'], errors='coerce').fillna(0)
+        for nick, balance in zip(snap.users['nickname'].astype(str), balances):
+            ledger.open_account(nick, balance, provisional=True)
+    return ledger
 
-    matches['is_settled'] = matches['is_settled'].astype(str)
-    targets = matches[(matches['status'] == 'FINISHED') & (matches['is_settled'] != 'TRUE')]
+# --- [3] 핵심 로직 ---
 
-    if targets.empty:
-        st.warning("정산할 경기 없음")
+# 가입 행 번호 짐작: 큐에 넣는 순서 = 시트에 붙는 순서라서, 넣기 + 행 등록을 한 번에
+@st.cache_resource
+def get_signup_lock():
+    return threading.Lock()
+
+def create_new_user(nickname, index):
+    conn = get_connection(timeout=0)
+    with get_signup_lock(), ledger.lock(nickname):
+        entry = ledger.post(nickname, 3000, "SIGNUP", key=f"signup:{nickname}", persist=False)
+        if entry is not None:
+            try:
+                # 가입 행 + 원장 기록을 같이 (하나라도 못 넣으면 원장도 되돌림)
+                persist_ledger_entry(entry, 3000, also=[(conn.users, "append", [nickname, 3000])])
+            except Exception:
+                ledger.revert(entry)
+                raise
+        # 큐에 넣은 순서대로 맨 아래 행에 붙으므로 행 번호를 바로 인덱스에 등록 (서버 1개일 때만)
+        row = index.add_user(nickname, 3000, reserve=not MULTI_SERVER)
+    return {'nickname': nickname, 'balance': 3000, 'row': row}
+
+# 서버가 여러 개면 유저 한 명의 잔액은 한 번에 한 서버만 씀 (두 서버에서 같은 잔액을 두 번 쓰지 않게).
+# 마지막으로 베팅한 서버가 USER_LEASE 초 동안 그 유저를 잡고, 그 사이 다른 서버는 베팅을 받지 않음.
+# 넘겨받는 서버는 Ledger 시트를 다시 읽고 시작 (이전 서버의 쓰기 큐는 그동안 이미 비워짐)
+USER_LEASE = 600
+
+class UserBusy(Exception):
+    pass
+
+def claim_user(nickname, conn):
+    if not MULTI_SERVER:
+        return
+    coordinator = get_coordinator()
+    if not coordinator.acquire(f"user:{nickname}", SERVER_ID, USER_LEASE):
+        raise UserBusy(nickname)
+    last = coordinator.get(f"user:{nickname}:server")
+    if last == SERVER_ID:
         return
+    if last is not None:
+        # 다른 서버가 이 유저 잔액을 바꿨음 -> 시트 기록으로 맞춘 뒤에 받음 (못 읽으면 다음 베팅에서 다시)
+        try:
+            ledger.reload(conn.ledger.get_all_records() if conn.ledger else [])
+        except Exception as e:
+            raise TimeoutError(f"원장 다시 읽기 실패: {e}") from e
+    coordinator.set(f"user:{nickname}:server", SERVER_ID)
 
-    success_cnt = 0
-    for idx, match in targets.iterrows():
-        mid = match['match_id']
-        res = match['result']
-        
-        # ELO 업데이트
-        if ws_teams:
-            h_xg = float(match.get('h_xg', 0) or 0)
-            a_xg = float(match.get('a_xg', 0) or 0)
-            h_pass = float(match.get('h_pass', 0) or 0)
-            a_pass = float(match.get('a_pass', 0) or 0)
-            h_ppda = float(match.get('h_ppda', 0) or 0)
-            a_ppda = float(match.get('a_ppda', 0) or 0)
-            
-            update_team_elo_advanced(match['home'], match['away'], res, h_xg, a_xg, h_pass, a_pass, h_ppda, a_ppda)
-            
-        # 배당금 지급
-        odds = float(match['home_odds']) if res == 'HOME' else (float(match['draw_odds']) if res == 'DRAW' else float(match['away_odds']))
-        
-        match_bets = bets[bets['match_id'] == mid]
-        for b_idx, bet in match_bets.iterrows():
-            if str(bet['choice']) == str(res):
-                win_amt = int(bet['amount'] * odds)
-                # 여기서도 최적화 함수 사용
-                update_balance_optimized(bet['nickname'], win_amt, users_df)
-                st.success(f" -> {bet['nickname']} +{win_amt}P")
-        
-        # 정산 완료 마킹
+# 베팅 실행
+def place_bet_optimized(nickname, match_id, choice, amount, index):
+    conn = get_connection(timeout=0)
+    claim_user(nickname, conn)
+    record = {'nickname': nickname, 'match_id': match_id, 'choice': choice, 'amount': amount, 'timestamp': str(datetime.now())}
+    with ledger.lock(nickname):
+        # 1. 잔액 확인 + 차감 (유저 락 안에서 한 번에, 실패 시 InsufficientFunds / DuplicateBet)
+        entry = ledger.place_bet(nickname, match_id, amount, persist=False)
+        # 2. 원장 기록 + 베팅 내역을 같이 쓰기 큐에 (못 넣으면 차감도 되돌림 -> 다시 베팅 가능)
         try:
-            # is_settled가 15번째 열이라고 가정 (헤더 순서 중요)
-            row_idx = idx + 2 # 데이터프레임 인덱스 -> 시트 행 번호
-            ws_matches.update_cell(row_idx, 15, 'TRUE') 
-            success_cnt += 1
-        except:
-            pass
-            
-    st.success(f"{success_cnt}경기 정산 완료")
+            persist_ledger_entry(entry, ledger.balance(nickname), also=[(conn.bets, "append", [
+                record['nickname'], record['match_id'], record['choice'], record['amount'], record['timestamp']
+            ])])
+        except Exception:
+            ledger.revert(entry)
+            raise
+    index.add_bet(record)
+    return ledger.balance(nickname), record
+
+# 배당률 계산은 odds.py (calculate_auto_odds: 경기 1개, OddsBook: 전체 팀 조합 배당표)
+
+# 팀 ELO 가 바뀔 때만 (teams_key 가 달라질 때만) 배당표를 새로 계산
+@st.cache_data(max_entries=4)
+def get_odds_book(key):
+    names = [n for n, _ in key]
+    elos = [e for _, e in key]
+    return OddsBook(names, elos)
+
+def new_match_row(nid, h, a, oh, od, oa):
+    # [핵심] 구글 시트 헤더 순서(15개)에 맞춰서 빈칸 채워 넣기
+    # A~O열 순서: id, home, away, odds(3개), status, result, xg(2개), pass(2개), ppda(2개), settled
+    return [
+        nid,                # A: match_id
+        h,                  # B: home
+        a,                  # C: away
+        oh,                 # D: home_odds
+        od,                 # E: draw_odds
+        oa,                 # F: away_odds
+        "WAITING",          # G: status
+        "",                 # H: result
+        "",                 # I: h_xg
+        "",                 # J: a_xg
+        "",                 # K: h_pass
+        "",                 # L: a_pass
+        "",                 # M: h_ppda
+        "",                 # N: a_ppda
+        "FALSE"             # O: is_settled (맨 뒤!)
+    ]
+
+# 정산은 백그라운드 작업 (settlement_job.py): 경기 몇 개씩 나눠서 정산하고 체크포인트 저장
+#   ELO (xG / 패스 / PPDA 보너스 포함) 도 같은 묶음 쓰기로 반영, 실패하면 작업을 멈춤 (조용히 넘어가지 않음)
+# secrets.toml 의 [settlement] checkpoint = "settlement_checkpoint.json", chunk_matches = 10
+@st.cache_resource
+def get_settlement_job():
+    try:
+        conf = dict(st.secrets.get("settlement", {}))
+    except Exception:
+        conf = {}
+    conn = get_connection()
+    job = SettlementJob(
+        conn.storage, get_ledger(), Checkpoint(conf.get("checkpoint", "settlement_checkpoint.json")),
+        # 아직 큐에 남은 베팅/잔액 쓰기를 먼저 반영해야 최신 잔액 기준으로 정산됨
+        flush=lambda: write_queue.flush(timeout=30),
+        chunk_matches=int(conf.get("chunk_matches", 10)),
+        with_elo=conn.teams is not None,
+        coordinator=get_coordinator(), owner=SERVER_ID, # 서버 여러 개 중 하나만 정산
+    )
+    # 서버가 정산 도중 꺼졌었으면 남은 경기부터 자동으로 이어서
+    job.resume_if_interrupted()
+    return job
+
+def run_admin_settlement():
+    # 요청 안에서 기다리지 않고 시작만 (진행 상황은 아래 패널이 주기적으로 확인)
+    if get_settlement_job().start():
+        st.toast("정산 시작...")
+    else:
+        st.warning("이미 정산 중입니다.")
+
+@st.fragment(run_every=2)
+def render_settlement_progress():
+    settlement_job = get_settlement_job()
+    p = settlement_job.progress()
+    status = p.get("status", "idle")
+    # 정산하던 서버가 죽어서 락이 풀렸으면 이 서버가 이어받음
+    if status == "running" and not settlement_job.running:
+        settlement_job.resume_if_interrupted()
+    if status == "idle":
+        return
+    total = p.get("total_matches", 0)
+    done = len(p.get("done_matches", []))
+    st.progress(done / total if total else 1.0, text=f"정산 {done}/{total}경기 · 베팅 {p.get('settled_bets', 0)}/{p.get('total_bets', 0)}건")
+    if status == "running":
+        st.caption(f"작업 {p.get('job_id')} 진행 중... (화면을 닫아도 계속됩니다)")
+    elif status == "failed":
+        st.error(f"정산 중단: {p.get('error')} - 다시 실행하면 남은 경기부터 이어서 합니다")
+    elif status == "done":
+        if total == 0:
+            st.warning("정산할 경기 없음")
+        else:
+            st.success(f"{total}경기 정산 완료 (당첨 {p.get('winners', 0)}건, {p.get('paid', 0):,}P)")
+        if p.get("missing_users"):
+            st.warning(f"유저 시트에 없는 닉네임: {', '.join(p['missing_users'])}")
+    for home_team, new_elo_h, total_change in p.get("elo_changes", [])[-10:]:
+        st.caption(f"📊 {home_team} {new_elo_h}({int(total_change):+})")
+    # 작업이 끝나면 한 번만 스냅샷 갱신 요청
+    if status in ("done", "failed") and st.session_state.get('settled_job') != (p.get("job_id"), status):
+        st.session_state['settled_job'] = (p.get("job_id"), status)
+        poller.refresh_now()
 
 # =========================================================
-# [NEW] 베팅 트래픽 제어기 (1분에 50명 제한)
+# 베팅 트래픽 제어기: 유저별 토큰 버킷 (분당 bets_per_minute 회)
 # =========================================================
-@st.cache_resource
-def get_bet_traffic():
-    # start_time: 카운트 시작 시간, count: 현재 베팅 성공 횟수
-    return {'start_time': time.time(), 'count': 0}
+governor = get_quota_governor()
 
-def check_traffic_status():
-    traffic = get_bet_traffic()
-    current_time = time.time()
-    
-    # 60초가 지났으면 리셋 (새로운 1분 시작)
-    if current_time - traffic['start_time'] > 60:
-        traffic['start_time'] = current_time
-        traffic['count'] = 0
-        
-    return traffic
+# --- [4] 데이터 로딩 (묶음 읽기 + 시트별 재시도) ---
+
+def get_sync_config():
+    try:
+        return dict(st.secrets.get("sync", {}))
+    except Exception:
+        return {}
 
-def increment_traffic():
-    traffic = get_bet_traffic()
-    traffic['count'] += 1
+# 증분 동기화: Bets 는 새로 붙은 행만, Matches/Users 는 바뀌었을 때만 다시 읽음
+# secrets.toml 의 [sync] mode = "full" 이면 예전처럼 매번 전체를 읽음
+@st.cache_resource
+def get_delta_sync():
+    conn = get_connection()
+    tables = ("Matches", "Bets", "Users") + (("Teams",) if conn.teams else ())
+    return DeltaSync(conn.storage, tables)
 
-# --- [4] 데이터 로딩 (재시도 로직) ---
+def fetch_all_data(mode="delta"):
+    """
+    모든 데이터를 한 번에 가져옴 (백그라운드 스레드에서 호출되므로 st.* 사용 X)
+    시트별 재시도(지수 백오프 + 지터)는 sync.py 에서. 그래도 실패하면 예외 -> 스냅샷은 예전 것 유지
+    """
+    if mode == "full":
+        conn = get_connection()
+        names = ["Matches", "Bets", "Users"] + (["Teams"] if conn.teams else [])
+        records, errors = fetch_tables(conn.storage, names)
+        if errors:
+            raise next(iter(errors.values()))
+        frames = {name: to_frame(name, recs) for name, recs in records.items()}
+    else:
+        frames = get_delta_sync().sync()
+    return frames['Matches'], frames['Bets'], frames['Users'], frames.get('Teams')
 
-def fetch_all_data():
-    """모든 데이터를 한 번에 가져와서 세션에 저장"""
-    for i in range(3): # 3번 시도
-        try:
-            d_matches = pd.DataFrame(ws_matches.get_all_records())
-            d_bets = pd.DataFrame(ws_bets.get_all_records())
-            d_users = pd.DataFrame(ws_users.get_all_records()) # 유저 정보도 미리 가져옴
-            return d_matches, d_bets, d_users
-        except Exception as e:
-            time.sleep(2)
-    st.error("서버 연결 불안정. 잠시 후 새로고침하세요.")
-    st.stop()
+# 모든 세션이 같이 보는 스냅샷 1개 + 주기적으로 갱신하는 백그라운드 스레드 1개
+# secrets.toml 의 [sync] poll_interval (초, 기본 30)
+# [sync] warm_start_dir: 스냅샷을 디스크에 저장해 두는 폴더 (재시작하면 여기서 바로 시작, "" 이면 끔)
+@st.cache_resource
+def get_snapshot_poller():
+    conf = get_sync_config()
+    mode = conf.get("mode", "delta")
+    warm_dir = conf.get("warm_start_dir", "snapshot_cache")
+    store = SnapshotStore(warm_dir) if warm_dir else None
+    # 서버가 여러 개면 담당 서버 1개만 시트를 읽고 나머지는 store 에서 읽음 (warm_start_dir 을 공유 볼륨에)
+    return SnapshotPoller(
+        lambda: fetch_all_data(mode), interval=float(conf.get("poll_interval", 30)), store=store,
+        coordinator=get_coordinator(), owner=SERVER_ID,
+    ).start()
 
 # --- [5] UI 및 앱 실행 ---
 
 if 'nickname' not in st.session_state:
     st.session_state['nickname'] = None
+# 세션별 낙관적 변경분 (스냅샷에 반영되면 자동으로 빠짐)
+if 'pending_bets' not in st.session_state:
+    st.session_state['pending_bets'] = []
+if 'pending_user' not in st.session_state:
+    st.session_state['pending_user'] = None
+if 'session_id' not in st.session_state:
+    st.session_state['session_id'] = f"s{int(time.time() * 1000) % 10**8:08d}"
+
+metrics = get_metrics()
+
+def record_rerun():
+    """이번 재실행에 걸린 시간 기록 (+ 설정돼 있으면 Prometheus textfile 갱신, 최소 15초 간격)"""
+    metrics.record_rerun(st.session_state['session_id'], time.perf_counter() - rerun_started)
+    path = get_metrics_config().get("textfile")
+    if path:
+        try:
+            metrics.write_textfile(path, every=15)
+        except OSError:
+            pass
 
-# 앱 시작 시 데이터 로딩 (딱 1번만)
-if 'db_matches' not in st.session_state:
+# 디스크 스냅샷으로 먼저 시작 -> 원장은 그 Users 잔액으로 임시 계좌 -> 시트 연결은 백그라운드
+poller = get_snapshot_poller()
+ledger = get_ledger()
+leaderboard = get_leaderboard()
+backend = get_backend()
+snapshot = poller.current(timeout=0)
+if snapshot is None:
+    # 서버가 막 켜졌을 때만 첫 로딩을 기다림
     with st.spinner("서버 연결 중..."):
-        m, b, u = fetch_all_data()
-        st.session_state['db_matches'] = m
-        st.session_state['db_bets'] = b
-        st.session_state['db_users'] = u
+        snapshot = poller.current(timeout=60)
+    if snapshot is None:
+        st.error("서버 연결 불안정. 잠시 후 새로고침하세요.")
+        st.stop()
 
 # 새로고침 버튼
 # =========================================================
 # [NEW] 서버 전체 공유 타이머 (Global Timer)
 # =========================================================
-@st.cache_resource
-def get_global_timer():
-    # 모든 유저가 공유하는 딕셔너리 (서버 메모리에 저장됨)
-    # 초기값: 0 (즉, 앱 켜지자마자는 누를 수 있음)
-    return {'last_sync_time': 0}
-
-global_timer = get_global_timer()
+# 마지막 동기화 시각은 조정 백엔드에 (모든 서버 공통)
+coordinator = get_coordinator()
 
 # 쿨타임 설정 (초 단위) - 60초 추천
 COOLDOWN_SECONDS = 60 
 
 # 현재 시간과 마지막 실행 시간 비교
 current_time = time.time()
-time_diff = current_time - global_timer['last_sync_time']
+time_diff = current_time - float(coordinator.get("sync:last") or 0)
 remaining_time = COOLDOWN_SECONDS - time_diff
 
 # --- [UI] 버튼 표시 로직 ---
@@ -272,26 +465,114 @@ if remaining_time > 0:
 else:
     # 2. 쿨타임 끝났을 때: 버튼 활성화
     if st.button("🔄 최신 데이터 동기화 (Click)"):
-        with st.spinner("구글 시트와 통신 중..."):
-            # (1) 글로벌 타이머 갱신 (이제 다른 사람들은 못 누름)
-            global_timer['last_sync_time'] = time.time()
-            
-            # (2) 데이터 가져오기
-            m, b, u = fetch_all_data()
-            st.session_state['db_matches'] = m
-            st.session_state['db_bets'] = b
-            st.session_state['db_users'] = u
-            
-            st.success("동기화 완료!")
-            time.sleep(1) # 메시지 읽을 시간 줌
-            st.rerun()
+        # (1) 글로벌 타이머 갱신 - 동시에 누른 사람(다른 서버 포함) 중 한 명만 성공
+        ok, wait = coordinator.claim("sync:last", COOLDOWN_SECONDS)
+        if not ok:
+            st.warning(f"방금 다른 사용자가 동기화했습니다. ({int(wait)}초 후 가능)")
+        else:
+            # (2) 백그라운드 스레드에 바로 갱신 요청 (기다리지 않음)
+            poller.refresh_now()
+            st.success("동기화 요청 완료! 잠시 후 반영됩니다.")
+
+st.caption(f"데이터 버전 v{snapshot.version} · {datetime.fromtimestamp(snapshot.fetched_at):%H:%M:%S} 기준")
+# 갱신이 실패해도 멈추지 않고 마지막으로 받은 데이터를 보여줌
+if not backend.ready:
+    # 시트 연결 전: 저장된 스냅샷으로 보기 / 로그인만 (가입 / 베팅은 연결 후)
+    st.caption(f"⏳ 서버 연결 중 - 저장된 데이터를 표시 중{f' ({backend.error})' if backend.error else ''}")
+else:
+    stale = list(get_delta_sync().errors) if get_sync_config().get("mode", "delta") != "full" else []
+    if poller.last_error is not None or stale:
+        st.caption(f"⚠️ 최신 데이터 갱신 실패 ({', '.join(stale) or '전체'}) - 마지막 데이터를 표시 중")
+    # 서버가 정산 도중 꺼졌었으면 남은 경기부터 자동으로 이어서
+    get_settlement_job()
+if write_queue.holding:
+    # 할당량 때문에 쓰기 큐가 막혀 있음 -> 그동안 가입 / 베팅은 바로 실패하고 다시 시도하라고 안내
+    st.warning("⏳ 구글 시트 요청이 밀려 저장이 지연되고 있습니다. 가입 / 베팅이 실패하면 잠시 후 다시 시도해 주세요.")
 
 # ---------------------------------------------------------
 
-# 변수 할당
-df_matches = st.session_state['db_matches']
-all_bets_data = st.session_state['db_bets']
-df_users = st.session_state['db_users']
+# 변수 할당 (공유 스냅샷 + 내 세션 변경분)
+df_matches = snapshot.matches
+index = snapshot.index
+# 방금 가입한 유저가 새 스냅샷에 아직 없으면 인덱스에 다시 등록 (가입할 때 받은 행 번호 그대로)
+pending_user = st.session_state['pending_user']
+if pending_user and not index.has_user(pending_user['nickname']):
+    index.add_user(pending_user['nickname'], pending_user['balance'], row=pending_user.get('row'), reserve=not MULTI_SERVER)
+my_bets, still_pending = merge_overlay(snapshot, st.session_state['nickname'], st.session_state['pending_bets'])
+# 잔액은 원장 기준 (내 베팅 차감까지 이미 반영됨). 연결 전이거나 서버가 여러 개면 시트에 안 쓰는 임시 계좌
+if index.has_user(st.session_state['nickname']):
+    try:
+        ledger.open_account(st.session_state['nickname'], index.balance(st.session_state['nickname']),
+                            provisional=MULTI_SERVER or not backend.ready)
+    except SAVE_ERRORS:
+        pass # 못 남긴 OPENING 은 되돌려졌으므로 다음 재실행에서 다시
+
+st.session_state['pending_bets'] = still_pending
+# 내 베팅 {match_id: 베팅} (스냅샷 인덱스 + 방금 한 베팅). 베팅 카드 fragment 가 여기서 찾고 여기에 추가함
+st.session_state['my_bets'] = dict(my_bets)
+
+# --- 부분 렌더링 (st.fragment): 베팅 카드 / 잔액은 자기 영역만 다시 그림 ---
+MIN_BET, MAX_BET = 500, 1000
+
+# 잔액은 서버 메모리 원장에서 바로 읽음 (API 호출 X).
+# 내 베팅 후 잔액은 베팅 카드가 바로 알려주고, 이 칸은 정산 당첨금처럼 밖에서 바뀐 잔액만 가끔 맞춤
+# (세션마다 몇 초씩 돌면 접속자 수만큼 재실행이 쌓이므로 주기를 길게)
+BALANCE_REFRESH = 30
+
+@st.fragment(run_every=BALANCE_REFRESH)
+def render_balance(nickname):
+    st.metric("잔액", f"{int(ledger.balance(nickname)):,} P")
+
+@st.fragment
+def render_bet_card(match, nickname, idx):
+    mid = match['match_id']
+    with st.container(border=True):
+        st.subheader(f"{match['home']} vs {match['away']}")
+        c1, c2, c3 = st.columns(3)
+        c1.metric("승", match['home_odds'])
+        c2.metric("무", match['draw_odds'])
+        c3.metric("패", match['away_odds'])
+        
+        rec = st.session_state['my_bets'].get(str(mid))
+        if rec is not None:
+            st.success(f"참여 완료: {rec['choice']} ({rec['amount']}P)")
+            return
+        st.markdown("---")
+        curr_bal = int(ledger.balance(nickname)) # 없는 유저면 0원 처리
+        if curr_bal < MIN_BET:
+            st.error("잔액 부족")
+            return
+        sel = st.radio("선택", ["HOME", "DRAW", "AWAY"], key=f"s_{mid}_{idx}", horizontal=True)
+        limit = min(MAX_BET, curr_bal)
+        amt = st.number_input(f"금액", MIN_BET, limit, step=100, key=f"m_{mid}_{idx}")
+        
+        if st.button("베팅하기", key=f"b_{mid}_{idx}"):
+            if not get_backend().ready:
+                st.warning("⏳ 서버 연결 중입니다. 잠시 후 다시 시도해 주세요.")
+                return
+            try:
+                governor.check_bet(nickname)
+            except RateLimited as e:
+                st.warning(f"⏳ 요청이 너무 많아요. {math.ceil(e.retry_after)}초 후 다시 시도해 주세요.")
+                return
+            try:
+                _, new_row = place_bet_optimized(nickname, mid, sel, amt, index)
+            except (InsufficientFunds, DuplicateBet) as e:
+                st.error(f"베팅 실패: {e}")
+                return
+            except SAVE_ERRORS:
+                # 잔액은 되돌렸으므로 그대로 다시 누르면 됨
+                st.warning("⏳ 저장 요청이 밀려 있어 베팅을 받지 못했습니다. 잠시 후 다시 시도해 주세요.")
+                return
+            except UserBusy:
+                st.warning(f"다른 창(서버)에서 이 계정으로 베팅 중입니다. 마지막 베팅 후 {USER_LEASE // 60}분 뒤에 여기서 베팅할 수 있어요.")
+                return
+            # 다음 스냅샷에 아직 안 들어왔을 때를 대비해 내 세션 overlay 에도 추가
+            st.session_state['pending_bets'].append(new_row)
+            st.session_state['my_bets'][str(mid)] = new_row
+            # 이 카드만 다시 그림 (전체 스크립트 재실행 X). 사이드바 잔액은 다음 갱신 전까지 toast 로 알려줌
+            st.toast(f"✅ 베팅 완료! 남은 잔액 {int(ledger.balance(nickname)):,} P")
+            st.rerun(scope="fragment")
 
 # 사이드바
 with st.sidebar:
@@ -307,7 +588,7 @@ with st.sidebar:
                     st.warning("닉네임 입력 필수")
                 else:
                     # 로컬 데이터에서 확인 (API 호출 X)
-                    exists = nick in df_users['nickname'].astype(str).values
+                    exists = index.has_user(nick)
                     
                     if mode == "로그인":
                         if exists:
@@ -319,22 +600,22 @@ with st.sidebar:
                     else:
                         if exists:
                             st.error("이미 있음")
+                        elif not backend.ready:
+                            st.warning("⏳ 서버 연결 중입니다. 잠시 후 다시 시도해 주세요.")
                         else:
-                            create_new_user(nick)
+                            try:
+                                st.session_state['pending_user'] = create_new_user(nick, index)
+                            except SAVE_ERRORS:
+                                st.warning("⏳ 저장 요청이 밀려 있어 가입하지 못했습니다. 잠시 후 다시 시도해 주세요.")
+                                st.stop()
                             st.session_state['nickname'] = nick
-                            st.success("가입 완료! (새로고침 해주세요)")
-                            # 가입 시에는 어쩔 수 없이 리로드 유도
+                            st.success("가입 완료!")
+                            st.rerun()
         else:
             # 로그인 상태
             curr_nick = st.session_state['nickname']
-            # 잔액도 로컬 데이터에서 조회
-            try:
-                my_bal = df_users.loc[df_users['nickname']==curr_nick, 'balance'].values[0]
-            except:
-                my_bal = 0
-            
             st.info(f"👤 {curr_nick}님")
-            st.metric("잔액", f"{int(my_bal):,} P")
+            render_balance(curr_nick)
             
             if st.button("로그아웃"):
                 st.session_state.clear()
@@ -343,65 +624,89 @@ with st.sidebar:
     with tab2:
         pw = st.text_input("관리자 비번", type="password")
         if pw == "fineplay1234":
-            if st.button("💰 정산 실행"):
-                run_admin_settlement()
+            if not backend.ready:
+                st.info("⏳ 서버 연결 중 - 정산 / 경기 등록은 연결 후 가능합니다.")
+            else:
+                if st.button("💰 정산 실행", disabled=get_settlement_job().running):
+                    run_admin_settlement()
+                render_settlement_progress()
             
             st.markdown("---")
             st.subheader("경기 등록")
 
             # 경기 등록 UI
-            if ws_teams:
+            conn = backend.result # 연결 전이면 None (위에서 이미 안내)
+            if conn is not None and conn.teams:
                 try:
-                    # 팀 데이터 가져오기
-                    teams = pd.DataFrame(ws_teams.get_all_records())
-                    t_list = teams['team_name'].tolist()
+                    # 팀 데이터는 공유 스냅샷에서, 배당은 미리 계산된 표에서 꺼냄 (API 호출 X)
+                    book = get_odds_book(teams_key(snapshot.teams))
+                    t_list = book.names
                     
                     c1, c2 = st.columns(2)
                     h = c1.selectbox("홈 팀", t_list, key='h')
                     a = c2.selectbox("원정 팀", t_list, index=1, key='a')
                     
                     # 배당률 자동 계산 및 미리보기
-                    h_elo = teams[teams['team_name']==h]['elo'].values[0]
-                    a_elo = teams[teams['team_name']==a]['elo'].values[0]
-                    oh, od, oa = calculate_auto_odds(h_elo, a_elo)
+                    oh, od, oa = book.lookup(h, a)
                     
                     st.info(f"📊 예상 배당: 승 {oh} / 무 {od} / 패 {oa}")
                     
                     # 경기 등록 버튼
                     if st.button("경기 등록"):
                         nid = f"M{int(time.time())}"
-                        
-                        # [핵심] 구글 시트 헤더 순서(15개)에 맞춰서 빈칸 채워 넣기
-                        # A~O열 순서: id, home, away, odds(3개), status, result, xg(2개), pass(2개), ppda(2개), settled
-                        ws_matches.append_row([
-                            nid,                # A: match_id
-                            h,                  # B: home
-                            a,                  # C: away
-                            oh,                 # D: home_odds
-                            od,                 # E: draw_odds
-                            oa,                 # F: away_odds
-                            "WAITING",          # G: status
-                            "",                 # H: result
-                            "",                 # I: h_xg
-                            "",                 # J: a_xg
-                            "",                 # K: h_pass
-                            "",                 # L: a_pass
-                            "",                 # M: h_ppda
-                            "",                 # N: a_ppda
-                            "FALSE"             # O: is_settled (맨 뒤!)
-                        ])
-                        st.success("경기 등록 완료! (새로고침 해주세요)")
+                        write_queue.append_row(conn.matches, new_match_row(nid, h, a, oh, od, oa))
+                        st.success("경기 등록 완료!")
+                        poller.refresh_now()
+                    
+                    # 라운드 일괄 등록: 한 줄에 "홈,원정"
+                    with st.expander("라운드 일괄 등록"):
+                        lines = st.text_area("대진 (한 줄에 홈,원정)", key='round')
+                        pairs = [tuple(x.strip() for x in l.split(',')) for l in lines.splitlines() if ',' in l]
+                        if st.button("일괄 등록") and pairs:
+                            unknown = [t for p in pairs for t in p if t not in book.code]
+                            if unknown:
+                                st.error(f"없는 팀: {', '.join(unknown)}")
+                            else:
+                                base = int(time.time())
+                                for i, ((ph, pa), o) in enumerate(zip(pairs, book.fixture_odds(pairs))):
+                                    write_queue.append_row(conn.matches, new_match_row(f"M{base}_{i}", ph, pa, *o.tolist()))
+                                st.success(f"{len(pairs)}경기 등록 완료!")
+                                poller.refresh_now()
                         
                 except Exception as e:
                     st.error(f"팀 데이터 로딩 또는 등록 중 오류 발생: {e}")
-            else:
+            elif conn is not None:
                 st.error("'Teams' 시트가 연결되지 않았습니다.")
+            
+            # 성능 패널: 어느 코드가 API 할당량 / 화면 시간을 쓰는지
+            st.markdown("---")
+            with st.expander("📈 성능 (API 호출 / 재실행 시간)"):
+                api_rows = metrics.rows()
+                total_calls = sum(r['calls'] for r in api_rows)
+                c1, c2, c3 = st.columns(3)
+                c1.metric("API 호출", f"{total_calls:,}")
+                c2.metric("429", sum(r['429'] for r in api_rows))
+                c3.metric("재실행 p95", f"{int(1000 * metrics.rerun.quantile(0.95))} ms")
+                q = governor.status()
+                st.caption(f"버킷 대기: 읽기 {q['read_wait']:.1f}초 / 쓰기 {q['write_wait']:.1f}초 · 쓰기 큐 {write_queue.pending()}건")
+                failed = len(write_queue.dead_letters)
+                if failed:
+                    st.warning(f"전송 실패로 보관된 쓰기 {failed}건 (write_deadletter.jsonl) - 시트와 비교해서 반영하세요")
+                if api_rows:
+                    st.dataframe(pd.DataFrame(api_rows), use_container_width=True, hide_index=True)
+                sess = metrics.session_rows()
+                if sess:
+                    st.dataframe(pd.DataFrame(sess[:50]), use_container_width=True, hide_index=True)
+                d1, d2 = st.columns(2)
+                d1.download_button("Prometheus 내보내기", metrics.prometheus_text(), "ddc_metrics.prom", "text/plain")
+                d2.download_button("JSON lines 내보내기", metrics.jsonl(), "ddc_metrics.jsonl", "application/json")
 
 # 메인 화면
 st.title("🏆 DDC 캠퍼스 컵")
 
 if not st.session_state['nickname']:
     st.warning("로그인이 필요합니다.")
+    record_rerun()
     st.stop()
 
 tab_bet, tab_rank = st.tabs(["🔥 베팅", "🏆 랭킹"])
@@ -411,69 +716,25 @@ tab_bet, tab_rank = st.tabs(["🔥 베팅", "🏆 랭킹"])
 with tab_bet:
     active = df_matches[df_matches['status'] == 'WAITING'] if not df_matches.empty else pd.DataFrame()
     
-    # ---------------------------------------------------------
-    # [긴급 수정] 베팅 데이터 컬럼 안전장치 (KeyError 방지)
-    # ---------------------------------------------------------
-    required_cols = ['nickname', 'match_id', 'choice', 'amount', 'timestamp']
-    # 만약 'nickname' 컬럼이 없으면? -> 빈 데이터프레임을 새로 만듦
-    if 'nickname' not in all_bets_data.columns:
-        all_bets_data = pd.DataFrame(columns=required_cols)
-    # ---------------------------------------------------------
-
-    # 이제 안전하게 필터링 (에러 안 남!)
-    my_bets = all_bets_data[all_bets_data['nickname'].astype(str) == str(st.session_state['nickname'])]
-    bet_ids = my_bets['match_id'].tolist()
-    
     if active.empty:
         st.info("경기 없음")
     else:
-        MIN, MAX = 500, 1000
         curr_nick = st.session_state['nickname']
-        try:
-            # 유저 잔액 조회 안전장치
-            if 'balance' in df_users.columns:
-                curr_bal = int(df_users.loc[df_users['nickname']==curr_nick, 'balance'].values[0])
-            else:
-                curr_bal = 0 # 컬럼 없으면 0원 처리
-        except:
-            curr_bal = 0
-            
-        # (이 아래 베팅 로직은 기존과 동일)
-        for idx, match in active.iterrows():
-            mid = match['match_id']
-            with st.container(border=True):
-                st.subheader(f"{match['home']} vs {match['away']}")
-                c1, c2, c3 = st.columns(3)
-                c1.metric("승", match['home_odds'])
-                c2.metric("무", match['draw_odds'])
-                c3.metric("패", match['away_odds'])
-                
-                if mid in bet_ids:
-                    rec = my_bets[my_bets['match_id'] == mid].iloc[0]
-                    st.success(f"참여 완료: {rec['choice']} ({rec['amount']}P)")
-                else:
-                    st.markdown("---")
-                    if curr_bal < MIN:
-                        st.error("잔액 부족")
-                    else:
-                        sel = st.radio("선택", ["HOME", "DRAW", "AWAY"], key=f"s_{mid}_{idx}", horizontal=True)
-                        limit = min(MAX, curr_bal)
-                        amt = st.number_input(f"금액", MIN, limit, step=100, key=f"m_{mid}_{idx}")
-                        
-                        if st.button("베팅하기", key=f"b_{mid}_{idx}"):
-                            place_bet_optimized(curr_nick, mid, sel, amt, df_users)
-                            
-                            new_row = {'nickname': curr_nick, 'match_id': mid, 'choice': sel, 'amount': amt, 'timestamp': str(datetime.now())}
-                            # concat 경고 방지를 위해 리스트로 감쌈
-                            st.session_state['db_bets'] = pd.concat([st.session_state['db_bets'], pd.DataFrame([new_row])], ignore_index=True)
-                            
-                            st.session_state['db_users'].loc[st.session_state['db_users']['nickname']==curr_nick, 'balance'] -= amt
-                            
-                            st.success("완료!")
-                            time.sleep(0.5)
-                            st.rerun()
+        # 경기 카드마다 따로 그리는 fragment -> 베팅하면 그 카드만 다시 그림 (경기 수와 무관)
+        for idx, match in enumerate(active.to_dict('records')):
+            render_bet_card(match, curr_nick, idx)
+
 with tab_rank:
-    if not df_users.empty:
-        rank = df_users.sort_values('balance', ascending=False).head(10).reset_index(drop=True)
-        rank.index += 1
-        st.dataframe(rank[['nickname', 'balance']], use_container_width=True)
+    PAGE_SIZE = 10
+    if len(leaderboard):
+        me = leaderboard.rank(st.session_state['nickname'])
+        if me:
+            c1, c2 = st.columns(2)
+            c1.metric("내 순위", f"{me[0]}위 / {me[1]}명")
+            c2.metric("상위", f"{leaderboard.percentile(st.session_state['nickname']):.1f}%")
+        pages = max(1, math.ceil(len(leaderboard) / PAGE_SIZE))
+        page = st.number_input("페이지", 1, pages, 1, key='rank_page') if pages > 1 else 1
+        rank = pd.DataFrame(leaderboard.page((page - 1) * PAGE_SIZE, PAGE_SIZE), columns=['rank', 'nickname', 'balance'])
+        st.dataframe(rank.set_index('rank'), use_container_width=True)
+
+record_rerun()
@@ -0,0 +1,274 @@
+"""
+벤치마크 (구글 시트 없이 가짜 시트로).
+
+    python bench.py --users 5000 --matches 300 --bets 50000 --latency 0.05
+    python bench.py --scenario bet --read-quota 60 --write-quota 60 --window 5
+
+가짜 시트(fakesheet.py)에 가상 대회 데이터를 채워 넣고, 시나리오마다
+걸린 시간 / API 호출 수 (429 포함) / 최대 메모리(tracemalloc) 를 잰다.
+tracemalloc 이 켜져 있으면 파이썬 코드가 느려지므로 시간만 비교할 때는 --no-memory.
+legacy 시나리오는 예전 app.py 의 방식을 그대로 흉내 낸 것: Users 를 get_all_records 로 한 번 받아 둔 DataFrame 에서
+찾고 (로그인은 API 호출 X), 베팅은 건마다 update_cell + append_row 를 바로 보냄.
+"""
+import argparse
+import json
+import random
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from fakesheet import FakeSpreadsheet, QuotaExceeded
+from indexes import SnapshotIndex
+from ledger import Ledger, InsufficientFunds, DuplicateBet
+from odds import calculate_auto_odds
+from ratings import RatingTable, replay_history
+from settlement import plan_settlement, apply_settlement
+from storage import GoogleSheetsStorage
+from sync import DeltaSync
+from write_queue import WriteBehindQueue
+
+# --- 가상 데이터 ---
+
+def generate(users=1000, teams=20, matches=200, bets=5000, finished=0.5, seed=0):
+    """{시트 이름: [행, ...]} (헤더 제외, 시트 열 순서 그대로)"""
+    rng = random.Random(seed)
+    user_rows = [[f"user{i:05d}", rng.randrange(1000, 5001, 100)] for i in range(users)]
+    team_rows = [[f"Team{i:02d}", rng.randint(1300, 1700)] for i in range(teams)]
+    elo = dict(team_rows)
+
+    match_rows = []
+    n_finished = int(matches * finished)
+    for i in range(matches):
+        h, a = rng.sample(list(elo), 2)
+        oh, od, oa = calculate_auto_odds(elo[h], elo[a])
+        if i < n_finished:
+            stats = [round(rng.uniform(0, 3), 2), round(rng.uniform(0, 3), 2),
+                     rng.randint(60, 95), rng.randint(60, 95),
+                     round(rng.uniform(5, 20), 1), round(rng.uniform(5, 20), 1)]
+            match_rows.append([f"M{i:05d}", h, a, oh, od, oa, "FINISHED",
+                               rng.choice(["HOME", "DRAW", "AWAY"]), *stats, "FALSE"])
+        else:
+            match_rows.append([f"M{i:05d}", h, a, oh, od, oa, "WAITING", "", *[""] * 6, "FALSE"])
+
+    # (유저, 경기) 는 한 번씩만
+    bets = min(bets, users * matches)
+    picked = set()
+    while len(picked) < bets:
+        picked.add((rng.randrange(users), rng.randrange(matches)))
+    start = datetime(2025, 1, 1)
+    bet_rows = [
+        [user_rows[u][0], match_rows[m][0], rng.choice(["HOME", "DRAW", "AWAY"]),
+         rng.randrange(500, 1001, 100), str(start + timedelta(seconds=k))]
+        for k, (u, m) in enumerate(sorted(picked, key=lambda p: rng.random()))
+    ]
+    return {"Users": user_rows, "Teams": team_rows, "Matches": match_rows, "Bets": bet_rows}
+
+
+def make_sheet(data, args):
+    ss = FakeSpreadsheet(latency=args.latency, read_quota=args.read_quota,
+                         write_quota=args.write_quota, window=args.window)
+    ss.load(data)
+    return ss
+
+
+# --- 시나리오: fn(ss, storage, data, args) -> 처리한 작업 수 ---
+
+def _nicknames(data, n, seed=1):
+    rng = random.Random(seed)
+    return [rng.choice(data["Users"])[0] for _ in range(n)]
+
+
+def _users_frame(storage):
+    # 예전 fetch_all_data: Users 전체를 한 번 읽어 DataFrame 으로
+    return pd.DataFrame(storage.table("Users").get_all_records())
+
+
+def login_legacy(ss, storage, data, args):
+    # 예전 로그인: nick in df_users['nickname'].astype(str).values (매번 열 전체를 문자열로 바꿔 훑음)
+    df_users = _users_frame(storage)
+    return sum(nick in df_users["nickname"].astype(str).values for nick in _nicknames(data, args.ops))
+
+
+def login_indexed(ss, storage, data, args):
+    frames = DeltaSync(storage).sync()
+    index = SnapshotIndex.build(frames["Matches"], frames["Bets"], frames["Users"])
+    return sum(index.has_user(nick) for nick in _nicknames(data, args.ops))
+
+
+def _open_bets(data, n, seed=2):
+    """아직 안 한 (유저, 대기 중 경기) 조합 n개."""
+    rng = random.Random(seed)
+    waiting = [m[0] for m in data["Matches"] if m[6] == "WAITING"]
+    taken = {(b[0], b[1]) for b in data["Bets"]}
+    out = set()
+    while len(out) < n and waiting:
+        pair = (rng.choice(data["Users"])[0], rng.choice(waiting))
+        if pair not in taken:
+            out.add(pair)
+    return sorted(out)
+
+
+def bet_legacy(ss, storage, data, args):
+    # 예전 place_bet_optimized: 행 번호 / 잔액은 받아 둔 DataFrame 에서 (get_row_index),
+    # 시트에는 건마다 update_cell + append_row 를 바로 보냄
+    ws_users, ws_bets = storage.table("Users"), storage.table("Bets")
+    df_users = _users_frame(storage)
+    ok = 0
+    for nick, mid in _open_bets(data, args.ops):
+        hit = df_users[df_users["nickname"].astype(str) == str(nick)]
+        if hit.empty:
+            continue
+        row_idx, bal = int(hit.index[0]) + 2, int(hit["balance"].values[0])
+        if bal < 500:
+            continue
+        try:
+            ws_users.update_cell(row_idx, 2, bal - 500)
+            ws_bets.append_row([nick, mid, "HOME", 500, str(datetime.now())])
+            ok += 1
+        except QuotaExceeded:
+            pass
+    return ok
+
+
+def bet_queued(ss, storage, data, args):
+    ws_users, ws_bets = storage.table("Users"), storage.table("Bets")
+    frames = DeltaSync(storage).sync()
+    index = SnapshotIndex.build(frames["Matches"], frames["Bets"], frames["Users"])
+    queue = WriteBehindQueue(max_batch=200, max_delay=args.flush_every)
+
+    def persist(entry, balance):
+        queue.update_cell(ws_users, index.user_row(entry.nickname), 2, balance)
+
+    ledger = Ledger(persist=persist)
+    ledger.reload([], {n: index.balance(n) for n in frames["Users"]["nickname"].astype(str)})
+    ok = 0
+    for nick, mid in _open_bets(data, args.ops):
+        try:
+            ledger.place_bet(nick, mid, 500)
+        except (InsufficientFunds, DuplicateBet):
+            continue
+        queue.append_row(ws_bets, [nick, mid, "HOME", 500, str(datetime.now())])
+        ok += 1
+    queue.close(timeout=120)
+    return ok
+
+
+def sync_full(ss, storage, data, args):
+    # 예전 방식: 갱신할 때마다 시트 3개를 통째로
+    for _ in range(args.syncs):
+        for name in ("Matches", "Bets", "Users"):
+            pd.DataFrame(storage.table(name).get_all_records())
+        _append_bets(ss, data, args.ops // args.syncs)
+    return args.syncs
+
+
+def sync_delta(ss, storage, data, args):
+    ds = DeltaSync(storage)
+    for _ in range(args.syncs):
+        ds.sync()
+        _append_bets(ss, data, args.ops // args.syncs)
+    return args.syncs
+
+
+def _append_bets(ss, data, n):
+    # 다른 유저들이 그 사이 베팅한 것처럼 (API 호출로 세지 않음)
+    ss.load({"Bets": [[b[0], b[1], "DRAW", 500, str(datetime.now())] for b in _open_bets(data, n, seed=n)]})
+    ss.updated_at += 1
+
+
+def settlement(ss, storage, data, args):
+    matches = pd.DataFrame(storage.table("Matches").get_all_records())
+    bets = pd.DataFrame(storage.table("Bets").get_all_records())
+    users = pd.DataFrame(storage.table("Users").get_all_records())
+    ledger = Ledger()
+    ledger.reload([], dict(zip(users["nickname"].astype(str), users["balance"])))
+    plan = plan_settlement(matches, bets, users)
+    apply_settlement(storage, plan, ledger)
+    return len(plan.winners)
+
+
+def elo(ss, storage, data, args):
+    matches = pd.DataFrame(storage.table("Matches").get_all_records())
+    ratings = RatingTable.load(storage.table("Teams"))
+    done = matches[matches["status"] == "FINISHED"]
+    ratings.apply_matches(done)
+    ratings.flush(storage)
+    replay_history(matches, k=[16, 24, 32, 40])
+    return len(done)
+
+
+SCENARIOS = {
+    "login": [("legacy", login_legacy), ("indexed", login_indexed)],
+    "bet": [("legacy", bet_legacy), ("queued", bet_queued)],
+    "sync": [("full", sync_full), ("delta", sync_delta)],
+    "settlement": [("vectorized", settlement)],
+    "elo": [("table", elo)],
+}
+
+
+def run(name, variant, fn, data, args):
+    ss = make_sheet(data, args)
+    storage = GoogleSheetsStorage(ss)
+    for table in ("Users", "Matches", "Bets", "Teams", "Ledger"):
+        storage.table(table)        # 워크시트 열기는 측정에서 뺌
+    ss.reset_stats()
+
+    if args.memory:
+        tracemalloc.start()
+    t0 = time.perf_counter()
+    error = ""
+    try:
+        done = fn(ss, storage, data, args)
+    except Exception as e:
+        done, error = 0, repr(e)
+    wall = time.perf_counter() - t0
+    peak = 0
+    if args.memory:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return {
+        "scenario": name, "variant": variant, "ops": done,
+        "wall_s": round(wall, 4), "api_calls": ss.api_calls,
+        "reads": ss.stats["read"], "writes": ss.stats["write"], "429": ss.stats["429"],
+        "peak_mb": round(peak / 2 ** 20, 2), "error": error,
+    }
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="가짜 시트 벤치마크")
+    p.add_argument("--scenario", choices=sorted(SCENARIOS), action="append")
+    p.add_argument("--users", type=int, default=1000)
+    p.add_argument("--teams", type=int, default=20)
+    p.add_argument("--matches", type=int, default=200)
+    p.add_argument("--bets", type=int, default=5000)
+    p.add_argument("--ops", type=int, default=200, help="로그인/베팅 횟수")
+    p.add_argument("--syncs", type=int, default=10, help="sync 시나리오 갱신 횟수")
+    p.add_argument("--latency", type=float, default=0.05, help="API 호출 1회 지연(초)")
+    p.add_argument("--read-quota", type=int, default=None)
+    p.add_argument("--write-quota", type=int, default=None)
+    p.add_argument("--window", type=float, default=60.0, help="할당량 창 (초)")
+    p.add_argument("--flush-every", type=float, default=0.2, help="쓰기 큐 최대 대기(초)")
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--no-memory", dest="memory", action="store_false",
+                   help="tracemalloc 끄기 (메모리 추적 오버헤드 없이 시간만)")
+    p.add_argument("--json", help="결과를 JSON lines 로 저장할 파일")
+    args = p.parse_args(argv)
+
+    data = generate(args.users, args.teams, args.matches, args.bets, seed=args.seed)
+    rows = []
+    for name in args.scenario or SCENARIOS:
+        for variant, fn in SCENARIOS[name]:
+            rows.append(run(name, variant, fn, data, args))
+
+    print(pd.DataFrame(rows).to_string(index=False))
+    if args.json:
+        with open(args.json, "a") as f:
+            for r in rows:
+                f.write(json.dumps(r, ensure_ascii=False) + "\n")
+    return rows
+
+
+if __name__ == "__main__":
+    main()
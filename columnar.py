@@ -0,0 +1,153 @@
+"""
+열 단위 압축 테이블 (스냅샷 메모리 / 필터 속도).
+
+get_all_records 로 만든 DataFrame 은 nickname / match_id / choice / timestamp 가 셀마다 문자열 객체라
+베팅 1건에 수백 바이트를 쓰고, 필터할 때마다 astype(str) 로 문자열을 다시 만들어 비교한다.
+여기서는 열마다 타입을 정해 numpy 배열로 들고 있는다.
+- nickname / match_id: 문자열 사전(Codes) 번호 (int32) -> 유저별 / 경기별 필터는 정수 비교 (str_mask)
+- choice: HOME / DRAW / AWAY = 0 / 1 / 2 (int8)
+- amount: int32, timestamp: datetime64
+DataFrame 으로 내줄 때는 category 열이라 기존 코드 (astype(str), ==, isin, to_dict) 는 그대로 동작한다.
+Bets 는 뒤에 붙기만 하므로 용량을 두 배씩 늘리는 버퍼에 이어 붙인다 (pd.concat 으로 매번 통째로 복사 X).
+"""
+import numpy as np
+import pandas as pd
+
+CODE, ENUM, INT32, DATETIME = "code", "enum", "int32", "datetime"
+DTYPES = {CODE: np.int32, ENUM: np.int8, INT32: np.int32, DATETIME: "datetime64[ns]"}
+
+CHOICES = ("HOME", "DRAW", "AWAY")
+BET_SCHEMA = {"nickname": CODE, "match_id": CODE, "choice": ENUM, "amount": INT32, "timestamp": DATETIME}
+
+# Matches / Users 는 바뀌면 통째로 다시 읽으므로 버퍼 없이 문자열 열만 category 로
+CATEGORY_COLUMNS = {
+    "Matches": ("match_id", "home", "away", "status", "result", "is_settled"),
+    "Users": ("nickname",),
+}
+
+
+class Codes:
+    """문자열 <-> 번호 사전. 처음 본 순서대로 0, 1, 2 ... (한 번 붙은 번호는 안 바뀜)"""
+
+    def __init__(self, values=()):
+        self.values = []
+        self.lookup = {}
+        self._categories = None
+        for v in values:
+            self.code(v)
+
+    def __len__(self):
+        return len(self.values)
+
+    def code(self, value):
+        key = str(value)
+        c = self.lookup.get(key)
+        if c is None:
+            c = self.lookup[key] = len(self.values)
+            self.values.append(key)
+        return c
+
+    def encode(self, values, dtype=np.int32):
+        code = self.code
+        return np.fromiter((code(v) for v in values), dtype=dtype, count=len(values))
+
+    def categories(self):
+        # 값이 늘었을 때만 새로 만듦 (예전 DataFrame 은 예전 Index 를 그대로 들고 있음)
+        if self._categories is None or len(self._categories) != len(self.values):
+            self._categories = pd.Index(self.values)
+        return self._categories
+
+
+class ColumnTable:
+    """뒤에 붙기만 하는 타입 고정 테이블. append 는 평균 O(추가한 행 수)."""
+
+    def __init__(self, schema, presets=None, capacity=1024):
+        self.schema = dict(schema)
+        presets = presets or {}
+        self.codes = {c: Codes(presets.get(c, ())) for c, kind in self.schema.items() if kind in (CODE, ENUM)}
+        self.cols = {c: np.empty(max(capacity, 1), dtype=DTYPES[kind]) for c, kind in self.schema.items()}
+        self.n = 0
+
+    def __len__(self):
+        return self.n
+
+    @property
+    def capacity(self):
+        return len(next(iter(self.cols.values())))
+
+    def _reserve(self, size):
+        cap = self.capacity
+        if size <= cap:
+            return
+        while cap < size:
+            cap *= 2
+        for c, arr in self.cols.items():
+            grown = np.empty(cap, dtype=arr.dtype)
+            grown[:self.n] = arr[:self.n]
+            self.cols[c] = grown
+
+    def _convert(self, col, kind, values):
+        if kind == CODE:
+            return self.codes[col].encode(values, np.int32)
+        if kind == ENUM:
+            return self.codes[col].encode(values, np.int8)
+        raw = pd.Series(values, dtype=object)
+        if kind == INT32:
+            # 빈칸 / 숫자 아닌 값은 0 (정산의 to_numeric(...).fillna(0) 과 같은 규칙)
+            return pd.to_numeric(raw, errors="coerce").fillna(0).to_numpy(dtype=np.int64).astype(np.int32)
+        # str(datetime.now()) 형식. 빈칸 / 못 읽는 값은 NaT
+        return pd.to_datetime(raw.astype(str), errors="coerce", format="ISO8601").to_numpy(dtype="datetime64[ns]")
+
+    def append(self, records):
+        """get_all_records 형식의 [{열: 값}, ...] 를 뒤에 추가. 스키마에 없는 열은 버림."""
+        k = len(records)
+        if not k:
+            return
+        self._reserve(self.n + k)
+        for c, kind in self.schema.items():
+            self.cols[c][self.n:self.n + k] = self._convert(c, kind, [r.get(c, "") for r in records])
+        self.n += k
+
+    def frame(self):
+        """
+        지금까지의 행을 DataFrame 으로. 숫자 열은 버퍼를 복사 없이 잘라서 씀
+        (이미 들어간 행은 다시 쓰지 않고, 버퍼를 늘릴 때는 새 배열이라 예전 DataFrame 은 안전).
+        """
+        data = {}
+        for c in self.schema:
+            arr = self.cols[c][:self.n]
+            data[c] = pd.Categorical.from_codes(arr, self.codes[c].categories()) if c in self.codes else arr
+        return pd.DataFrame(data, copy=False)
+
+
+def bet_table(records=(), capacity=1024):
+    table = ColumnTable(BET_SCHEMA, presets={"choice": CHOICES}, capacity=max(capacity, len(records)))
+    table.append(list(records))
+    return table
+
+
+def compact_frame(name, frame):
+    """Matches / Users 의 문자열 열을 category 로 (숫자 열은 get_all_records 가 준 그대로)."""
+    cols = [c for c in CATEGORY_COLUMNS.get(name, ()) if c in frame.columns]
+    if not cols:
+        return frame
+    return frame.assign(**{c: frame[c].astype(str).astype("category") for c in cols})
+
+
+def to_frame(name, records):
+    """시트 레코드 -> 타입이 정해진 DataFrame (Bets / Matches / Users, 나머지는 그대로)."""
+    if name == "Bets":
+        return bet_table(records).frame()
+    return compact_frame(name, pd.DataFrame(records))
+
+
+def str_mask(series, values):
+    """
+    series.astype(str).isin(values) 와 같은 결과.
+    category 열이면 사전(고유값)만 문자열로 비교하고 행은 번호로 골라서 전체 문자열 변환이 없음.
+    """
+    values = {str(v) for v in values}
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        wanted = np.flatnonzero(series.cat.categories.astype(str).isin(values))
+        return pd.Series(np.isin(series.cat.codes.to_numpy(), wanted), index=series.index)
+    return series.astype(str).isin(values)
@@ -0,0 +1,314 @@
+"""
+여러 프로세스(레플리카)가 같이 쓰는 조정 상태.
+
+st.cache_resource 는 프로세스 안에서만 공유되므로, 서버를 여러 개 띄우면
+동기화 쿨타임 / 호출 제한 버킷 / 스냅샷 버전 / 정산 락이 서버마다 따로 놀게 된다.
+그래서 이 값들을 아래 백엔드 중 하나에 둔다 (모두 같은 메서드).
+
+- LocalCoordinator  : 프로세스 안 메모리 (서버 1개일 때, 기본값)
+- SQLiteCoordinator : 같은 머신(공유 볼륨)의 SQLite 파일, WAL + BEGIN IMMEDIATE 로 원자적 처리
+- RedisCoordinator  : Redis 호환 서버 (redis-py 클라이언트, Lua 스크립트로 원자적 처리)
+
+메서드
+- get / set(ttl) / incr          : 값, 버전 번호
+- claim(key, interval)          : interval 초에 한 번만 성공 (동기화 쿨타임). (성공 여부, 남은 초)
+- acquire / release(name, owner, ttl) : 만료 시간이 있는 락 (정산, 스냅샷 갱신 담당 서버)
+- take(name, rate, capacity, n, max_reserve) : 공유 토큰 버킷. (받았는지, 기다려야 할 초)
+    기다릴 시간이 max_reserve 초 이하면 토큰을 미리 빼 두고(음수 허용) 받은 것으로 침.
+    max_reserve < 0 이면 조회만.
+"""
+import math
+import os
+import socket
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from ratelimit import RateLimited
+
+
+def _bucket_step(tokens, ts, now, rate, capacity, n, max_reserve):
+    """토큰 버킷 1번 계산 (백엔드 공통). (새 토큰 수, 받았는지, 기다릴 초)"""
+    tokens = min(capacity, tokens + max(0.0, now - ts) * rate)
+    wait = max(0.0, (n - tokens) / rate)
+    if max_reserve >= 0 and wait <= max_reserve:
+        return tokens - n, True, wait
+    return tokens, False, wait
+
+
+class LocalCoordinator:
+    backend = "local"
+
+    def __init__(self, clock=time.time):
+        self._clock = clock
+        self._kv = {}               # key -> (값, 만료 시각 또는 None)
+        self._buckets = {}          # name -> (토큰, 시각)
+        self._lock = threading.Lock()
+
+    def _get(self, key, now):
+        value, expires = self._kv.get(key, (None, None))
+        if expires is not None and expires <= now:
+            self._kv.pop(key, None)
+            return None
+        return value
+
+    def get(self, key):
+        with self._lock:
+            return self._get(key, self._clock())
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._kv[key] = (str(value), None if ttl is None else self._clock() + ttl)
+
+    def incr(self, key):
+        with self._lock:
+            value = int(self._get(key, self._clock()) or 0) + 1
+            self._kv[key] = (str(value), None)
+            return value
+
+    def claim(self, key, interval):
+        with self._lock:
+            now = self._clock()
+            last = float(self._get(key, now) or 0)
+            if now - last >= interval:
+                self._kv[key] = (str(now), None)
+                return True, 0.0
+            return False, interval - (now - last)
+
+    def acquire(self, name, owner, ttl):
+        with self._lock:
+            now = self._clock()
+            holder = self._get(f"lock:{name}", now)
+            if holder is not None and holder != owner:
+                return False
+            self._kv[f"lock:{name}"] = (owner, now + ttl)
+            return True
+
+    def release(self, name, owner):
+        with self._lock:
+            if self._get(f"lock:{name}", self._clock()) == owner:
+                self._kv.pop(f"lock:{name}", None)
+
+    def take(self, name, rate, capacity, n=1, max_reserve=0.0):
+        with self._lock:
+            now = self._clock()
+            tokens, ts = self._buckets.get(name, (capacity, now))
+            tokens, granted, wait = _bucket_step(tokens, ts, now, rate, capacity, n, max_reserve)
+            self._buckets[name] = (tokens, now)
+            return granted, wait
+
+
+class SQLiteCoordinator:
+    """같은 파일을 여는 모든 프로세스가 공유. 읽고 쓰는 작업 = 트랜잭션 1개 (BEGIN IMMEDIATE), get 은 그냥 읽기."""
+    backend = "sqlite"
+
+    def __init__(self, path="ddc_coord.sqlite3", clock=time.time, timeout=10.0):
+        self._clock = clock
+        self._lock = threading.RLock()
+        self.conn = sqlite3.connect(path, timeout=timeout, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT, expires REAL)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS buckets (name TEXT PRIMARY KEY, tokens REAL, ts REAL)")
+
+    @contextmanager
+    def _tx(self):
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.conn
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+
+    def _get_tx(self, c, key, now):
+        row = c.execute("SELECT value, expires FROM kv WHERE key = ?", (key,)).fetchone()
+        if row is None or (row[1] is not None and row[1] <= now):
+            return None
+        return row[0]
+
+    def _put_tx(self, c, key, value, expires=None):
+        c.execute("INSERT OR REPLACE INTO kv (key, value, expires) VALUES (?, ?, ?)", (key, str(value), expires))
+
+    def get(self, key):
+        # 읽기 1번은 autocommit 으로 (WAL 이라 쓰는 쪽을 막지도, 기다리지도 않음)
+        with self._lock:
+            return self._get_tx(self.conn, key, self._clock())
+
+    def set(self, key, value, ttl=None):
+        with self._tx() as c:
+            self._put_tx(c, key, value, None if ttl is None else self._clock() + ttl)
+
+    def incr(self, key):
+        with self._tx() as c:
+            value = int(self._get_tx(c, key, self._clock()) or 0) + 1
+            self._put_tx(c, key, value)
+            return value
+
+    def claim(self, key, interval):
+        with self._tx() as c:
+            now = self._clock()
+            last = float(self._get_tx(c, key, now) or 0)
+            if now - last >= interval:
+                self._put_tx(c, key, now)
+                return True, 0.0
+            return False, interval - (now - last)
+
+    def acquire(self, name, owner, ttl):
+        with self._tx() as c:
+            now = self._clock()
+            holder = self._get_tx(c, f"lock:{name}", now)
+            if holder is not None and holder != owner:
+                return False
+            self._put_tx(c, f"lock:{name}", owner, now + ttl)
+            return True
+
+    def release(self, name, owner):
+        with self._tx() as c:
+            c.execute("DELETE FROM kv WHERE key = ? AND value = ?", (f"lock:{name}", owner))
+
+    def take(self, name, rate, capacity, n=1, max_reserve=0.0):
+        with self._tx() as c:
+            now = self._clock()
+            row = c.execute("SELECT tokens, ts FROM buckets WHERE name = ?", (name,)).fetchone()
+            tokens, ts = row if row else (capacity, now)
+            tokens, granted, wait = _bucket_step(tokens, ts, now, rate, capacity, n, max_reserve)
+            c.execute("INSERT OR REPLACE INTO buckets (name, tokens, ts) VALUES (?, ?, ?)", (name, tokens, now))
+            return granted, wait
+
+
+# --- Redis 호환 ---
+# Lua 는 정수만 돌려주므로 소수는 문자열로
+
+_CLAIM = """
+local last = tonumber(redis.call('GET', KEYS[1]) or '0')
+local now, interval = tonumber(ARGV[1]), tonumber(ARGV[2])
+if now - last >= interval then
+  redis.call('SET', KEYS[1], ARGV[1])
+  return {1, '0'}
+end
+return {0, tostring(interval - (now - last))}
+"""
+
+_ACQUIRE = """
+local holder = redis.call('GET', KEYS[1])
+if holder and holder ~= ARGV[1] then return 0 end
+redis.call('SET', KEYS[1], ARGV[1], 'PX', ARGV[2])
+return 1
+"""
+
+_RELEASE = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then redis.call('DEL', KEYS[1]) end
+return 0
+"""
+
+_TAKE = """
+local now, rate, capacity = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local n, max_reserve = tonumber(ARGV[4]), tonumber(ARGV[5])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens, ts = tonumber(state[1]) or capacity, tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local wait = math.max(0, (n - tokens) / rate)
+local granted = 0
+if max_reserve >= 0 and wait <= max_reserve then
+  tokens = tokens - n
+  granted = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(1000 * (capacity / rate + math.max(0, -tokens) / rate)) + 60000)
+return {granted, tostring(wait)}
+"""
+
+
+class RedisCoordinator:
+    backend = "redis"
+
+    def __init__(self, client, prefix="ddc:", clock=time.time):
+        self.r = client             # redis.Redis (또는 같은 메서드를 가진 클라이언트)
+        self.prefix = prefix
+        self._clock = clock
+
+    @classmethod
+    def from_url(cls, url, prefix="ddc:"):
+        import redis    # 선택 의존성: redis 백엔드를 쓸 때만 필요
+        return cls(redis.Redis.from_url(url), prefix)
+
+    def _k(self, key):
+        return self.prefix + key
+
+    @staticmethod
+    def _str(v):
+        return v.decode() if isinstance(v, bytes) else v
+
+    def get(self, key):
+        return self._str(self.r.get(self._k(key)))
+
+    def set(self, key, value, ttl=None):
+        self.r.set(self._k(key), str(value), px=None if ttl is None else int(ttl * 1000))
+
+    def incr(self, key):
+        return int(self.r.incr(self._k(key)))
+
+    def claim(self, key, interval):
+        ok, remaining = self.r.eval(_CLAIM, 1, self._k(key), repr(self._clock()), repr(float(interval)))
+        return bool(ok), float(self._str(remaining))
+
+    def acquire(self, name, owner, ttl):
+        return bool(self.r.eval(_ACQUIRE, 1, self._k(f"lock:{name}"), owner, int(ttl * 1000)))
+
+    def release(self, name, owner):
+        self.r.eval(_RELEASE, 1, self._k(f"lock:{name}"), owner)
+
+    def take(self, name, rate, capacity, n=1, max_reserve=0.0):
+        reserve = -1.0 if max_reserve < 0 else (1e12 if math.isinf(max_reserve) else max_reserve)
+        granted, wait = self.r.eval(_TAKE, 1, self._k(f"bucket:{name}"), repr(self._clock()),
+                                    repr(float(rate)), repr(float(capacity)), repr(float(n)), repr(reserve))
+        return bool(granted), float(self._str(wait))
+
+
+def default_owner():
+    """락 주인 이름: 호스트:프로세스"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def make_coordinator(conf):
+    """secrets.toml 의 [coord] 섹션 -> 백엔드. backend = local | sqlite | redis"""
+    backend = conf.get("backend", "local")
+    if backend == "sqlite":
+        return SQLiteCoordinator(conf.get("path", "ddc_coord.sqlite3"))
+    if backend == "redis":
+        return RedisCoordinator.from_url(conf["url"], conf.get("prefix", "ddc:"))
+    return LocalCoordinator()
+
+
+class SharedBucket:
+    """TokenBucket 과 같은 모양 (take / estimate) 인데 토큰은 조정 백엔드에 있음."""
+
+    def __init__(self, coordinator, key, rate, capacity, name=""):
+        self.coordinator = coordinator
+        self.key = key
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.name = name
+
+    @classmethod
+    def per_minute(cls, coordinator, key, count, burst=None, name=""):
+        return cls(coordinator, key, count / 60.0, burst or count, name)
+
+    def estimate(self, n=1):
+        _, wait = self.coordinator.take(self.key, self.rate, self.capacity, n, max_reserve=-1)
+        return wait
+
+    def take(self, n=1, mode="wait", max_wait=None, sleep=time.sleep):
+        if mode == "reject":
+            reserve = 0.0
+        else:
+            reserve = float("inf") if max_wait is None else max_wait
+        granted, wait = self.coordinator.take(self.key, self.rate, self.capacity, n, max_reserve=reserve)
+        if not granted:
+            raise RateLimited(wait, self.name)
+        if mode == "wait" and wait > 0:
+            sleep(wait)
+        return wait
@@ -0,0 +1,187 @@
+"""
+벤치마크용 가짜 구글 시트 (메모리).
+
+gspread Spreadsheet / Worksheet 중 이 앱이 쓰는 메서드만 같은 모양으로 흉내 낸다.
+- 호출마다 latency 초만큼 쉼 (네트워크 왕복 흉내)
+- 읽기/쓰기 할당량 (window 초당 read_quota / write_quota 회)을 넘으면 429 (QuotaExceeded)
+- 호출 수는 stats 에 메서드별로 셈
+
+GoogleSheetsStorage(FakeSpreadsheet(...)) 처럼 실제 코드에 그대로 끼워서 쓴다.
+"""
+import threading
+import time
+from collections import Counter, deque
+
+from gspread.utils import numericise_all
+
+from storage import TABLE_COLUMNS, Cell, a1_to_rowcol
+
+
+class QuotaExceeded(Exception):
+    """구글 API 429 와 같은 취급 (retry.is_quota_error 가 code 로 알아봄)."""
+    code = 429
+
+
+class WorksheetNotFound(Exception):
+    pass
+
+
+class FakeWorksheet:
+    def __init__(self, spreadsheet, title, header):
+        self.spreadsheet = spreadsheet
+        self.title = title
+        self.rows = [[str(h) for h in header]]     # 1행 = 헤더, 값은 시트처럼 문자열로 보관
+
+    # --- 읽기 ---
+
+    def get_all_records(self):
+        self.spreadsheet._call("read", "get_all_records")
+        header, data = self.rows[0], self.rows[1:]
+        return [dict(zip(header, numericise_all(self._pad(r, len(header)), default_blank=""))) for r in data]
+
+    def row_values(self, row):
+        self.spreadsheet._call("read", "row_values")
+        return list(self.rows[row - 1]) if row <= len(self.rows) else []
+
+    def col_values(self, col):
+        self.spreadsheet._call("read", "col_values")
+        return [r[col - 1] for r in self.rows if len(r) >= col and r[col - 1] != ""]
+
+    def get_values(self, range_name):
+        self.spreadsheet._call("read", "get_values")
+        start = range_name.split(":")[0]
+        row = int("".join(ch for ch in start if ch.isdigit()) or 1)
+        # 범위에 데이터가 없으면 gspread 처럼 [[]]
+        return [list(r) for r in self.rows[row - 1:]] or [[]]
+
+    def find(self, query):
+        # 실제 API 처럼 시트 전체를 훑음
+        self.spreadsheet._call("read", "find")
+        for i, r in enumerate(self.rows):
+            for j, v in enumerate(r):
+                if v == str(query):
+                    return Cell(i + 1, j + 1, v)
+        return None
+
+    def cell(self, row, col):
+        self.spreadsheet._call("read", "cell")
+        return Cell(row, col, self._get(row, col))
+
+    # --- 쓰기 ---
+
+    def append_row(self, values, **kwargs):
+        self.spreadsheet._call("write", "append_row")
+        with self.spreadsheet._lock:
+            self.rows.append([str(v) for v in values])
+
+    def append_rows(self, rows, **kwargs):
+        self.spreadsheet._call("write", "append_rows")
+        with self.spreadsheet._lock:
+            self.rows.extend([str(v) for v in r] for r in rows)
+
+    def update_cell(self, row, col, value):
+        self.spreadsheet._call("write", "update_cell")
+        self._set(row, col, value)
+
+    def batch_update(self, data, **kwargs):
+        self.spreadsheet._call("write", "batch_update")
+        for item in data:
+            self._set_range(item["range"], item["values"])
+
+    # --- 내부 ---
+
+    @staticmethod
+    def _pad(row, n):
+        return list(row) + [""] * (n - len(row))
+
+    def _get(self, row, col):
+        if row > len(self.rows) or col > len(self.rows[row - 1]):
+            return None
+        return self.rows[row - 1][col - 1]
+
+    def _set(self, row, col, value):
+        with self.spreadsheet._lock:
+            while len(self.rows) < row:
+                self.rows.append([])
+            r = self.rows[row - 1]
+            if len(r) < col:
+                r.extend([""] * (col - len(r)))
+            r[col - 1] = str(value)
+
+    def _set_range(self, label, values):
+        row, col = a1_to_rowcol(label.split(":")[0])
+        for i, vals in enumerate(values):
+            for j, v in enumerate(vals):
+                self._set(row + i, col + j, v)
+
+
+class FakeSpreadsheet:
+    def __init__(self, latency=0.0, read_quota=None, write_quota=None, window=60.0, tables=TABLE_COLUMNS):
+        self.latency = latency
+        self.quota = {"read": read_quota, "write": write_quota}
+        self.window = window
+        self.stats = Counter()
+        self._calls = {"read": deque(), "write": deque()}
+        self._lock = threading.RLock()
+        self.updated_at = 0
+        self.sheets = {name: FakeWorksheet(self, name, cols) for name, cols in tables.items()}
+
+    def _call(self, kind, method):
+        """API 호출 1회: 할당량 확인 -> 지연 -> 카운트."""
+        with self._lock:
+            limit = self.quota.get(kind)
+            now = time.monotonic()
+            if limit is not None:
+                calls = self._calls[kind]
+                while calls and now - calls[0] >= self.window:
+                    calls.popleft()
+                if len(calls) >= limit:
+                    self.stats["429"] += 1
+                    raise QuotaExceeded(f"{kind} 할당량 초과 ({limit}/{self.window:g}s)")
+                calls.append(now)
+            self.stats[method] += 1
+            self.stats[kind] += 1
+            if kind == "write":
+                self.updated_at += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def reset_stats(self):
+        with self._lock:
+            self.stats.clear()
+
+    @property
+    def api_calls(self):
+        return self.stats["read"] + self.stats["write"]
+
+    # --- gspread Spreadsheet 과 같은 메서드 ---
+
+    def worksheet(self, name):
+        self._call("read", "worksheet")
+        if name not in self.sheets:
+            raise WorksheetNotFound(name)
+        return self.sheets[name]
+
+    def get_lastUpdateTime(self):
+        # Drive API (시트 할당량과 별개)
+        self.stats["get_lastUpdateTime"] += 1
+        return str(self.updated_at)
+
+    def values_batch_get(self, ranges, params=None):
+        self._call("read", "values_batch_get")
+        out = []
+        for r in ranges:
+            ws = self.sheets[r.split("!")[0].strip("'")]
+            out.append({"range": r, "values": [list(row) for row in ws.rows]})
+        return {"valueRanges": out}
+
+    def values_batch_update(self, body):
+        self._call("write", "values_batch_update")
+        for item in body["data"]:
+            name, label = item["range"].split("!")
+            self.sheets[name.strip("'")]._set_range(label, item["values"])
+
+    def load(self, data):
+        """{시트 이름: [행, ...]} 를 API 호출 없이 채워 넣음 (헤더 제외)."""
+        for name, rows in data.items():
+            self.sheets[name].rows.extend([str(v) for v in r] for r in rows)
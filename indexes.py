@@ -0,0 +1,156 @@
+"""
+스냅샷 인덱스 (해시 조회).
+
+DataFrame 을 매번 astype(str) == ... 로 훑지 않도록, 스냅샷마다 한 번만
+nickname -> (시트 행, 잔액), nickname -> {match_id: 베팅}
+딕셔너리를 만들어 두고 O(1) 로 찾는다.
+Bets 가 뒤에 붙기만 한 새 스냅샷이면 이전 인덱스에 새 행만 추가한다.
+"""
+import threading
+
+BET_FIELDS = ("nickname", "match_id", "choice", "amount", "timestamp")
+
+
+def _to_int(v):
+    try:
+        return int(float(v))
+    except (TypeError, ValueError):
+        return 0
+
+
+class SnapshotIndex:
+    def __init__(self):
+        self.users = {}         # nickname -> [시트 행, 잔액]
+        self.reserved = {}      # add_user 로 행을 잡았지만 아직 Users 시트(스냅샷)에 안 보이는 유저 -> 행
+        self.bets = {}          # nickname -> {match_id: 베팅 dict}
+        self.bet_rows = 0       # 인덱스에 들어간 Bets 행 수
+        self.next_user_row = 2
+        self._frames = (None, None, None)
+        self._lock = threading.Lock()
+
+    # --- 만들기 ---
+
+    @classmethod
+    def build(cls, matches, bets, users, prev=None):
+        """prev 인덱스가 있으면 바뀌지 않은 부분은 그대로 재사용."""
+        idx = cls()
+        _, pb, pu = prev._frames if prev is not None else (None, None, None)
+
+        reuse_users = prev is not None and users is pu
+        reuse_bets = prev is not None and _is_extension(pb, bets, prev.bet_rows)
+        if reuse_users or reuse_bets:
+            # 세션들이 prev 에 add_user / add_bet 하는 중일 수 있으므로 락 안에서 복사
+            with prev._lock:
+                if reuse_users:
+                    idx.users = {k: list(v) for k, v in prev.users.items()}
+                    idx.reserved = dict(prev.reserved)
+                    idx.next_user_row = prev.next_user_row
+                if reuse_bets:
+                    idx.bets = {k: dict(v) for k, v in prev.bets.items()}
+                    idx.bet_rows = prev.bet_rows
+        if not reuse_users:
+            idx._index_users(users)
+            if prev is not None:
+                idx._carry_reserved(prev)
+
+        if reuse_bets:
+            idx._index_bets(bets, start=idx.bet_rows)
+        else:
+            idx._index_bets(bets)
+
+        idx._frames = (matches, bets, users)
+        return idx
+
+    def _index_users(self, users):
+        if "nickname" not in users.columns:
+            return
+        nicks = users["nickname"].astype(str).tolist()
+        bals = users["balance"].tolist() if "balance" in users.columns else [0] * len(nicks)
+        # 같은 닉네임이 여러 줄이면 첫 번째 줄 (get_row_index 와 같은 규칙)
+        for i in range(len(nicks) - 1, -1, -1):
+            self.users[nicks[i]] = [i + 2, _to_int(bals[i])]
+        self.next_user_row = len(nicks) + 2
+
+    def _carry_reserved(self, prev):
+        """
+        새 Users 에 아직 없는 예약 행은 그대로 들고 감 (안 그러면 다음 가입이 같은 행을 또 받음).
+        시트에 나타난 유저는 시트 행 기준으로 바뀌고 예약에서 빠짐.
+        """
+        with prev._lock:
+            pending = {n: r for n, r in prev.reserved.items() if n not in self.users}
+            for nick, row in pending.items():
+                self.users[nick] = [row, prev.users[nick][1] if nick in prev.users else 0]
+            self.reserved = pending
+            if pending:
+                self.next_user_row = max(self.next_user_row, max(pending.values()) + 1)
+
+    def _index_bets(self, bets, start=0):
+        if "nickname" not in bets.columns or len(bets) <= start:
+            self.bet_rows = max(self.bet_rows, len(bets))
+            return
+        tail = bets.iloc[start:]
+        cols = {f: (tail[f].tolist() if f in tail.columns else [""] * len(tail)) for f in BET_FIELDS}
+        for nick, mid, choice, amount, ts in zip(*(cols[f] for f in BET_FIELDS)):
+            rec = {"nickname": nick, "match_id": mid, "choice": choice, "amount": amount, "timestamp": ts}
+            # 한 경기에 베팅은 1번: 먼저 들어온 것 유지
+            self.bets.setdefault(str(nick), {}).setdefault(str(mid), rec)
+        self.bet_rows = len(bets)
+
+    # --- 조회 (O(1)) ---
+
+    def has_user(self, nickname):
+        return str(nickname) in self.users
+
+    def user_row(self, nickname):
+        entry = self.users.get(str(nickname))
+        return entry[0] if entry else None
+
+    def balance(self, nickname, default=0):
+        entry = self.users.get(str(nickname))
+        return entry[1] if entry else default
+
+    def user_bets(self, nickname):
+        """내 베팅 {match_id: 베팅} (읽기 전용으로 쓸 것)"""
+        return self.bets.get(str(nickname), {})
+
+    # --- 증분 갱신 (이 프로세스에서 방금 쓴 내용 반영) ---
+
+    def add_user(self, nickname, balance, row=None, reserve=True):
+        """
+        새 유저를 맨 아래 행으로 추가하고 그 시트 행 번호를 돌려줌.
+        row 가 있으면 (예전 스냅샷에서 이미 받은 행) 그 행으로 다시 등록.
+        reserve=False 면 행 번호를 짐작하지 않음 (None, 다음 스냅샷에서 받음).
+        서버가 여러 개면 다른 서버도 같은 행을 짐작할 수 있으므로 이쪽.
+        """
+        with self._lock:
+            entry = self.users.get(str(nickname))
+            if entry:
+                return entry[0]
+            if row is None and reserve:
+                row = self.next_user_row
+            self.users[str(nickname)] = [None if row is None else int(row), int(balance)]
+            if row is not None:
+                self.reserved[str(nickname)] = int(row)
+                self.next_user_row = max(self.next_user_row, int(row) + 1)
+            return row
+
+    def set_balance(self, nickname, balance):
+        with self._lock:
+            entry = self.users.get(str(nickname))
+            if entry:
+                entry[1] = int(balance)
+
+    def add_bet(self, record):
+        with self._lock:
+            nick, mid = str(record["nickname"]), str(record["match_id"])
+            self.bets.setdefault(nick, {}).setdefault(mid, dict(record))
+
+
+def _is_extension(old, new, old_rows):
+    """new 가 old 뒤에 행만 붙은 DataFrame 인지 (delta sync 결과) 싸게 확인."""
+    if old is None or new is None or old_rows == 0 or len(new) < old_rows:
+        return False
+    if list(old.columns) != list(new.columns):
+        return False
+    last = old_rows - 1
+    return old.iloc[last].equals(new.iloc[last]) and old.iloc[0].equals(new.iloc[0])
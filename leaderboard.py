@@ -0,0 +1,60 @@
+"""
+랭킹표 (정렬 상태를 계속 유지).
+
+잔액이 바뀔 때마다 (-잔액, 닉네임) 정렬 컨테이너(sortedcontainers.SortedList)에서 한 칸만 빼고 다시 끼운다.
+SortedList 는 작은 리스트 여러 개로 나눠 들고 있어서 넣기/빼기/순위 모두 O(log n)
+(파이썬 list + insort 는 찾기만 O(log n) 이고 끼울 때 뒤쪽을 통째로 미는 O(n)).
+매 화면마다 전체 유저를 정렬하지 않고, 상위 K명 / 페이지 / 내 순위를 바로 꺼낼 수 있다.
+같은 잔액이면 같은 순위 (1, 2, 2, 4 ...).
+"""
+import threading
+
+from sortedcontainers import SortedList
+
+
+class Leaderboard:
+    def __init__(self, balances=None):
+        self._keys = SortedList()   # (-잔액, 닉네임) 오름차순 = 잔액 내림차순
+        self._score = {}        # 닉네임 -> 잔액
+        self._lock = threading.Lock()
+        for nick, balance in (balances or {}).items():
+            self.set(nick, balance)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def set(self, nickname, balance):
+        """잔액 변경 반영 (원장 on_change 콜백)."""
+        nickname, balance = str(nickname), int(balance)
+        with self._lock:
+            old = self._score.get(nickname)
+            if old == balance:
+                return
+            if old is not None:
+                self._keys.remove((-old, nickname))
+            self._keys.add((-balance, nickname))
+            self._score[nickname] = balance
+
+    def _rank_of(self, balance):
+        # 나보다 잔액이 많은 사람 수 + 1 ((-b,) 는 (-b, 아무 닉네임) 보다 앞)
+        return self._keys.bisect_left((-balance,)) + 1
+
+    def page(self, start=0, size=10):
+        """start 번째(0부터)부터 size 명. [(순위, 닉네임, 잔액), ...]"""
+        with self._lock:
+            return [(self._rank_of(-neg), nick, -neg) for neg, nick in self._keys[start:start + size]]
+
+    def rank(self, nickname):
+        """(순위, 전체 인원). 없는 유저면 None."""
+        with self._lock:
+            balance = self._score.get(str(nickname))
+            if balance is None:
+                return None
+            return self._rank_of(balance), len(self._keys)
+
+    def percentile(self, nickname):
+        """상위 몇 % 인지 (1등 = 100 / 전체 인원)."""
+        r = self.rank(nickname)
+        if r is None:
+            return None
+        return 100.0 * r[0] / r[1]
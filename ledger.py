@@ -0,0 +1,225 @@
+"""
+잔액 원장 (ledger) + 베팅 엔진.
+
+잔액을 '현재값 덮어쓰기' 대신 입출금 기록(entry)을 계속 쌓고, 잔액은 기록의 합으로 계산한다.
+유저별 락 안에서 잔액 확인 -> 차감 기록까지 한 번에 처리하므로
+동시에 베팅하거나 정산과 겹쳐도 잔액이 덮어써지거나 두 번 빠지지 않는다.
+시트 저장(persist)은 유저 락 안에서 쓰기 큐에 넣기만 하고, 실패하면 (큐가 가득 참 등) 기록을 되돌리고 raise.
+메모리 잔액을 바꾸는 잠깐만 전체 락(_guard)을 잡으므로 한 유저의 저장이 느려도 다른 유저는 안 막힘.
+
+Ledger 시트가 기준이고 이 프로세스의 잔액은 그 사본이다. reload() 로 시트 기록을 다시 읽어 맞추면
+아직 시트에 안 보이는 이 프로세스의 기록은 그대로 다시 더해진다.
+임시 계좌(provisional): 디스크 스냅샷 / 다른 서버에서 가입한 유저처럼 Users 잔액만 아는 경우.
+시트에 쓰지 않고, reload 때 시트에 그 유저 기록이 있으면 버려진다.
+"""
+import threading
+import uuid
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime
+
+class InsufficientFunds(Exception):
+    pass
+
+
+class DuplicateBet(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class LedgerEntry:
+    entry_id: str       # 중복 방지 키 (같은 id 는 한 번만 반영)
+    nickname: str
+    amount: int         # +입금 / -출금
+    kind: str           # OPENING / SIGNUP / BET / PAYOUT / ADJUST
+    ref: str            # match_id 등
+    timestamp: str
+
+    def row(self):
+        return [self.entry_id, self.nickname, self.amount, self.kind, self.ref, self.timestamp]
+
+
+def bet_key(nickname, match_id):
+    return f"bet:{nickname}:{match_id}"
+
+
+def payout_key(nickname, match_id):
+    return f"payout:{match_id}:{nickname}"
+
+
+class Ledger:
+    def __init__(self, persist=None, on_change=None):
+        # persist(entry, 새 잔액): 시트에 기록 (쓰기 큐에 넣기만 해야 함)
+        self.persist = persist
+        # on_change(닉네임, 새 잔액): 잔액이 바뀔 때마다 (랭킹표 갱신 등, 가벼워야 함)
+        self.on_change = on_change
+        self._balances = defaultdict(int)
+        self._keys = set()
+        self._unsynced = {}         # 이 프로세스가 만든 기록 중 시트에서 아직 못 본 것 (entry_id -> 기록)
+        self._provisional = {}      # 닉네임 -> 임시 계좌 OPENING (시트에 안 씀)
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+        # 잔액 / 키를 바꾸는 곳은 모두 이 락 안에서 (reload 가 통째로 바꿔치기 할 때와 겹치지 않게)
+        self._guard = threading.RLock()
+
+    # --- 불러오기 ---
+
+    def reload(self, records, opening_balances=None):
+        """
+        Ledger 시트 기록 전체로 잔액을 다시 계산 (다른 서버가 쓴 기록까지 반영).
+        - 이 프로세스 기록 중 시트에 아직 없는 것은 다시 더함 (쓰기 큐에 있는 베팅 등)
+        - 임시 계좌는 시트에 그 유저 기록이 있으면 버림
+        - opening_balances 중 시트 기록이 전혀 없는 유저는 OPENING 을 만들어 돌려줌 (호출한 쪽이 시트에 저장,
+          처음 불러올 때 Users 잔액에서 원장으로 옮기는 용도)
+        """
+        parsed = [
+            LedgerEntry(
+                str(r["entry_id"]), str(r["nickname"]), int(float(r["amount"] or 0)),
+                str(r["kind"]), str(r["ref"]), str(r["timestamp"]),
+            )
+            for r in records
+        ]
+        opening = []
+        with self._guard:
+            balances, keys = defaultdict(int), set()
+            for e in parsed:
+                if e.entry_id not in keys:
+                    keys.add(e.entry_id)
+                    balances[e.nickname] += e.amount
+            for entry_id, e in list(self._unsynced.items()):
+                if entry_id in keys:
+                    del self._unsynced[entry_id]
+                else:
+                    keys.add(entry_id)
+                    balances[e.nickname] += e.amount
+            for nick, e in list(self._provisional.items()):
+                if nick in balances:
+                    del self._provisional[nick]
+            for nick, balance in (opening_balances or {}).items():
+                nick = str(nick)
+                if nick in balances:
+                    continue
+                self._provisional.pop(nick, None)
+                e = self._entry(nick, int(float(balance or 0)), "OPENING", "", f"opening:{nick}")
+                keys.add(e.entry_id)
+                balances[nick] += e.amount
+                self._unsynced[e.entry_id] = e
+                opening.append(e)
+            for nick, e in self._provisional.items():
+                keys.add(e.entry_id)
+                balances[nick] += e.amount
+            old, self._balances, self._keys = self._balances, balances, keys
+        if self.on_change:
+            for nick in set(old) | set(balances):
+                if nick in balances and old.get(nick) != balances[nick]:
+                    self.on_change(nick, balances[nick])
+        return opening
+
+    def open_account(self, nickname, balance, persist=True, provisional=False):
+        """
+        원장에 없는 유저를 현재 잔액으로 시작 (다른 프로세스에서 가입한 유저 등). 이미 있으면 None.
+        provisional=True 면 임시 계좌 (시트에 안 쓰고, reload 때 시트 기록으로 대체됨).
+        """
+        nickname = str(nickname)
+        with self.lock(nickname):
+            with self._guard:
+                if nickname in self._balances:
+                    return None
+                amount = int(float(balance or 0))
+                if provisional:
+                    entry = self._entry(nickname, amount, "OPENING", "", f"provisional:{nickname}")
+                    self._provisional[nickname] = entry
+                    self._apply(entry, track=False)
+                    return entry
+                entry = self._entry(nickname, amount, "OPENING", "", f"opening:{nickname}")
+                self._apply(entry)
+            if persist:
+                self._persist(entry)
+            return entry
+
+    # --- 조회 ---
+
+    def balance(self, nickname):
+        return self._balances.get(str(nickname), 0)
+
+    def lock(self, nickname):
+        nickname = str(nickname)
+        with self._locks_guard:
+            lock = self._locks.get(nickname)
+            if lock is None:
+                # 정산이 락을 잡은 채로 post 를 부르므로 재진입 가능한 락
+                lock = self._locks[nickname] = threading.RLock()
+            return lock
+
+    # --- 기록 ---
+
+    def post(self, nickname, amount, kind, ref="", key=None, persist=True):
+        """입금/출금 기록 1건. 같은 key 가 이미 있으면 아무것도 안 하고 None."""
+        nickname = str(nickname)
+        with self.lock(nickname):
+            with self._guard:
+                if key is not None and key in self._keys:
+                    return None
+                entry = self._entry(nickname, int(amount), kind, ref, key)
+                self._apply(entry)
+            if persist:
+                self._persist(entry)
+            return entry
+
+    def place_bet(self, nickname, match_id, amount, persist=True):
+        """
+        잔액 확인 + 차감을 유저 락 안에서 한 번에. 실패하면 InsufficientFunds / DuplicateBet.
+        persist=False 면 저장은 호출한 쪽이 (유저 락 안에서, 실패하면 revert).
+        """
+        nickname = str(nickname)
+        key = bet_key(nickname, match_id)
+        with self.lock(nickname):
+            with self._guard:
+                if key in self._keys:
+                    raise DuplicateBet(f"{nickname}: {match_id} 이미 베팅함")
+                if self._balances.get(nickname, 0) < amount:
+                    raise InsufficientFunds(f"{nickname}: 잔액 부족")
+                entry = self._entry(nickname, -int(amount), "BET", str(match_id), key)
+                self._apply(entry)
+            if persist:
+                self._persist(entry)
+            return entry
+
+    def revert(self, entry):
+        """시트 저장에 실패한 기록을 되돌림 (같은 key 로 다시 기록할 수 있게)."""
+        with self.lock(entry.nickname), self._guard:
+            if entry.entry_id not in self._keys:
+                return
+            self._keys.discard(entry.entry_id)
+            self._unsynced.pop(entry.entry_id, None)
+            self._balances[entry.nickname] -= entry.amount
+            if entry.kind == "OPENING":
+                # 계좌 자체를 없던 일로 (다음에 open_account 가 다시 열 수 있게)
+                del self._balances[entry.nickname]
+                self._provisional.pop(entry.nickname, None)
+            if self.on_change:
+                self.on_change(entry.nickname, self._balances.get(entry.nickname, 0))
+
+    def _persist(self, entry):
+        # 유저 락 안, _guard 밖에서 (쓰기 큐가 막혀도 다른 유저는 계속 진행)
+        if self.persist is None:
+            return
+        try:
+            self.persist(entry, self.balance(entry.nickname))
+        except Exception:
+            # 시트에 못 남긴 기록은 메모리에서도 빼서 다시 시도할 수 있게 (안 그러면 잔액만 빠지고 DuplicateBet)
+            self.revert(entry)
+            raise
+
+    def _entry(self, nickname, amount, kind, ref, key):
+        return LedgerEntry(key or uuid.uuid4().hex, nickname, amount, kind, ref, str(datetime.now()))
+
+    def _apply(self, entry, track=True):
+        if entry.entry_id in self._keys:
+            return
+        self._keys.add(entry.entry_id)
+        if track:
+            self._unsynced[entry.entry_id] = entry
+        self._balances[entry.nickname] += entry.amount
+        if self.on_change:
+            self.on_change(entry.nickname, self._balances[entry.nickname])
@@ -0,0 +1,279 @@
+"""
+API 호출 계측 + 화면 재실행 시간.
+
+모든 워크시트 호출을 InstrumentedStorage / InstrumentedTable 로 감싸서
+(시트, 메서드, 호출한 함수) 별로 호출 수 / 지연 히스토그램 / 오류 / 429 를 센다.
+호출한 함수는 스택에서 가장 가까운 app.py 함수 (place_bet_optimized, run_admin_settlement,
+fetch_all_data ...), 없으면 래퍼가 아닌 가장 안쪽 함수.
+쓰기 큐는 넣을 때 호출한 함수를 기억해 두었다가 보낼 때 attributed() 로 그 함수 이름을 씀.
+
+내보내기: prometheus_text() (node_exporter textfile 형식) / jsonl()
+"""
+import json
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from retry import is_quota_error
+from storage import TABLE_NAMES
+
+# 초 단위 (마지막은 +Inf)
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float("inf"))
+
+# 호출한 함수를 찾을 때 건너뛰는 파일 (래퍼 / 재시도 / 스레드 풀)
+_SKIP = {"metrics.py", "ratelimit.py", "storage.py", "retry.py", "write_queue.py", "threading.py", "thread.py"}
+APP_FILE = "app.py"
+
+_local = threading.local()
+
+
+@contextmanager
+def attributed(caller):
+    """이 안에서 나가는 API 호출은 스택 대신 caller 로 기록 (다른 스레드가 대신 보내는 쓰기용)."""
+    prev = getattr(_local, "caller", None)
+    _local.caller = caller
+    try:
+        yield
+    finally:
+        _local.caller = prev
+
+
+def find_caller(depth=1):
+    override = getattr(_local, "caller", None)
+    if override is not None:
+        return override
+    frame = sys._getframe(depth)
+    first = None
+    while frame is not None:
+        fname = os.path.basename(frame.f_code.co_filename)
+        if fname == APP_FILE:
+            return frame.f_code.co_name
+        if first is None and fname not in _SKIP:
+            first = f"{fname[:-3]}.{frame.f_code.co_name}"
+        frame = frame.f_back
+    return first or "?"
+
+
+class Histogram:
+    __slots__ = ("counts", "total", "n")
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.total = 0.0
+        self.n = 0
+
+    def observe(self, seconds):
+        for i, b in enumerate(BUCKETS):
+            if seconds <= b:
+                self.counts[i] += 1
+                break
+        self.total += seconds
+        self.n += 1
+
+    def cumulative(self):
+        out, acc = [], 0
+        for c in self.counts:
+            acc += c
+            out.append(acc)
+        return out
+
+    def quantile(self, q):
+        """버킷 경계 기준 근사값 (초). 마지막 버킷이면 관측 최대 경계."""
+        if not self.n:
+            return 0.0
+        target = q * self.n
+        for b, acc in zip(BUCKETS, self.cumulative()):
+            if acc >= target:
+                return b if b != float("inf") else BUCKETS[-2]
+        return BUCKETS[-2]
+
+
+class _Stat:
+    __slots__ = ("calls", "errors", "quota", "latency")
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.quota = 0
+        self.latency = Histogram()
+
+
+class Metrics:
+    def __init__(self, max_sessions=500):
+        self._api = {}                      # (시트, 메서드, 호출 함수) -> _Stat
+        self.rerun = Histogram()
+        self.sessions = OrderedDict()       # session_id -> (재실행 횟수, 마지막 초, 누적 초)
+        self.max_sessions = max_sessions
+        self.started_at = time.time()
+        self.exported_at = 0.0
+        self._lock = threading.Lock()
+
+    # --- 기록 ---
+
+    def record(self, table, method, caller, seconds, error=None):
+        with self._lock:
+            s = self._api.get((table, method, caller))
+            if s is None:
+                s = self._api[(table, method, caller)] = _Stat()
+            s.calls += 1
+            s.latency.observe(seconds)
+            if error is not None:
+                s.errors += 1
+                if is_quota_error(error):
+                    s.quota += 1
+
+    def timed(self, table, method, fn, *args, **kwargs):
+        caller = find_caller()
+        t0 = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            self.record(table, method, caller, time.perf_counter() - t0, e)
+            raise
+        self.record(table, method, caller, time.perf_counter() - t0)
+        return result
+
+    def record_rerun(self, session_id, seconds):
+        with self._lock:
+            self.rerun.observe(seconds)
+            n, _, total = self.sessions.pop(session_id, (0, 0.0, 0.0))
+            self.sessions[session_id] = (n + 1, seconds, total + seconds)
+            while len(self.sessions) > self.max_sessions:
+                self.sessions.popitem(last=False)
+
+    # --- 조회 / 내보내기 ---
+
+    def rows(self):
+        """관리자 화면 표용. 호출 수 많은 순."""
+        with self._lock:
+            items = list(self._api.items())
+        out = [
+            {
+                "table": t, "method": m, "caller": c, "calls": s.calls,
+                "errors": s.errors, "429": s.quota,
+                "avg_ms": round(1000 * s.latency.total / s.calls, 1),
+                "p95_ms": round(1000 * s.latency.quantile(0.95)),
+            }
+            for (t, m, c), s in items
+        ]
+        return sorted(out, key=lambda r: -r["calls"])
+
+    def session_rows(self):
+        with self._lock:
+            items = list(self.sessions.items())
+        return [
+            {"session": sid, "reruns": n, "last_ms": round(1000 * last), "avg_ms": round(1000 * total / n)}
+            for sid, (n, last, total) in reversed(items)
+        ]
+
+    def prometheus_text(self):
+        lines = [
+            "# HELP ddc_api_calls_total Google Sheets API calls",
+            "# TYPE ddc_api_calls_total counter",
+        ]
+        with self._lock:
+            items = list(self._api.items())
+            rerun = self.rerun
+            rerun_cum, rerun_total, rerun_n = rerun.cumulative(), rerun.total, rerun.n
+
+        def labels(t, m, c, **extra):
+            pairs = {"table": t, "method": m, "caller": c, **extra}
+            return ",".join(f'{k}="{str(v).replace(chr(34), "")}"' for k, v in pairs.items())
+
+        for (t, m, c), s in items:
+            lines.append(f"ddc_api_calls_total{{{labels(t, m, c)}}} {s.calls}")
+        lines += ["# TYPE ddc_api_errors_total counter"]
+        for (t, m, c), s in items:
+            lines.append(f"ddc_api_errors_total{{{labels(t, m, c)}}} {s.errors}")
+        lines += ["# TYPE ddc_api_quota_errors_total counter"]
+        for (t, m, c), s in items:
+            lines.append(f"ddc_api_quota_errors_total{{{labels(t, m, c)}}} {s.quota}")
+        lines += ["# TYPE ddc_api_latency_seconds histogram"]
+        for (t, m, c), s in items:
+            for b, acc in zip(BUCKETS, s.latency.cumulative()):
+                le = "+Inf" if b == float("inf") else f"{b:g}"
+                lines.append(f"ddc_api_latency_seconds_bucket{{{labels(t, m, c, le=le)}}} {acc}")
+            lines.append(f"ddc_api_latency_seconds_sum{{{labels(t, m, c)}}} {s.latency.total:.6f}")
+            lines.append(f"ddc_api_latency_seconds_count{{{labels(t, m, c)}}} {s.latency.n}")
+        lines += ["# TYPE ddc_rerun_seconds histogram"]
+        for b, acc in zip(BUCKETS, rerun_cum):
+            le = "+Inf" if b == float("inf") else f"{b:g}"
+            lines.append(f'ddc_rerun_seconds_bucket{{le="{le}"}} {acc}')
+        lines.append(f"ddc_rerun_seconds_sum {rerun_total:.6f}")
+        lines.append(f"ddc_rerun_seconds_count {rerun_n}")
+        return "\n".join(lines) + "\n"
+
+    def jsonl(self):
+        ts = time.time()
+        out = [json.dumps({"ts": ts, "kind": "api", **r}, ensure_ascii=False) for r in self.rows()]
+        with self._lock:
+            out.append(json.dumps({
+                "ts": ts, "kind": "rerun", "count": self.rerun.n,
+                "avg_ms": round(1000 * self.rerun.total / self.rerun.n, 1) if self.rerun.n else 0,
+                "p95_ms": round(1000 * self.rerun.quantile(0.95)),
+            }))
+        return "\n".join(out) + "\n"
+
+    def write_textfile(self, path, every=0.0):
+        """node_exporter textfile collector 용. 임시 파일에 쓰고 바꿔치기. every 초 안에 또 부르면 건너뜀."""
+        if time.time() - self.exported_at < every:
+            return False
+        self.exported_at = time.time()
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp, path)
+        return True
+
+
+# --- 워크시트 / 저장소 래퍼 ---
+
+class InstrumentedTable:
+    def __init__(self, table, metrics, name):
+        self._table = table
+        self._metrics = metrics
+        self._name = name
+
+    def __getattr__(self, attr):
+        value = getattr(self._table, attr)
+        if not callable(value) or attr.startswith("_"):
+            return value
+
+        def call(*args, **kwargs):
+            return self._metrics.timed(self._name, attr, value, *args, **kwargs)
+        return call
+
+
+class InstrumentedStorage:
+    """table() 이 돌려주는 워크시트와 저장소 단위 호출(batch_update, revisions ...) 모두 계측."""
+
+    STORAGE_METHODS = ("batch_update", "revision", "revisions", "row_count", "records_since", "fetch_many")
+
+    def __init__(self, storage, metrics):
+        self._storage = storage
+        self.metrics = metrics
+        self._tables = {}
+
+    def __getattr__(self, name):
+        value = getattr(self._storage, name)
+        if name not in self.STORAGE_METHODS:
+            return value
+
+        def call(*args, **kwargs):
+            return self.metrics.timed("*", name, value, *args, **kwargs)
+        return call
+
+    def table(self, name):
+        if name not in self._tables:
+            t = self._storage.table(name)
+            self._tables[name] = None if t is None else InstrumentedTable(t, self.metrics, name)
+        return self._tables[name]
+
+    def tables(self):
+        return tuple(self.table(name) for name in TABLE_NAMES)
+
+    def read_fresh(self, name):
+        return self.table(name).get_all_records()
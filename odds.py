@@ -0,0 +1,69 @@
+"""
+ELO -> 배당률.
+
+calculate_auto_odds 는 경기 1개, odds_matrix 는 모든 팀 조합 (N x N x 3) 을 한 번에 계산한다.
+OddsBook 은 팀 목록 + 미리 계산한 배당표라서, 팀을 고를 때는 표에서 꺼내기만 하면 된다.
+"""
+import numpy as np
+
+MAX_ODDS = 5.0
+MIN_ODDS = 1.05
+
+
+def calculate_auto_odds(home_elo, away_elo):
+    diff = home_elo - away_elo
+    prob_home = 1 / (1 + 10 ** (-diff / 400))
+    prob_draw = 0.30 * (1 - abs(prob_home - 0.5) * 2)
+    real_prob_home = prob_home * (1 - prob_draw)
+    real_prob_away = (1 - prob_home) * (1 - prob_draw)
+
+    odds_home = min(MAX_ODDS, max(MIN_ODDS, round(1 / real_prob_home, 2)))
+    odds_draw = min(MAX_ODDS, max(MIN_ODDS, round(1 / prob_draw, 2)))
+    odds_away = min(MAX_ODDS, max(MIN_ODDS, round(1 / real_prob_away, 2)))
+    return odds_home, odds_draw, odds_away
+
+
+def odds_matrix(home_elos, away_elos=None):
+    """
+    calculate_auto_odds 의 벡터 버전 (같은 반올림/상하한 규칙).
+    반환: (홈 팀 수, 원정 팀 수, 3) = [홈 승, 무, 원정 승]
+    """
+    home = np.asarray(home_elos, dtype=float)
+    away = home if away_elos is None else np.asarray(away_elos, dtype=float)
+    diff = home[:, None] - away[None, :]
+    prob_home = 1 / (1 + 10 ** (-diff / 400))
+    prob_draw = 0.30 * (1 - np.abs(prob_home - 0.5) * 2)
+    real = np.stack([prob_home * (1 - prob_draw), prob_draw, (1 - prob_home) * (1 - prob_draw)], axis=-1)
+    with np.errstate(divide="ignore"):
+        odds = np.round(1 / real, 2)
+    return np.clip(odds, MIN_ODDS, MAX_ODDS)
+
+
+def teams_key(teams):
+    """Teams DataFrame -> ((팀 이름, ELO), ...). 배당표 캐시 키 (표를 만들지 않고 가볍게 비교용)."""
+    if teams is None or teams.empty:
+        return ()
+    return tuple(zip(teams["team_name"].astype(str).tolist(), teams["elo"].astype(float).tolist()))
+
+
+class OddsBook:
+    """팀 ELO 가 바뀔 때만 새로 만드는 배당표. key 가 같으면 같은 표."""
+
+    def __init__(self, names, elos):
+        self.names = [str(n) for n in names]
+        self.elos = np.asarray(elos, dtype=float)
+        self.key = tuple(zip(self.names, self.elos.tolist()))
+        self.code = {n: i for i, n in enumerate(self.names)}
+        self.matrix = odds_matrix(self.elos)
+
+    def lookup(self, home, away):
+        o = self.matrix[self.code[str(home)], self.code[str(away)]]
+        return float(o[0]), float(o[1]), float(o[2])
+
+    def fixture_odds(self, pairs):
+        """[(홈, 원정), ...] 한 라운드 배당을 표에서 한 번에 꺼냄. (경기 수, 3)"""
+        if not pairs:
+            return np.zeros((0, 3))
+        h = np.array([self.code[str(p[0])] for p in pairs])
+        a = np.array([self.code[str(p[1])] for p in pairs])
+        return self.matrix[h, a]
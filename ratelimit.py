@@ -0,0 +1,181 @@
+"""
+토큰 버킷 기반 호출 제한 + 구글 시트 API 할당량 관리.
+
+- 전역 버킷 2개: 시트 읽기 / 쓰기 (분당 할당량보다 살짝 낮게)
+- 유저별 버킷: 베팅 연타 방지
+모든 워크시트 호출은 GovernedStorage 를 거쳐 버킷에서 토큰을 받아야 나갈 수 있다.
+
+모드
+- "wait"   : 토큰이 생길 때까지 기다렸다가 실행 (max_wait 넘으면 RateLimited)
+- "queue"  : 토큰을 미리 예약하고 기다려야 할 시간(초)만 돌려줌 (호출한 쪽이 나중에 실행)
+- "reject" : 지금 없으면 바로 RateLimited (retry_after 포함)
+"""
+import threading
+import time
+
+from storage import TABLE_NAMES
+
+
+class RateLimited(Exception):
+    code = 429      # 보내기 전에 멈춘 것이라 다시 보내도 안전 (retry.is_quota_error)
+
+    def __init__(self, retry_after, name=""):
+        self.retry_after = max(0.0, retry_after)
+        self.name = name
+        super().__init__(f"{name} 호출 제한: {self.retry_after:.1f}초 후 다시 시도")
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity, name="", clock=time.monotonic):
+        self.rate = float(rate)             # 초당 채워지는 토큰 수
+        self.capacity = float(capacity)     # 최대 보관 토큰 수 (순간 허용량)
+        self.name = name
+        self._clock = clock
+        self._tokens = float(capacity)
+        self._ts = clock()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def per_minute(cls, count, burst=None, name=""):
+        return cls(count / 60.0, burst or count, name)
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._ts) * self.rate)
+        self._ts = now
+
+    def estimate(self, n=1):
+        """지금 n개를 쓰려면 몇 초 기다려야 하는지 (0 이면 바로 가능)."""
+        with self._lock:
+            self._refill(self._clock())
+            return max(0.0, (n - self._tokens) / self.rate)
+
+    def take(self, n=1, mode="wait", max_wait=None, sleep=time.sleep):
+        with self._lock:
+            self._refill(self._clock())
+            wait = max(0.0, (n - self._tokens) / self.rate)
+            if wait == 0:
+                self._tokens -= n
+                return 0.0
+            if mode == "reject" or (max_wait is not None and wait > max_wait):
+                raise RateLimited(wait, self.name)
+            # 토큰을 미리 빼 두면(음수 허용) 뒤에 온 호출은 그만큼 더 기다리게 되어 순서가 지켜짐
+            self._tokens -= n
+        if mode == "wait":
+            sleep(wait)
+        return wait
+
+
+class QuotaGovernor:
+    """
+    구글 시트 기본 할당량: 사용자(서비스 계정)당 분당 읽기 60 / 쓰기 60.
+    safety 비율만큼만 써서 429 가 나기 전에 멈춘다.
+    """
+
+    def __init__(self, read_per_minute=60, write_per_minute=60, safety=0.9,
+                 bets_per_minute=6, bet_burst=3, max_wait=20.0, coordinator=None):
+        # coordinator (coord.py) 가 있으면 버킷을 여러 서버가 같이 씀 -> 할당량이 서버 수와 상관없이 전체 기준
+        self.coordinator = coordinator
+        self.read = self._bucket("quota:read", read_per_minute * safety, None, "시트 읽기")
+        self.write = self._bucket("quota:write", write_per_minute * safety, None, "시트 쓰기")
+        self.bets_per_minute = bets_per_minute
+        self.bet_burst = bet_burst
+        self.max_wait = max_wait
+        self._users = {}
+        self._lock = threading.Lock()
+
+    def _bucket(self, key, per_minute, burst, name):
+        if self.coordinator is None:
+            return TokenBucket.per_minute(per_minute, burst, name=name)
+        from coord import SharedBucket
+        return SharedBucket.per_minute(self.coordinator, key, per_minute, burst, name=name)
+
+    def user_bucket(self, nickname):
+        with self._lock:
+            bucket = self._users.get(nickname)
+            if bucket is None:
+                bucket = self._bucket(f"bet:{nickname}", self.bets_per_minute, self.bet_burst, "베팅")
+                self._users[nickname] = bucket
+            return bucket
+
+    def acquire(self, kind, n=1, mode="wait"):
+        bucket = self.read if kind == "read" else self.write
+        return bucket.take(n, mode=mode, max_wait=self.max_wait)
+
+    def check_bet(self, nickname):
+        """베팅 1회 허용 여부. 안 되면 RateLimited(retry_after)."""
+        return self.user_bucket(nickname).take(1, mode="reject")
+
+    def status(self):
+        return {"read_wait": self.read.estimate(), "write_wait": self.write.estimate()}
+
+
+# --- 워크시트 호출을 버킷에 통과시키는 래퍼 ---
+
+READ_METHODS = {"get_all_records", "find", "cell", "get_values", "col_values", "row_values", "get"}
+WRITE_METHODS = {"append_row", "append_rows", "update_cell", "batch_update", "update"}
+
+
+class GovernedTable:
+    def __init__(self, table, governor):
+        self._table = table
+        self._governor = governor
+
+    def __getattr__(self, name):
+        attr = getattr(self._table, name)
+        kind = "read" if name in READ_METHODS else "write" if name in WRITE_METHODS else None
+        if kind is None or not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            self._governor.acquire(kind)
+            return attr(*args, **kwargs)
+        return call
+
+
+class GovernedStorage:
+    """Storage 를 감싸서 table() 과 저장소 단위 호출(batch_update 등)도 버킷을 거치게 함."""
+
+    def __init__(self, storage, governor):
+        self._storage = storage
+        self.governor = governor
+        self._tables = {}
+
+    def __getattr__(self, name):
+        return getattr(self._storage, name)
+
+    def table(self, name):
+        if name not in self._tables:
+            t = self._storage.table(name)
+            self._tables[name] = None if t is None else GovernedTable(t, self.governor)
+        return self._tables[name]
+
+    def tables(self):
+        return tuple(self.table(name) for name in TABLE_NAMES)
+
+    def batch_update(self, updates):
+        self.governor.acquire("write")
+        return self._storage.batch_update(updates)
+
+    def revision(self, name):
+        self.governor.acquire("read")
+        return self._storage.revision(name)
+
+    def revisions(self, names):
+        self.governor.acquire("read")
+        return self._storage.revisions(names)
+
+    def row_count(self, name):
+        self.governor.acquire("read")
+        return self._storage.row_count(name)
+
+    def records_since(self, name, start_row):
+        self.governor.acquire("read")
+        return self._storage.records_since(name, start_row)
+
+    def fetch_many(self, names):
+        self.governor.acquire("read")
+        return self._storage.fetch_many(names)
+
+    def read_fresh(self, name):
+        # 워크시트 호출이라 버킷은 GovernedTable 에서
+        return self.table(name).get_all_records()
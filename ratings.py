@@ -0,0 +1,151 @@
+"""
+팀 ELO 레이팅 (메모리 테이블 + 벡터화 재계산).
+
+정산할 때 Teams 를 한 번만 읽어서 메모리에서 경기 순서대로 반영하고,
+바뀐 ELO 는 묶음 쓰기 한 번으로 저장한다.
+replay_history 는 Matches 전체 기록으로 레이팅을 처음부터 다시 계산한다.
+K / 가중치를 배열로 주면 여러 설정을 한 번에 돌려볼 수 있다 (백테스트).
+"""
+import logging
+
+import numpy as np
+import pandas as pd
+
+from storage import rowcol_to_a1
+
+log = logging.getLogger(__name__)
+
+K = 32
+W_XG, W_PPDA, W_PASS = 10.0, 1.0, 0.1
+INITIAL_ELO = 1500
+
+ACTUAL = {"HOME": 1.0, "DRAW": 0.5, "AWAY": 0.0}
+STAT_COLUMNS = ["h_xg", "a_xg", "h_pass", "a_pass", "h_ppda", "a_ppda"]
+
+
+def expected_home(diff):
+    return 1 / (1 + 10 ** (-diff / 400))
+
+
+def performance_bonus(h_xg, a_xg, h_pass, a_pass, h_ppda, a_ppda, w_xg=W_XG, w_pass=W_PASS, w_ppda=W_PPDA):
+    return ((h_xg - a_xg) * w_xg) + ((h_pass - a_pass) * w_pass) + ((a_ppda - h_ppda) * w_ppda)
+
+
+def match_stats(matches):
+    """빈 칸은 0 으로 (float(x or 0) 과 같은 규칙). (N, 6) 배열."""
+    cols = [pd.to_numeric(matches[c], errors="coerce") if c in matches.columns
+            else pd.Series(0.0, index=matches.index) for c in STAT_COLUMNS]
+    return np.column_stack([c.fillna(0).to_numpy(dtype=float) for c in cols]) if len(matches) else np.zeros((0, 6))
+
+
+class RatingTable:
+    def __init__(self, records, elo_col=2):
+        self.elo_col = elo_col
+        self.rows = {}          # team_name -> 시트 행
+        self.elo = {}           # team_name -> ELO
+        for i, r in enumerate(records):
+            name = str(r["team_name"])
+            if name not in self.rows:
+                self.rows[name] = i + 2
+                self.elo[name] = int(float(r["elo"]))
+        self.changed = set()
+
+    @classmethod
+    def load(cls, table):
+        """Teams 시트를 한 번만 읽음 (API 1회)."""
+        return cls.from_records(table.get_all_records())
+
+    @classmethod
+    def from_records(cls, records):
+        elo_col = list(records[0].keys()).index("elo") + 1 if records else 2
+        return cls(records, elo_col)
+
+    def apply(self, home, away, result, h_xg=0, a_xg=0, h_pass=0, a_pass=0, h_ppda=0, a_ppda=0):
+        """경기 1개 결과 반영 (메모리만). (새 홈 ELO, 새 원정 ELO, 변화량) 반환."""
+        if home not in self.elo or away not in self.elo:
+            raise KeyError(f"Teams 시트에 없는 팀: {home if home not in self.elo else away}")
+        if result not in ACTUAL:
+            raise ValueError(f"알 수 없는 결과: {result}")
+        elo_h, elo_a = self.elo[home], self.elo[away]
+        base_change_h = K * (ACTUAL[result] - expected_home(elo_h - elo_a))
+        total_change = base_change_h + performance_bonus(h_xg, a_xg, h_pass, a_pass, h_ppda, a_ppda)
+        self.elo[home] = round(elo_h + total_change)
+        self.elo[away] = round(elo_a - total_change)
+        self.changed.update((home, away))
+        return self.elo[home], self.elo[away], total_change
+
+    def apply_matches(self, matches):
+        """
+        정산 대상 경기들을 시트 순서대로 반영. [(홈, 새 ELO, 변화량), ...]
+        Teams 에 없는 팀 / 이상한 결과인 경기는 ELO 만 건너뜀 (당첨금 지급은 막지 않음).
+        """
+        stats = match_stats(matches)
+        out = []
+        for (home, away, result), s in zip(matches[["home", "away", "result"]].itertuples(index=False), stats):
+            try:
+                new_h, _, change = self.apply(str(home), str(away), str(result), *s)
+            except (KeyError, ValueError) as e:
+                log.warning("ELO 반영 건너뜀 (%s vs %s): %s", home, away, e)
+                continue
+            out.append((home, new_h, change))
+        return out
+
+    def pending_updates(self):
+        return [
+            {"range": rowcol_to_a1(self.rows[name], self.elo_col), "values": [[int(self.elo[name])]]}
+            for name in sorted(self.changed)
+        ]
+
+    def flush(self, storage):
+        """바뀐 ELO 전부를 묶음 쓰기 1번으로 저장."""
+        data = self.pending_updates()
+        if data:
+            storage.batch_update({"Teams": data})
+        self.changed.clear()
+
+
+def replay_history(matches, teams=None, initial=INITIAL_ELO, k=K, w_xg=W_XG, w_pass=W_PASS, w_ppda=W_PPDA):
+    """
+    끝난 경기 전체를 시트 순서대로 다시 계산.
+    k / w_* 는 숫자 또는 같은 길이의 배열 (P 개 설정을 동시에 계산).
+    반환: (팀 이름 목록, 레이팅 배열 (팀 수, P), 설정별 Brier 점수 (P,))
+    """
+    done = matches[(matches["status"] == "FINISHED") & matches["result"].isin(list(ACTUAL))]
+    seen = sorted(set(done["home"].astype(str)) | set(done["away"].astype(str)))
+    names = list(teams or []) + [n for n in seen if n not in set(teams or [])]
+    code = {n: i for i, n in enumerate(names)}
+    h = done["home"].astype(str).map(code).to_numpy()
+    a = done["away"].astype(str).map(code).to_numpy()
+    actual = done["result"].map(ACTUAL).to_numpy(dtype=float)
+
+    k, w_xg, w_pass, w_ppda = np.broadcast_arrays(*(np.atleast_1d(np.asarray(x, dtype=float)) for x in (k, w_xg, w_pass, w_ppda)))
+    s = match_stats(done)
+    # 경기별 보너스를 설정별로 한 번에 계산 (N, P)
+    bonus = (np.outer(s[:, 0] - s[:, 1], w_xg) + np.outer(s[:, 2] - s[:, 3], w_pass)
+             + np.outer(s[:, 5] - s[:, 4], w_ppda))
+
+    # initial: 숫자 하나 또는 {팀: 시작 ELO}
+    start = initial if isinstance(initial, dict) else {}
+    ratings = np.full((len(names), k.size), float(INITIAL_ELO if start else initial))
+    for n, v in start.items():
+        if n in code:
+            ratings[code[n]] = float(v)
+    sq_err = np.zeros(k.size)
+    # 경기끼리는 순서 의존이라 경기 단위로 돌고, 설정(P) 방향은 벡터 연산
+    for i in range(len(h)):
+        rh, ra = ratings[h[i]].copy(), ratings[a[i]].copy()
+        exp = 1 / (1 + 10 ** (-(rh - ra) / 400))
+        change = k * (actual[i] - exp) + bonus[i]
+        ratings[h[i]] = np.round(rh + change)
+        ratings[a[i]] = np.round(ra - change)
+        sq_err += (actual[i] - exp) ** 2
+    brier = sq_err / max(1, len(h))
+    return names, ratings, brier
+
+
+def backtest(matches, k_values, bonus_scales=(1.0,), initial=INITIAL_ELO):
+    """K x 보너스 배율 조합별 Brier 점수 표 (낮을수록 예측이 잘 맞음)."""
+    kk, ss = np.meshgrid(np.asarray(k_values, dtype=float), np.asarray(bonus_scales, dtype=float))
+    kk, ss = kk.ravel(), ss.ravel()
+    _, _, brier = replay_history(matches, initial=initial, k=kk, w_xg=W_XG * ss, w_pass=W_PASS * ss, w_ppda=W_PPDA * ss)
+    return pd.DataFrame({"k": kk, "bonus_scale": ss, "brier": brier}).sort_values("brier", ignore_index=True)
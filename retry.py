@@ -0,0 +1,51 @@
+"""
+구글 API 재시도 도우미 (지수 백오프 + 지터).
+"""
+import random
+import time
+
+
+def status_code(exc):
+    """HTTP 상태 코드 (모르면 None). gspread APIError 는 response.status_code 를 가짐."""
+    code = getattr(exc, "code", None)
+    response = getattr(exc, "response", None)
+    if response is not None:
+        code = getattr(response, "status_code", code)
+    return code if isinstance(code, int) else None
+
+
+def is_quota_error(exc):
+    """429 (분당 할당량 초과) 인지 확인."""
+    return status_code(exc) == 429
+
+
+def is_retryable(exc):
+    """
+    여러 번 보내도 결과가 같은 요청 (셀 덮어쓰기 등) 을 다시 보내도 되는 오류: 429 / 5xx.
+    append 는 5xx 여도 이미 반영됐을 수 있으므로 (다시 보내면 행 중복) is_quota_error 만 다시 보냄.
+    타임아웃 / 연결 끊김은 둘 다 다시 보내지 않음.
+    """
+    code = status_code(exc)
+    return code is not None and (code == 429 or 500 <= code < 600)
+
+
+def backoff_delays(attempts, base=0.5, cap=30.0, jitter=True):
+    """재시도 사이에 쉴 시간 목록. 0.5, 1, 2, 4 ... 초 (full jitter 적용)."""
+    for i in range(attempts):
+        delay = min(cap, base * (2 ** i))
+        yield random.uniform(0, delay) if jitter else delay
+
+
+def call_with_retry(fn, *args, attempts=5, base=0.5, cap=30.0, sleep=time.sleep, retry_on=None, **kwargs):
+    """
+    fn 을 최대 attempts 번 시도. 마지막 실패는 그대로 raise.
+    retry_on(exc) 가 False 인 오류는 바로 raise (한 번만 보내야 하는 쓰기는 retry_on=is_quota_error / is_retryable).
+    """
+    delays = list(backoff_delays(attempts - 1, base, cap))
+    for i in range(attempts):
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            if i == attempts - 1 or (retry_on is not None and not retry_on(e)):
+                raise
+            sleep(delays[i])
@@ -0,0 +1,173 @@
+"""
+정산 엔진 (벡터화).
+
+끝난 경기 전부의 결과/배당을 베팅 내역과 한 번에 조인해서
+유저별 당첨금 합계를 구하고, 잔액과 is_settled 를 한 번의 묶음 쓰기로 반영한다.
+"""
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+
+from columnar import str_mask
+from ledger import payout_key
+from storage import rowcol_to_a1
+
+RESULTS = ["HOME", "DRAW", "AWAY"]
+ODDS_COLUMNS = ["home_odds", "draw_odds", "away_odds"]
+
+
+@dataclass
+class SettlementPlan:
+    targets: pd.DataFrame                 # 이번에 정산할 경기 (sheet_row 포함)
+    winners: pd.DataFrame                 # 당첨된 베팅 (win_amt 포함)
+    payouts: pd.Series                    # nickname -> 당첨금 합계
+    balances: pd.DataFrame                # nickname, sheet_row, old_balance, new_balance
+    settled_col: int                      # Matches 시트에서 is_settled 열 번호 (1부터)
+    missing_users: list = field(default_factory=list)
+
+    @property
+    def empty(self):
+        return self.targets.empty
+
+
+def find_targets(matches):
+    """status == FINISHED 이고 아직 정산 안 된 경기. sheet_row = 시트 행 번호."""
+    m = matches.copy()
+    m["sheet_row"] = m.index + 2 # 0-based index + 1(헤더) + 1(행번호보정)
+    settled = m["is_settled"].astype(str).str.upper()
+    return m[(m["status"] == "FINISHED") & (settled != "TRUE")]
+
+
+def plan_settlement(matches, bets, users):
+    if "is_settled" not in matches.columns:
+        raise KeyError("'is_settled' 헤더 없음")
+    # 헤더 순서 그대로 들어오므로 열 위치로 시트 열 번호를 구함 (15번 하드코딩 X)
+    settled_col = matches.columns.get_loc("is_settled") + 1
+
+    targets = find_targets(matches)
+    no_bets = pd.DataFrame(columns=["nickname", "match_id", "choice", "amount", "win_amt"])
+    empty_bal = pd.DataFrame(columns=["nickname", "sheet_row", "old_balance", "new_balance"])
+    if targets.empty or bets.empty or "match_id" not in bets.columns:
+        return SettlementPlan(targets, no_bets, pd.Series(dtype="int64"), empty_bal, settled_col)
+
+    # 경기별 적중 배당 (결과에 맞는 배당 열 하나만 고름)
+    odds = targets[ODDS_COLUMNS].apply(pd.to_numeric, errors="coerce").to_numpy(dtype=float)
+    res_idx = targets["result"].astype(str).map({r: i for i, r in enumerate(RESULTS)})
+    valid = res_idx.notna().to_numpy()
+    win_odds = np.full(len(targets), np.nan)
+    win_odds[valid] = odds[np.flatnonzero(valid), res_idx[valid].astype(int).to_numpy()]
+
+    keyed = pd.DataFrame({
+        "match_id": targets["match_id"].astype(str).to_numpy(),
+        "result": targets["result"].astype(str).to_numpy(),
+        "odds": win_odds,
+    })
+
+    # 정산할 경기의 베팅만 먼저 고르고 (category 열이면 번호 비교) 그 행들만 문자열로
+    b = bets[str_mask(bets["match_id"], keyed["match_id"])]
+    b = b.assign(match_id=b["match_id"].astype(str))
+    # 같은 (유저, 경기) 베팅이 중복 행으로 들어왔으면 먼저 들어온 것만 (인덱스 / 원장과 같은 규칙)
+    if "nickname" in b.columns:
+        b = b[~b.assign(nickname=b["nickname"].astype(str)).duplicated(["nickname", "match_id"])]
+    joined = b.merge(keyed, on="match_id", how="inner")
+    hit = (joined["choice"].astype(str) == joined["result"]) & joined["odds"].notna()
+    winners = joined[hit].copy()
+    amounts = pd.to_numeric(winners["amount"], errors="coerce").fillna(0).to_numpy(dtype=float)
+    # int(amount * odds) 와 같은 버림
+    winners["win_amt"] = np.trunc(amounts * winners["odds"].to_numpy()).astype("int64")
+    winners["nickname"] = winners["nickname"].astype(str)
+
+    payouts = winners.groupby("nickname")["win_amt"].sum()
+    payouts = payouts[payouts != 0]
+
+    u = users.assign(nickname=users["nickname"].astype(str), sheet_row=users.index + 2)
+    u = u.drop_duplicates("nickname")
+    u = u[u["nickname"].isin(payouts.index)]
+    old = pd.to_numeric(u["balance"], errors="coerce").fillna(0).astype("int64").to_numpy()
+    add = payouts.reindex(u["nickname"]).to_numpy()
+    balances = pd.DataFrame({
+        "nickname": u["nickname"].to_numpy(),
+        "sheet_row": u["sheet_row"].to_numpy(),
+        "old_balance": old,
+        "new_balance": old + add,
+    })
+    missing = sorted(set(payouts.index) - set(balances["nickname"]))
+    return SettlementPlan(targets, winners, payouts, balances, settled_col, missing)
+
+
+def settlement_updates(plan):
+    """plan -> {시트 이름: batch_update 데이터}. 유저 잔액은 B열."""
+    return {
+        "Users": [
+            {"range": rowcol_to_a1(r, 2), "values": [[int(v)]]}
+            for r, v in zip(plan.balances["sheet_row"], plan.balances["new_balance"])
+        ],
+        "Matches": [
+            {"range": rowcol_to_a1(r, plan.settled_col), "values": [["TRUE"]]}
+            for r in plan.targets["sheet_row"]
+        ],
+    }
+
+
+def post_payouts(plan, ledger):
+    """
+    당첨금을 원장에 (경기, 유저) 단위로 기록하고, 잔액을 원장 기준으로 다시 계산.
+    같은 경기 당첨금은 키가 같아서 두 번 정산해도 한 번만 들어감.
+    원장에 아직 없는 당첨자 (다른 서버에서 가입 등) 는 Users 시트 잔액으로 먼저 OPENING 기록
+    (안 그러면 0 에서 시작해서 잔액이 당첨금으로 덮어써짐).
+    반환: 새로 생긴 원장 기록 목록 (OPENING 포함)
+    """
+    entries = []
+    for nick, old in zip(plan.balances["nickname"], plan.balances["old_balance"]):
+        entry = ledger.open_account(nick, int(old), persist=False)
+        if entry is not None:
+            entries.append(entry)
+    if not plan.winners.empty:
+        per_match = plan.winners.groupby(["nickname", "match_id"])["win_amt"].sum()
+        for (nick, mid), amt in per_match.items():
+            entry = ledger.post(nick, int(amt), "PAYOUT", ref=mid, key=payout_key(nick, mid), persist=False)
+            if entry is not None:
+                entries.append(entry)
+    plan.balances["new_balance"] = [ledger.balance(n) for n in plan.balances["nickname"]]
+    return entries
+
+
+def _with_extra(updates, extra):
+    for name, data in (extra or {}).items():
+        updates[name] = updates.get(name, []) + list(data)
+    return updates
+
+
+def apply_settlement(storage, plan, ledger=None, flush=None, extra=None):
+    """
+    잔액 + is_settled 를 한 번의 묶음 쓰기로 반영. ledger 가 있으면 원장에도 기록.
+    정산 중에는 당첨 유저들의 락을 잡아서, 그 사이 베팅이 옛 잔액으로 덮어쓰지 못하게 함.
+    flush: 락을 잡은 뒤 쓰기 큐에 남은 잔액 쓰기를 먼저 내보내는 함수
+    extra: 같은 묶음에 실을 다른 시트 수정 (예: {'Teams': ELO 변경})
+    """
+    if plan.empty:
+        return
+    if ledger is None:
+        storage.batch_update(_with_extra(settlement_updates(plan), extra))
+        return
+    locks = [ledger.lock(n) for n in sorted(plan.balances["nickname"])]
+    for lock in locks:
+        lock.acquire()
+    try:
+        if flush is not None:
+            flush()
+        entries = post_payouts(plan, ledger)
+        ledger_table = storage.table("Ledger") if entries else None
+        if ledger_table is not None:
+            try:
+                ledger_table.append_rows([e.row() for e in entries])
+            except Exception:
+                # 원장 시트에 못 남긴 당첨금은 메모리에서도 빼서, 다시 정산할 때 새로 기록되게 함
+                for e in entries:
+                    ledger.revert(e)
+                raise
+        storage.batch_update(_with_extra(settlement_updates(plan), extra))
+    finally:
+        for lock in reversed(locks):
+            lock.release()
@@ -0,0 +1,280 @@
+"""
+백그라운드 정산 작업 (체크포인트 + 이어서 하기).
+
+관리자 요청 안에서 정산을 다 돌리지 않고, 스레드 1개가 경기 몇 개씩(chunk) 나눠서 정산한다.
+chunk 하나가 끝날 때마다 체크포인트 파일에 진행 상황을 저장하므로
+화면을 닫거나 서버가 재시작돼도 남은 경기부터 이어서 한다.
+
+한 번만 지급되는 이유
+- 당첨금은 (경기, 유저) 키로 원장에 기록 -> 같은 키는 두 번 들어가지 않음 (유저당 경기 베팅은 1건)
+- 잔액 / is_settled / 그 chunk 의 ELO 는 묶음 쓰기 1번 -> 같이 반영되거나 같이 안 됨
+- is_settled 가 TRUE 인 경기는 다시 정산 대상이 되지 않음
+- 서버가 여러 개면 coordinator 의 "settlement" 락을 잡은 서버 하나만 정산 (체크포인트 파일도 공유 위치에)
+
+원장은 Ledger 시트가 기준 (서버마다 들고 있는 원장은 사본이고 Users 시트 B열은 그 캐시).
+정산하는 서버는 락을 잡은 뒤 plan 전에 Ledger 시트로 원장을 다시 맞추고,
+다른 서버는 공유 체크포인트에서 정산이 끝난 걸 보면 원장을 다시 읽는다.
+"""
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+from columnar import str_mask, to_frame
+from ratings import RatingTable
+from retry import backoff_delays
+from settlement import find_targets, plan_settlement, apply_settlement
+
+log = logging.getLogger(__name__)
+
+IDLE, RUNNING, DONE, FAILED = "idle", "running", "done", "failed"
+
+# 다시 해도 소용없는 오류 (헤더가 없는 등 시트 구조 문제) -> 바로 실패 처리.
+# 경기 1개의 ELO 문제 (없는 팀 / 이상한 결과) 는 RatingTable.apply_matches 가 그 경기만 건너뜀
+FATAL_ERRORS = (KeyError, ValueError)
+
+
+class LeaseLost(RuntimeError):
+    """정산 락이 만료돼서 다른 서버가 가져감 (이 서버는 체크포인트를 더 쓰지 않고 멈춤)"""
+
+
+class Checkpoint:
+    """진행 상황 JSON 파일 (임시 파일에 쓰고 바꿔치기)."""
+
+    def __init__(self, path="settlement_checkpoint.json"):
+        self.path = path
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            log.warning("정산 체크포인트 읽기 실패: %s", e)
+            return None
+
+    def save(self, state):
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
+
+
+class SettlementJob:
+    def __init__(self, storage, ledger, checkpoint, flush=None, chunk_matches=10,
+                 attempts=5, base_delay=1.0, with_elo=True, coordinator=None, owner="", lease=120.0):
+        self.storage = storage
+        self.ledger = ledger
+        self.checkpoint = checkpoint
+        self.flush = flush                  # 쓰기 큐 비우기 (정산 전에 밀린 베팅/잔액 반영)
+        self.chunk_matches = chunk_matches
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.with_elo = with_elo
+        self.coordinator = coordinator
+        self.owner = owner
+        self.lease = lease                  # 락 유지 시간 (chunk 마다 연장, 서버가 죽으면 이 시간 뒤 풀림)
+        self.state = checkpoint.load() or {"status": IDLE}
+        # 원장을 마지막으로 맞춘 작업 (job_id, status). 시작할 때 원장은 막 읽은 것이라 지금 체크포인트 기준
+        self._ledger_synced = (self.state.get("job_id"), self.state.get("status"))
+        self._thread = None
+        self._lock = threading.Lock()
+
+    # --- 화면에서 부르는 것 ---
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """정산 시작 (이미 돌고 있으면 False). 전에 멈춘 작업이 있으면 그 작업을 이어서 함."""
+        with self._lock:
+            if self.running:
+                return False
+            if self.coordinator is not None:
+                if not self.coordinator.acquire("settlement", self.owner, self.lease):
+                    return False    # 다른 서버가 정산 중
+                # 다른 서버가 하던 작업일 수 있으므로 공유 체크포인트를 다시 읽음
+                self.state = self.checkpoint.load() or {"status": IDLE}
+            prev = dict(self.state)
+            # 화면에는 바로 '진행 중' 으로 보이게 (체크포인트 파일은 작업이 읽기를 마친 뒤 저장)
+            self.state["status"] = RUNNING
+            self._thread = threading.Thread(target=self._run, args=(prev,), name="settlement-job", daemon=True)
+            self._thread.start()
+            return True
+
+    def resume_if_interrupted(self):
+        """서버가 정산 도중 꺼졌었으면 (체크포인트가 running) 자동으로 이어서 시작."""
+        if self.state.get("status") == RUNNING and not self.running:
+            # 다른 서버가 아직 돌리고 있으면 락을 못 잡아서 start() 가 False
+            log.info("중단된 정산 %s 이어서 시작", self.state.get("job_id"))
+            return self.start()
+        return False
+
+    def progress(self):
+        if self.coordinator is not None and not self.running:
+            # 다른 서버가 돌리는 중일 수 있으니 공유 체크포인트 기준
+            state = self.checkpoint.load()
+            if state is not None:
+                with self._lock:
+                    self.state = state
+                self._follow_remote(state)
+        with self._lock:
+            return dict(self.state)
+
+    def _follow_remote(self, state):
+        """다른 서버의 정산이 끝났으면 (당첨금이 Ledger 시트에만 있음) 백그라운드에서 원장을 다시 읽음."""
+        key = (state.get("job_id"), state.get("status"))
+        if key[1] not in (DONE, FAILED) or key == self._ledger_synced:
+            return
+        self._ledger_synced = key
+
+        def reload():
+            try:
+                self._sync_ledger(self._read("Users"))
+            except Exception as e:
+                log.warning("정산 후 원장 다시 읽기 실패: %s", e)
+                self._ledger_synced = None  # 다음 progress() 에서 다시
+        threading.Thread(target=reload, name="ledger-reload", daemon=True).start()
+
+    # --- 작업 ---
+
+    def _save(self, **changes):
+        with self._lock:
+            self.state.update(changes, updated_at=time.time())
+            state = dict(self.state)
+        # 공유 체크포인트를 쓰기 전에 락 연장. 그 사이 만료돼서 다른 서버가 가져갔으면 쓰지 않고 멈춤
+        if self.coordinator is not None and not self.coordinator.acquire("settlement", self.owner, self.lease):
+            raise LeaseLost("정산 락을 다른 서버가 가져감")
+        self.checkpoint.save(state)
+
+    def _run(self, prev):
+        try:
+            self._settle(prev)
+        except LeaseLost as e:
+            # 이어받은 서버의 진행 상황을 FAILED 로 덮어쓰지 않음 (화면은 공유 체크포인트 기준으로)
+            log.warning("정산 중단: %s", e)
+            state = self.checkpoint.load()
+            with self._lock:
+                self.state = state or {"status": IDLE}
+        except Exception as e:
+            log.exception("정산 실패")
+            try:
+                self._save(status=FAILED, error=f"{type(e).__name__}: {e}")
+            except LeaseLost as lost:
+                log.warning("정산 실패 기록 안 함: %s", lost)
+        finally:
+            if self.coordinator is not None:
+                self.coordinator.release("settlement", self.owner)
+
+    def _sync_ledger(self, users):
+        """
+        Ledger 시트 전체로 원장을 다시 맞춤 (다른 서버가 쓴 베팅 / 가입 / 당첨금 반영).
+        Ledger 기록이 없는 유저는 Users 시트 잔액으로 OPENING 을 만들어 바로 저장.
+        """
+        table = self.storage.table("Ledger")
+        if table is None:
+            return
+        records = self._retry(lambda: self.storage.read_fresh("Ledger"))
+        opening_balances = {}
+        if "nickname" in users.columns:
+            for nick, balance in zip(users["nickname"].astype(str), users["balance"]):
+                opening_balances.setdefault(nick, balance)
+        opening = self.ledger.reload(records, opening_balances)
+        if opening:
+            try:
+                self._retry(lambda: table.append_rows([e.row() for e in opening]))
+            except Exception:
+                for e in opening:
+                    self.ledger.revert(e)
+                raise
+
+    def _read(self, name):
+        return to_frame(name, self._retry(lambda: self.storage.read_fresh(name)))
+
+    def _retry(self, fn):
+        delays = list(backoff_delays(self.attempts - 1, self.base_delay))
+        for i in range(self.attempts):
+            try:
+                return fn()
+            except FATAL_ERRORS:
+                raise
+            except Exception as e:
+                if i == self.attempts - 1:
+                    raise
+                log.warning("정산 재시도 %d/%d: %s", i + 1, self.attempts - 1, e)
+                time.sleep(delays[i])
+
+    def _settle(self, prev):
+        resume = prev.get("status") in (RUNNING, FAILED)
+        if self.flush is not None:
+            self.flush()
+        matches, bets, users = self._read("Matches"), self._read("Bets"), self._read("Users")
+        if "is_settled" not in matches.columns:
+            raise KeyError("'is_settled' 헤더 없음")
+        # 락을 잡은 상태에서 plan 전에: 이 서버 원장이 아니라 Ledger 시트 기준 잔액으로 지급
+        self._sync_ledger(users)
+
+        targets = find_targets(matches)
+        done = set(prev.get("done_matches", [])) if resume else set()
+        # 이미 is_settled 가 TRUE 면 find_targets 에서 빠지지만, 체크포인트 기준으로도 한 번 더 거름
+        targets = targets[~targets["match_id"].astype(str).isin(done)]
+        target_ids = targets["match_id"].astype(str)
+
+        def bet_count(ids):
+            return int(str_mask(bets["match_id"], ids).sum()) if "match_id" in bets.columns else 0
+        self._save(
+            status=RUNNING,
+            job_id=prev.get("job_id") if resume else uuid.uuid4().hex[:8],
+            started_at=prev.get("started_at") if resume else time.time(),
+            total_matches=len(done) + len(targets),
+            done_matches=sorted(done),
+            total_bets=(prev.get("settled_bets", 0) if resume else 0) + bet_count(target_ids),
+            settled_bets=prev.get("settled_bets", 0) if resume else 0,
+            winners=prev.get("winners", 0) if resume else 0,
+            paid=prev.get("paid", 0) if resume else 0,
+            elo_changes=prev.get("elo_changes", []) if resume else [],
+            missing_users=prev.get("missing_users", []) if resume else [],
+            error=None,
+        )
+
+        ratings = None
+        for start in range(0, len(targets), self.chunk_matches):
+            chunk = targets.iloc[start:start + self.chunk_matches]
+            # 경기 행만 골라서 plan (index 가 그대로라 sheet_row 도 그대로)
+            chunk_matches = matches.loc[chunk.index]
+
+            def settle_chunk():
+                nonlocal ratings
+                if self.with_elo and ratings is None:
+                    ratings = RatingTable.from_records(self.storage.read_fresh("Teams"))
+                plan = plan_settlement(chunk_matches, bets, users)
+                elo_changes, extra = [], None
+                if self.with_elo:
+                    elo_changes = ratings.apply_matches(plan.targets)
+                    extra = {"Teams": ratings.pending_updates()}
+                try:
+                    apply_settlement(self.storage, plan, self.ledger, flush=self.flush, extra=extra)
+                except Exception:
+                    # 시트에 못 쓴 ELO 는 메모리에서도 버리고 다음 시도에서 다시 읽음
+                    ratings = None
+                    raise
+                if ratings is not None:
+                    ratings.changed.clear()
+                return plan, elo_changes
+
+            plan, elo_changes = self._retry(settle_chunk)
+            state = self.progress()
+            self._save(
+                done_matches=state["done_matches"] + chunk["match_id"].astype(str).tolist(),
+                settled_bets=state["settled_bets"] + bet_count(chunk["match_id"]),
+                winners=state["winners"] + len(plan.winners),
+                paid=state["paid"] + int(plan.winners["win_amt"].sum()) if not plan.winners.empty else state["paid"],
+                elo_changes=state["elo_changes"] + [[str(h), int(e), float(c)] for h, e, c in elo_changes],
+                missing_users=sorted(set(state["missing_users"]) | set(plan.missing_users)),
+            )
+        self._save(status=DONE, finished_at=time.time())
+        self._ledger_synced = (self.state.get("job_id"), DONE)
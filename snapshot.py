@@ -0,0 +1,208 @@
+"""
+프로세스 전체가 같이 쓰는 데이터 스냅샷.
+
+백그라운드 스레드 1개가 주기적으로 데이터를 받아 새 Snapshot 으로 통째로 교체한다.
+세션들은 current() 로 같은 객체를 읽기만 하고, 자기가 방금 한 베팅 같은
+낙관적 변경은 세션 쪽 overlay 로 따로 들고 있는다.
+
+서버가 여러 개면 (coordinator 가 있으면) 락을 잡은 서버 1개만 시트를 읽고 디스크(store)에 저장한 뒤
+버전을 올리고, 나머지 서버는 버전이 바뀌면 그 파일을 읽어 온다 (시트 호출은 전체에서 한 줄기).
+"""
+import logging
+import threading
+import time
+from dataclasses import dataclass
+
+import pandas as pd
+
+from indexes import SnapshotIndex
+
+log = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Snapshot:
+    """읽기 전용. DataFrame 을 직접 수정하지 말 것 (모든 세션이 공유함)."""
+    version: int
+    matches: pd.DataFrame
+    bets: pd.DataFrame
+    users: pd.DataFrame
+    fetched_at: float
+    index: SnapshotIndex            # nickname / match_id / (nickname, match_id) 해시 조회
+    teams: pd.DataFrame = None      # Teams 시트 (없으면 빈 DataFrame)
+
+
+class SnapshotPoller:
+    def __init__(self, load, interval=30.0, store=None, coordinator=None, owner="", tick=2.0):
+        self._load = load           # () -> (matches, bets, users, teams)
+        self.interval = interval
+        self.store = store          # warmstart.SnapshotStore (없으면 디스크 저장 X)
+        self.coordinator = coordinator  # coord.py (여러 서버가 스냅샷 갱신을 나눠 맡지 않게)
+        self.owner = owner
+        # coordinator 가 있으면 tick 마다 버전 / 갱신 요청을 확인 (시트 읽기는 interval 마다)
+        self.tick = interval if coordinator is None else min(interval, tick)
+        self.last_error = None
+        self._loaded_at = 0.0
+        self._requested = False
+        self._behind_since = None   # 담당 서버 버전을 store 에서 못 찾기 시작한 시각
+        self._snapshot = None
+        self._ready = threading.Event()
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="snapshot-poller", daemon=True)
+
+    def start(self):
+        if not self._thread.is_alive():
+            self._warm_start()
+            self._thread.start()
+        return self
+
+    def _warm_start(self):
+        """디스크에 저장된 마지막 스냅샷이 있으면 API 를 기다리지 않고 바로 내놓음."""
+        if self.store is None or self._snapshot is not None:
+            return
+        saved = self.store.load()
+        if saved is not None:
+            version, fetched_at, f = saved
+            self.publish(f["matches"], f["bets"], f["users"], f["teams"], version=version, fetched_at=fetched_at)
+            log.info("저장된 스냅샷 v%s 로 시작", version)
+
+    def current(self, timeout=None):
+        """최신 스냅샷. 아직 한 번도 못 받았으면 첫 로딩까지만 기다림."""
+        if self._snapshot is None:
+            self._ready.wait(timeout)
+        return self._snapshot
+
+    def refresh_now(self):
+        """다음 주기를 기다리지 않고 바로 새로 받도록 깨움 (다른 서버가 담당이면 그 서버에 요청)."""
+        self._requested = True
+        if self.coordinator is not None:
+            try:
+                self.coordinator.set("snapshot:refresh", time.time())
+            except Exception as e:
+                log.warning("조정 백엔드 오류: %s", e)
+        self._wake.set()
+
+    def _next_version(self, old):
+        local = 1 if old is None else old.version + 1
+        if self.coordinator is None:
+            return local
+        try:
+            return max(local, self.coordinator.incr("snapshot:counter"))
+        except Exception:
+            return local
+
+    def publish(self, matches, bets, users, teams=None, version=None, fetched_at=None):
+        """새 스냅샷으로 교체. 내용이 그대로면 version 을 올리지 않음."""
+        if teams is None:
+            teams = pd.DataFrame(columns=["team_name", "elo"])
+        with self._lock:
+            old = self._snapshot
+            if (old is not None and old.matches is matches and old.bets is bets
+                    and old.users is users and old.teams is teams):
+                return old
+            if version is None:
+                version = self._next_version(old)
+            # 인덱스는 스냅샷마다 한 번만 (Bets 만 늘었으면 새 행만 추가)
+            index = SnapshotIndex.build(matches, bets, users, prev=None if old is None else old.index)
+            self._snapshot = Snapshot(version, matches, bets, users, fetched_at or time.time(), index, teams)
+            self._ready.set()
+            return self._snapshot
+
+    def refresh(self):
+        if self.coordinator is None:
+            return self._reload()
+        due = self._requested or time.time() - self._loaded_at >= self.interval
+        try:
+            leader = self.coordinator.acquire("snapshot-poller", self.owner, ttl=max(3 * self.interval, 30))
+            # 담당 서버: 다른 서버의 동기화 요청도 받아줌
+            asked = float(self.coordinator.get("snapshot:refresh") or 0) if leader else 0.0
+        except Exception as e:
+            # 조정 백엔드가 죽어도 멈추지 않고 혼자 갱신
+            log.warning("조정 백엔드 오류: %s", e)
+            leader, asked = None, 0.0
+        if leader is None:
+            if due:
+                self._reload()
+        elif leader:
+            if due or asked > self._loaded_at:
+                self._reload()
+        elif self.store is not None:
+            try:
+                self._follow()
+            except Exception as e:
+                log.warning("공유 스냅샷 읽기 실패: %s", e)
+        elif due:
+            # 공유 저장소가 없으면 각자 읽음 (호출 제한 버킷은 그래도 공유)
+            self._reload()
+
+    def _follow(self):
+        """
+        담당 서버가 저장한 새 버전이 있으면 디스크에서 읽어 옴 (API 호출 X).
+        interval 이 지나도 그 버전이 store 에 안 보이면 (store 가 공유 위치가 아님 등) 직접 시트에서 읽음.
+        """
+        latest = int(self.coordinator.get("snapshot:version") or 0)
+        cur = self._snapshot
+        if cur is None or cur.version < latest:
+            saved = self.store.load()
+            if saved is not None and (cur is None or saved[0] > cur.version):
+                version, fetched_at, f = saved
+                cur = self.publish(f["matches"], f["bets"], f["users"], f["teams"], version=version, fetched_at=fetched_at)
+                self._requested = False
+        if cur is not None and cur.version >= latest:
+            self._behind_since = None
+            return
+        now = time.time()
+        if self._behind_since is None:
+            self._behind_since = now
+        elif now - self._behind_since >= self.interval:
+            log.warning("담당 서버의 스냅샷 v%s 가 %s 에 안 보임 (공유 위치인지 확인) - 직접 읽음",
+                        latest, getattr(self.store, "path", self.store))
+            self._behind_since = None
+            self._reload()
+
+    def _reload(self):
+        self._requested = False
+        self._loaded_at = time.time()
+        try:
+            old = self._snapshot
+            snap = self.publish(*self._load())
+            self.last_error = None
+        except Exception as e:
+            # 실패해도 예전 스냅샷을 계속 보여줌
+            self.last_error = e
+            log.warning("스냅샷 갱신 실패: %s", e)
+            return
+        if self.store is not None and snap is not old:
+            try:
+                self.store.save(snap)
+            except Exception as e:
+                log.warning("스냅샷 저장 실패: %s", e)
+                return
+            if self.coordinator is not None:
+                try:
+                    self.coordinator.set("snapshot:version", snap.version)
+                except Exception as e:
+                    log.warning("스냅샷 버전 공유 실패: %s", e)
+
+    def _run(self):
+        while True:
+            self.refresh()
+            self._wake.wait(self.tick)
+            self._wake.clear()
+
+
+def merge_overlay(snapshot, nickname, pending_bets):
+    """
+    세션 overlay(방금 한 베팅)를 스냅샷 인덱스에 얹어서
+    (내 베팅 {match_id: 베팅}, 아직 반영 안 된 베팅 목록) 을 돌려줌.
+    스냅샷 인덱스에 이미 들어온 베팅은 overlay 에서 빠짐.
+    잔액은 원장(ledger) 기준이라 여기서 유저 DataFrame 을 복사하지 않음 (세션마다 메모리 X).
+    """
+    mine = snapshot.index.user_bets(nickname)
+    still_pending = [b for b in pending_bets if str(b["match_id"]) not in mine]
+    if still_pending:
+        mine = dict(mine)
+        for b in still_pending:
+            mine[str(b["match_id"])] = b
+    return mine, still_pending
@@ -0,0 +1,490 @@
+"""
+저장소 백엔드 모음.
+
+app.py 는 워크시트 객체(get_all_records / append_row / update_cell / find / cell,
+그리고 묶음 쓰기용 append_rows / batch_update)만 쓰므로,
+같은 모양의 '테이블' 객체를 돌려주는 백엔드를 갈아 끼울 수 있게 만든다.
+
+- GoogleSheetsStorage : 기존 구글 시트 (gspread 워크시트를 그대로 돌려줌)
+- SQLiteStorage       : 로컬 SQLite (WAL 모드 + 인덱스), 오프라인/주 저장소용
+- WriteThroughStorage : 구글 시트에 쓰고 SQLite 에도 같이 쓰는 미러 모드
+"""
+import re
+import sqlite3
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+
+from gspread.utils import numericise_all
+
+# 시트 헤더 순서 그대로 (update_cell 의 열 번호가 이 순서를 따름)
+TABLE_COLUMNS = {
+    "Users": ["nickname", "balance"],
+    "Matches": [
+        "match_id", "home", "away", "home_odds", "draw_odds", "away_odds",
+        "status", "result", "h_xg", "a_xg", "h_pass", "a_pass", "h_ppda", "a_ppda",
+        "is_settled",
+    ],
+    "Bets": ["nickname", "match_id", "choice", "amount", "timestamp"],
+    "Teams": ["team_name", "elo"],
+    # 잔액 원장 (ledger.py): 입출금 기록만 계속 쌓임
+    "Ledger": ["entry_id", "nickname", "amount", "kind", "ref", "timestamp"],
+}
+TABLE_NAMES = ("Users", "Matches", "Bets", "Teams")
+# 없어도 앱이 돌아가는 시트
+OPTIONAL_TABLES = ("Teams", "Ledger")
+
+# 조회가 잦은 열에만 인덱스
+INDEXED_COLUMNS = {
+    "Users": ["nickname"],
+    "Matches": ["match_id", "status"],
+    "Bets": ["nickname", "match_id"],
+    "Teams": ["team_name"],
+    "Ledger": ["entry_id", "nickname"],
+}
+
+# gspread.cell.Cell 과 같은 속성 (row, col, value)
+Cell = namedtuple("Cell", ["row", "col", "value"])
+
+
+def rowcol_to_a1(row, col):
+    """(2, 3) -> 'C2'"""
+    letters = ""
+    col = int(col)
+    while col:
+        col, rem = divmod(col - 1, 26)
+        letters = chr(65 + rem) + letters
+    return f"{letters}{int(row)}"
+
+
+def a1_to_rowcol(label):
+    """'C2' -> (2, 3)"""
+    m = re.fullmatch(r"([A-Za-z]+)(\d+)", label.split("!")[-1])
+    if not m:
+        raise ValueError(f"A1 주소 아님: {label}")
+    col = 0
+    for ch in m.group(1).upper():
+        col = col * 26 + (ord(ch) - 64)
+    return int(m.group(2)), col
+
+
+class Storage:
+    """백엔드 공통 인터페이스. table(name) 이 워크시트처럼 쓰는 객체를 돌려준다."""
+
+    backend = "base"
+
+    def table(self, name):
+        raise NotImplementedError
+
+    def tables(self):
+        # app.py 의 (ws_users, ws_matches, ws_bets, ws_teams) 순서
+        return tuple(self.table(name) for name in TABLE_NAMES)
+
+    # --- 증분 동기화용 (sync.py) ---
+
+    def revision(self, name):
+        """테이블이 바뀌었는지 싸게 확인하는 값. 모르면 None."""
+        return None
+
+    def revisions(self, names):
+        return {name: self.revision(name) for name in names}
+
+    def row_count(self, name):
+        """헤더를 뺀 데이터 행 수."""
+        return len(self.table(name).get_all_records())
+
+    def records_since(self, name, start_row):
+        """시트 start_row 행부터 끝까지의 레코드 (start_row=2 면 전체)."""
+        return self.table(name).get_all_records()[start_row - 2:]
+
+    def fetch_many(self, names):
+        """여러 테이블 전체 레코드를 한 번에. {이름: 레코드 목록}"""
+        return {name: self.table(name).get_all_records() for name in names}
+
+    def read_fresh(self, name):
+        """원본에서 읽은 전체 레코드. 실패하면 예외 (미러의 옛 데이터로 대신하지 않음, 정산용)."""
+        return self.table(name).get_all_records()
+
+    def batch_update(self, updates):
+        """여러 시트의 셀을 한 번에 수정. updates = {시트 이름: [{'range': 'B2', 'values': [[v]]}, ...]}"""
+        for name, data in updates.items():
+            if data:
+                self.table(name).batch_update(data)
+
+
+# --- 구글 시트 ---
+
+class GoogleSheetsStorage(Storage):
+    backend = "gsheets"
+
+    def __init__(self, spreadsheet):
+        self.spreadsheet = spreadsheet
+        self._tables = {}
+        self._headers = {}
+
+    def table(self, name):
+        if name not in self._tables:
+            try:
+                self._tables[name] = self.spreadsheet.worksheet(name)
+            except Exception:
+                # Teams / Ledger 시트는 없을 수도 있음 (기존 동작 유지)
+                if name in OPTIONAL_TABLES:
+                    self._tables[name] = None
+                else:
+                    raise
+        return self._tables[name]
+
+    def header(self, name):
+        if name not in self._headers:
+            self._headers[name] = self.table(name).row_values(1)
+        return self._headers[name]
+
+    def revision(self, name):
+        # 시트별 수정 시각은 없어서 문서 전체의 수정 시각을 씀 (Drive API 1회)
+        # -> 어느 시트든 쓰면 모든 시트가 바뀐 것으로 보임 (아무도 안 쓸 때만 전부 건너뜀)
+        return self.spreadsheet.get_lastUpdateTime()
+
+    def revisions(self, names):
+        rev = self.revision(None)
+        return {name: rev for name in names}
+
+    def row_count(self, name):
+        return max(0, len(self.table(name).col_values(1)) - 1)
+
+    def records_since(self, name, start_row):
+        header = self.header(name)
+        last_col = rowcol_to_a1(1, len(header))[:-1]
+        values = self.table(name).get_values(f"A{int(start_row)}:{last_col}")
+        return _to_records(header, values)
+
+    def fetch_many(self, names):
+        # 시트 여러 개를 values_batch_get 한 번으로 (API 호출 1회, 왕복 1번)
+        names = [n for n in names if self.table(n) is not None]
+        if not names:
+            return {}
+        res = self.spreadsheet.values_batch_get([f"'{n}'" for n in names])
+        out = {}
+        for name, vr in zip(names, res.get("valueRanges", [])):
+            values = vr.get("values", [])
+            if values:
+                self._headers[name] = values[0]
+            out[name] = _to_records(values[0], values[1:]) if values else []
+        return out
+
+    def batch_update(self, updates):
+        # 시트가 여러 개여도 values_batch_update 한 번 (API 호출 1회)
+        data = [
+            {"range": f"'{name}'!{item['range']}", "values": item["values"]}
+            for name, items in updates.items() for item in items
+        ]
+        if data:
+            self.spreadsheet.values_batch_update({"valueInputOption": "USER_ENTERED", "data": data})
+
+
+def _to_records(header, rows):
+    # get_all_records 와 같은 규칙 (짧은 행은 빈칸으로 채우고 숫자는 숫자로)
+    # 끝의 빈 행은 버림: 범위 안에 데이터가 없으면 gspread 가 [[]] 를 돌려줌 (레코드 0개여야 함)
+    rows = list(rows)
+    while rows and not any(str(v).strip() for v in rows[-1]):
+        rows.pop()
+    return [
+        dict(zip(header, numericise_all(row + [""] * (len(header) - len(row)), default_blank="")))
+        for row in rows
+    ]
+
+
+# --- SQLite ---
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+class SQLiteTable:
+    """
+    워크시트 흉내를 내는 SQLite 테이블.
+    시트처럼 1행은 헤더로 치고, 데이터 rowid 1 == 시트 2행.
+    """
+
+    def __init__(self, storage, title, columns):
+        self.storage = storage
+        self.title = title
+        self.columns = list(columns)
+        self._q = _quote(title)
+
+    def _row_to_rowid(self, row):
+        return int(row) - 1
+
+    def _column(self, col):
+        col = int(col)
+        if not 1 <= col <= len(self.columns):
+            raise IndexError(f"{self.title}: {col}번째 열 없음")
+        return self.columns[col - 1]
+
+    def get_all_records(self):
+        cols = ", ".join(_quote(c) for c in self.columns)
+        rows = self.storage.fetchall(f"SELECT {cols} FROM {self._q} ORDER BY rowid")
+        return [dict(zip(self.columns, r)) for r in rows]
+
+    def _pad(self, values):
+        values = list(values)[:len(self.columns)]
+        return values + [""] * (len(self.columns) - len(values))
+
+    def append_row(self, values):
+        values = self._pad(values)
+        cols = ", ".join(_quote(c) for c in self.columns)
+        marks = ", ".join("?" * len(self.columns))
+        with self.storage.transaction(self.title) as conn:
+            conn.execute(f"INSERT INTO {self._q} ({cols}) VALUES ({marks})", values)
+
+    def append_rows(self, rows):
+        rows = [self._pad(r) for r in rows]
+        cols = ", ".join(_quote(c) for c in self.columns)
+        marks = ", ".join("?" * len(self.columns))
+        with self.storage.transaction(self.title) as conn:
+            conn.executemany(f"INSERT INTO {self._q} ({cols}) VALUES ({marks})", rows)
+
+    def update_cell(self, row, col, value):
+        column = self._column(col)
+        with self.storage.transaction(self.title) as conn:
+            conn.execute(
+                f"UPDATE {self._q} SET {_quote(column)} = ? WHERE rowid = ?",
+                (value, self._row_to_rowid(row)),
+            )
+
+    def batch_update(self, data):
+        """gspread batch_update 와 같은 형식: [{'range': 'B2', 'values': [[v]]}, ...] (단일 셀만)"""
+        with self.storage.transaction(self.title) as conn:
+            for item in data:
+                row, col = a1_to_rowcol(item["range"])
+                conn.execute(
+                    f"UPDATE {self._q} SET {_quote(self._column(col))} = ? WHERE rowid = ?",
+                    (item["values"][0][0], self._row_to_rowid(row)),
+                )
+
+    def cell(self, row, col):
+        column = self._column(col)
+        found = self.storage.fetchone(
+            f"SELECT {_quote(column)} FROM {self._q} WHERE rowid = ?", (self._row_to_rowid(row),)
+        )
+        return Cell(int(row), int(col), None if found is None else found[0])
+
+    def find(self, query):
+        """gspread find 처럼 값이 같은 첫 번째 셀 (행 우선). 없으면 None."""
+        query = str(query)
+        # 키 열은 인덱스로 먼저 찾아서 스캔 범위를 그 행까지로 줄임
+        limit = None
+        for column in INDEXED_COLUMNS.get(self.title, []):
+            found = self.storage.fetchone(
+                f"SELECT rowid FROM {self._q} WHERE {_quote(column)} = ? ORDER BY rowid LIMIT 1", (query,)
+            )
+            if found and (limit is None or found[0] < limit):
+                limit = found[0]
+        return self._first_match(query, limit)
+
+    def _first_match(self, query, limit_rowid=None):
+        where = " OR ".join(f"CAST({_quote(c)} AS TEXT) = :q" for c in self.columns)
+        sql = f"SELECT rowid, * FROM {self._q} WHERE ({where})"
+        params = {"q": query}
+        if limit_rowid is not None:
+            sql += " AND rowid <= :r"
+            params["r"] = limit_rowid
+        found = self.storage.fetchone(sql + " ORDER BY rowid LIMIT 1", params)
+        if found is None:
+            return None
+        rowid, values = found[0], found[1:]
+        for i, v in enumerate(values):
+            if str(v) == query:
+                return Cell(rowid + 1, i + 1, v)
+        return None
+
+
+class SQLiteStorage(Storage):
+    backend = "sqlite"
+
+    def __init__(self, path="ddc.sqlite3", columns=None):
+        self.path = path
+        self.columns = dict(columns or TABLE_COLUMNS)
+        self._lock = threading.RLock()
+        # Streamlit 은 세션마다 스레드가 달라서 check_same_thread 를 꺼두고 락으로 보호
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self._tables = {}
+        # 테이블별 수정 번호 (쓰기 트랜잭션마다 +1) -> 증분 동기화의 변경 확인용
+        self.conn.execute('CREATE TABLE IF NOT EXISTS "_meta" (name TEXT PRIMARY KEY, rev INTEGER NOT NULL)')
+        for name, cols in self.columns.items():
+            self._create(name, cols)
+
+    def _create(self, name, cols):
+        q = _quote(name)
+        # 열 타입을 지정하지 않아야 시트처럼 숫자는 숫자, 글자는 글자로 저장됨
+        body = ", ".join(_quote(c) for c in cols)
+        with self._lock:
+            self.conn.execute(f"CREATE TABLE IF NOT EXISTS {q} ({body})")
+            for c in INDEXED_COLUMNS.get(name, []):
+                if c in cols:
+                    idx = _quote(f"idx_{name}_{c}")
+                    self.conn.execute(f"CREATE INDEX IF NOT EXISTS {idx} ON {q} ({_quote(c)})")
+        self._tables[name] = SQLiteTable(self, name, cols)
+
+    def fetchall(self, sql, params=()):
+        # 연결을 스레드끼리 공유하므로 fetch 까지 락 안에서 끝냄
+        with self._lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def fetchone(self, sql, params=()):
+        with self._lock:
+            return self.conn.execute(sql, params).fetchone()
+
+    @contextmanager
+    def transaction(self, name=None):
+        with self._lock:
+            self.conn.execute("BEGIN")
+            try:
+                yield self.conn
+                if name is not None:
+                    self.conn.execute(
+                        'INSERT INTO "_meta" (name, rev) VALUES (?, 1) '
+                        'ON CONFLICT(name) DO UPDATE SET rev = rev + 1',
+                        (name,),
+                    )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def table(self, name):
+        return self._tables.get(name)
+
+    def revision(self, name):
+        found = self.fetchone('SELECT rev FROM "_meta" WHERE name = ?', (name,))
+        return found[0] if found else 0
+
+    def row_count(self, name):
+        # rowid 는 1부터 빈틈 없이 붙음 (삭제 없음)
+        return self.fetchone(f"SELECT COALESCE(MAX(rowid), 0) FROM {_quote(name)}")[0]
+
+    def records_since(self, name, start_row):
+        t = self._tables[name]
+        cols = ", ".join(_quote(c) for c in t.columns)
+        rows = self.fetchall(
+            f"SELECT {cols} FROM {t._q} WHERE rowid >= ? ORDER BY rowid", (int(start_row) - 1,)
+        )
+        return [dict(zip(t.columns, r)) for r in rows]
+
+    def replace_all(self, name, records):
+        """테이블 내용을 통째로 갈아끼움 (미러 초기화/재동기화용)."""
+        t = self._tables[name]
+        cols = ", ".join(_quote(c) for c in t.columns)
+        marks = ", ".join("?" * len(t.columns))
+        rows = [[r.get(c, "") for c in t.columns] for r in records]
+        with self.transaction(name) as conn:
+            conn.execute(f"DELETE FROM {t._q}")
+            # rowid 를 1부터 다시 매겨야 시트 행 번호와 맞음
+            conn.executemany(
+                f"INSERT INTO {t._q} (rowid, {cols}) VALUES (?, {marks})",
+                [[i + 1] + row for i, row in enumerate(rows)],
+            )
+
+
+# --- 구글 시트 + SQLite 미러 ---
+
+class WriteThroughTable:
+    """
+    쓰기: 구글 시트 -> SQLite 순서로 둘 다 반영.
+    읽기: get_all_records 는 시트에서 받아 미러를 갱신 (시트가 죽으면 미러로 대체, stale_ok=False 면 예외),
+          find / cell 은 미러에서 바로 응답 (API 호출 X).
+    """
+
+    def __init__(self, storage, name, primary, mirror):
+        self.storage = storage
+        self.title = name
+        self.primary = primary
+        self.mirror = mirror
+
+    def get_all_records(self, stale_ok=True):
+        try:
+            records = self.primary.get_all_records()
+        except Exception:
+            if stale_ok and self.storage.serve_stale:
+                return self.mirror.get_all_records()
+            raise
+        self.storage.mirror.replace_all(self.title, records)
+        return records
+
+    def append_row(self, values):
+        self.primary.append_row(values)
+        self.mirror.append_row(values)
+
+    def append_rows(self, rows):
+        self.primary.append_rows(rows)
+        self.mirror.append_rows(rows)
+
+    def update_cell(self, row, col, value):
+        self.primary.update_cell(row, col, value)
+        self.mirror.update_cell(row, col, value)
+
+    def batch_update(self, data):
+        self.primary.batch_update(data)
+        self.mirror.batch_update(data)
+
+    def find(self, query):
+        return self.mirror.find(query)
+
+    def cell(self, row, col):
+        return self.mirror.cell(row, col)
+
+
+class WriteThroughStorage(Storage):
+    backend = "mirror"
+
+    def __init__(self, primary, mirror, serve_stale=True):
+        self.primary = primary
+        self.mirror = mirror
+        self.serve_stale = serve_stale
+        self._tables = {}
+
+    def table(self, name):
+        if name not in self._tables:
+            p = self.primary.table(name)
+            m = self.mirror.table(name)
+            self._tables[name] = None if p is None else WriteThroughTable(self, name, p, m)
+        return self._tables[name]
+
+    def batch_update(self, updates):
+        self.primary.batch_update(updates)
+        self.mirror.batch_update(updates)
+
+    # 증분 동기화는 원본(구글 시트) 기준
+    def revision(self, name):
+        return self.primary.revision(name)
+
+    def revisions(self, names):
+        return self.primary.revisions(names)
+
+    def row_count(self, name):
+        return self.primary.row_count(name)
+
+    def records_since(self, name, start_row):
+        return self.primary.records_since(name, start_row)
+
+    def read_fresh(self, name):
+        return self.table(name).get_all_records(stale_ok=False)
+
+    def fetch_many(self, names):
+        try:
+            out = self.primary.fetch_many(names)
+        except Exception:
+            if self.serve_stale:
+                return self.mirror.fetch_many([n for n in names if self.table(n) is not None])
+            raise
+        for name, records in out.items():
+            self.mirror.replace_all(name, records)
+        return out
+
+    def bootstrap(self):
+        """미러가 비어 있으면 시트 내용을 한 번 복사해 둠."""
+        for name in TABLE_COLUMNS:
+            t = self.table(name)
+            if t is not None and not t.mirror.get_all_records():
+                t.get_all_records()
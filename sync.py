@@ -0,0 +1,159 @@
+"""
+증분 동기화 (delta sync).
+
+Bets 는 뒤에 붙기만 하는 시트라서, 지난번에 읽은 행 수를 기억해 두고
+그 다음 행부터만 받아와 열 단위 버퍼(columnar.ColumnTable) 뒤에 이어 붙인다.
+API 호출 기준으로 증분인 시트는 Bets 뿐이다. Matches / Users 는 revision 이 바뀌면 통째로 다시 읽는다.
+구글 시트의 revision 은 문서 전체의 수정 시각이라 잔액 쓰기 한 번에도 바뀌므로,
+revision 으로 건너뛰는 건 아무도 쓰지 않을 때뿐이다.
+대신 다시 읽은 내용이 그대로면 (내용 해시) 예전 DataFrame 을 그대로 둬서 스냅샷 버전 / 인덱스를 새로 만들지 않는다.
+
+통째로 읽어야 하는 시트들은 fetch_many 한 번(구글 시트면 values_batch_get 1회)으로 같이 받는다.
+실패하면 시트별로 따로(스레드 풀에서 동시에) 지수 백오프 + 지터로 재시도하고,
+그래도 안 되는 시트는 지난번 데이터를 그대로 둔다 (stale-while-revalidate).
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from columnar import bet_table, to_frame
+from retry import call_with_retry
+
+log = logging.getLogger(__name__)
+
+APPEND_ONLY = ("Bets",)
+DEFAULT_TABLES = ("Matches", "Bets", "Users")
+
+
+def fetch_tables(storage, names, attempts=4, base=0.5, max_workers=4):
+    """
+    여러 시트 전체 레코드 받기. 반환: ({이름: 레코드}, {이름: 마지막 예외})
+    1) fetch_many 한 번 (재시도 2회)
+    2) 실패하면 시트별로 동시에, 시트마다 따로 재시도
+    """
+    names = list(names)
+    if not names:
+        return {}, {}
+    try:
+        return call_with_retry(storage.fetch_many, names, attempts=2, base=base), {}
+    except Exception as e:
+        log.warning("묶음 읽기 실패, 시트별로 다시 시도: %s", e)
+
+    def one(name):
+        return call_with_retry(lambda: storage.table(name).get_all_records(), attempts=attempts, base=base)
+
+    results, errors = {}, {}
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(names))) as pool:
+        futures = {name: pool.submit(one, name) for name in names}
+    for name, f in futures.items():
+        try:
+            results[name] = f.result()
+        except Exception as e:
+            errors[name] = e
+    return results, errors
+
+
+class DeltaSync:
+    def __init__(self, storage, tables=DEFAULT_TABLES, full_every=600.0, attempts=4, base_delay=0.5):
+        self.storage = storage
+        self.tables = tuple(tables)
+        # revision 을 모르는 백엔드이거나 시트를 손으로 고쳤을 때를 대비해서 가끔은 통째로 다시 읽음
+        self.full_every = full_every
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.frames = {}
+        self.columns = {}       # 뒤에 붙기만 하는 시트 -> ColumnTable (frames 는 여기서 잘라낸 것)
+        self.rows = {}          # 시트별 마지막으로 읽은 데이터 행 수
+        self.revs = {}
+        self.hashes = {}        # 통째로 읽는 시트 -> 내용 해시
+        self.loaded_at = {}
+        self.errors = {}        # 이번에 못 받은 시트 -> 예외 (예전 데이터를 대신 씀)
+        self._lock = threading.Lock()
+
+    def _retry(self, fn, *args):
+        return call_with_retry(fn, *args, attempts=self.attempts, base=self.base_delay)
+
+    def sync(self, force=False):
+        """
+        바뀐 부분만 받아서 {시트 이름: DataFrame} 반환.
+        일부 시트가 실패해도 예전 데이터가 있으면 그걸로 돌려줌 (self.errors 에 기록).
+        한 번도 못 받은 시트가 있을 때만 예외.
+        """
+        with self._lock:
+            self.errors = {}
+            try:
+                # revision 이 같으면 그 시트는 API 를 더 부를 필요 없음
+                revs = self._retry(self.storage.revisions, self.tables)
+            except Exception as e:
+                revs = {}
+                self.errors = {name: e for name in self.tables}
+                force = force or not self.frames
+
+            full, tail = [], []
+            for name in self.tables:
+                try:
+                    action = self._plan(name, revs.get(name), force, name in self.errors)
+                except Exception as e:
+                    self.errors[name] = e
+                    continue
+                (full if action == "full" else tail if action == "tail" else []).append(name)
+
+            if full:
+                records, errors = fetch_tables(self.storage, full, self.attempts, self.base_delay)
+                for name, recs in records.items():
+                    self._set(name, recs, revs.get(name))
+                    self.errors.pop(name, None)
+                self.errors.update(errors)
+            for name in tail:
+                try:
+                    self._tail(name, revs.get(name))
+                except Exception as e:
+                    self.errors[name] = e
+
+            missing = [n for n in self.tables if n not in self.frames]
+            if missing:
+                raise self.errors.get(missing[0]) or RuntimeError(f"{missing[0]} 데이터 없음")
+            for name, e in self.errors.items():
+                log.warning("%s 동기화 실패 (예전 데이터 사용): %s", name, e)
+            return dict(self.frames)
+
+    def _expired(self, name):
+        return time.time() - self.loaded_at.get(name, 0) > self.full_every
+
+    def _plan(self, name, rev, force, rev_failed):
+        """'full' / 'tail' / None (그대로)"""
+        if name not in self.frames or force or self._expired(name):
+            return "full"
+        if rev_failed:
+            return None
+        if rev is not None and rev == self.revs.get(name):
+            return None
+        if name in APPEND_ONLY:
+            return "tail"
+        if rev is not None or self._retry(self.storage.row_count, name) != self.rows[name]:
+            return "full"
+        return None
+
+    def _set(self, name, records, rev):
+        if name in APPEND_ONLY:
+            self.columns[name] = bet_table(records)
+            self.frames[name] = self.columns[name].frame()
+        else:
+            digest = hash(tuple(tuple(r.items()) for r in records))
+            if name not in self.frames or self.hashes.get(name) != digest:
+                self.frames[name] = to_frame(name, records)
+                self.hashes[name] = digest
+        self.rows[name] = len(records)
+        self.revs[name] = rev
+        self.loaded_at[name] = time.time()
+
+    def _tail(self, name, rev):
+        # 지난번 마지막 행 다음부터 (헤더 1행 + 데이터 n행 -> n+2행부터)
+        # 받은 실제 행 수만큼만 다음 시작 행을 옮김 (새 행이 없으면 그대로)
+        new = self._retry(self.storage.records_since, name, self.rows[name] + 2)
+        if new:
+            self.columns[name].append(new)
+            self.frames[name] = self.columns[name].frame()
+            self.rows[name] += len(new)
+        self.revs[name] = rev
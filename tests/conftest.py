@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 모듈이 저장소 최상위에 평평하게 있으므로 (app.py 옆) 그 폴더를 import 경로에
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,22 @@
+import pandas as pd
+
+from indexes import SnapshotIndex
+
+MATCHES = pd.DataFrame({"match_id": []})
+BETS = pd.DataFrame(columns=["nickname", "match_id", "choice", "amount", "timestamp"])
+
+
+def users(*nicks):
+    return pd.DataFrame({"nickname": list(nicks), "balance": [3000] * len(nicks)})
+
+
+def test_reserved_row_survives_a_rebuild_before_it_lands():
+    idx = SnapshotIndex.build(MATCHES, BETS, users("a", "b"))
+    assert idx.add_user("x", 3000) == 4
+    # 새 Users 프레임이 왔지만 x 의 행은 아직 시트에 없음
+    idx = SnapshotIndex.build(MATCHES, BETS, users("a", "b"), prev=idx)
+    assert idx.user_row("x") == 4
+    assert idx.add_user("y", 3000) == 5
+    idx = SnapshotIndex.build(MATCHES, BETS, users("a", "b", "x", "y"), prev=idx)
+    assert idx.reserved == {}
+    assert (idx.user_row("x"), idx.user_row("y"), idx.next_user_row) == (4, 5, 6)
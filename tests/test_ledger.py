@@ -0,0 +1,75 @@
+import queue
+
+import pytest
+
+from ledger import DuplicateBet, InsufficientFunds, Ledger
+
+
+class FlakyPersist:
+    """fail 이 True 인 동안 queue.Full, 아니면 받은 기록을 모아둠 (쓰기 큐 대신)."""
+
+    def __init__(self):
+        self.fail = False
+        self.rows = []
+
+    def __call__(self, entry, balance):
+        if self.fail:
+            raise queue.Full
+        self.rows.append((entry.entry_id, balance))
+
+
+def test_same_key_is_posted_once():
+    persist = FlakyPersist()
+    ledger = Ledger(persist=persist)
+    assert ledger.post("a", 3000, "SIGNUP", key="signup:a") is not None
+    assert ledger.post("a", 3000, "SIGNUP", key="signup:a") is None
+    ledger.place_bet("a", 7, 500)
+    with pytest.raises(DuplicateBet):
+        ledger.place_bet("a", 7, 500)
+    with pytest.raises(InsufficientFunds):
+        ledger.place_bet("a", 8, 5000)
+    assert ledger.balance("a") == 2500
+    assert [r[0] for r in persist.rows] == ["signup:a", "bet:a:7"]
+
+
+def test_failed_persist_rolls_back_and_can_retry():
+    persist = FlakyPersist()
+    ledger = Ledger(persist=persist)
+    ledger.post("a", 3000, "SIGNUP", key="signup:a")
+
+    persist.fail = True
+    with pytest.raises(queue.Full):
+        ledger.place_bet("a", 7, 500)
+    # 잔액도 키도 원래대로 -> 같은 경기에 다시 베팅 가능 (DuplicateBet 아님)
+    assert ledger.balance("a") == 3000
+
+    persist.fail = False
+    ledger.place_bet("a", 7, 500)
+    assert ledger.balance("a") == 2500
+    assert [r[0] for r in persist.rows] == ["signup:a", "bet:a:7"]
+
+
+def test_failed_opening_can_be_opened_again():
+    persist = FlakyPersist()
+    ledger = Ledger(persist=persist)
+    persist.fail = True
+    with pytest.raises(queue.Full):
+        ledger.open_account("a", 1200)
+    assert ledger.balance("a") == 0
+
+    persist.fail = False
+    assert ledger.open_account("a", 1200) is not None
+    assert ledger.balance("a") == 1200
+
+
+def test_reload_keeps_entries_not_yet_in_sheet():
+    ledger = Ledger(persist=FlakyPersist())
+    ledger.reload([{"entry_id": "signup:a", "nickname": "a", "amount": 3000,
+                    "kind": "SIGNUP", "ref": "", "timestamp": ""}])
+    ledger.place_bet("a", 7, 500)
+    # 베팅 기록이 아직 시트에 안 보여도 잔액에서 빠진 채로 유지
+    ledger.reload([{"entry_id": "signup:a", "nickname": "a", "amount": 3000,
+                    "kind": "SIGNUP", "ref": "", "timestamp": ""}])
+    assert ledger.balance("a") == 2500
+    with pytest.raises(DuplicateBet):
+        ledger.place_bet("a", 7, 500)
@@ -0,0 +1,75 @@
+import pandas as pd
+
+import bench
+from fakesheet import FakeSpreadsheet
+from ledger import Ledger
+from settlement_job import DONE, FAILED, Checkpoint, SettlementJob
+from storage import GoogleSheetsStorage
+
+DATA = bench.generate(users=60, teams=8, matches=30, bets=400, seed=1)
+
+
+def make_storage(data=DATA):
+    ss = FakeSpreadsheet()
+    ss.load(data)
+    return ss, GoogleSheetsStorage(ss)
+
+
+def run(storage, checkpoint, **kwargs):
+    job = SettlementJob(storage, Ledger(), checkpoint, chunk_matches=4, base_delay=0, **kwargs)
+    job.start()
+    job._thread.join()
+    return job
+
+
+def payouts(storage):
+    ledger = pd.DataFrame(storage.table("Ledger").get_all_records())
+    return ledger[ledger["kind"] == "PAYOUT"]
+
+
+def test_failed_batch_update_then_resume_pays_exactly_once(tmp_path):
+    _, ref = make_storage()
+    assert run(ref, Checkpoint(str(tmp_path / "ref.json"))).progress()["status"] == DONE
+
+    ss, storage = make_storage()
+    checkpoint = Checkpoint(str(tmp_path / "ck.json"))
+    orig, calls = ss.values_batch_update, [0]
+
+    def flaky(body):
+        # 3번째 chunk 부터 묶음 쓰기 실패 -> 재시도도 다 실패해서 FAILED
+        calls[0] += 1
+        if calls[0] >= 3:
+            raise RuntimeError("boom")
+        return orig(body)
+    ss.values_batch_update = flaky
+    assert run(storage, checkpoint, attempts=2).progress()["status"] == FAILED
+
+    ss.values_batch_update = orig
+    # 서버를 다시 띄운 것처럼 새 원장으로 이어서
+    assert run(storage, checkpoint).progress()["status"] == DONE
+
+    paid = payouts(storage)
+    assert paid["entry_id"].is_unique
+    assert len(paid) == len(payouts(ref))
+    assert storage.table("Users").get_all_records() == ref.table("Users").get_all_records()
+    assert storage.table("Teams").get_all_records() == ref.table("Teams").get_all_records()
+
+
+def test_unknown_team_skips_elo_but_still_pays(tmp_path):
+    data = dict(DATA)
+    matches = [list(r) for r in DATA["Matches"]]
+    first = next(r for r in matches if r[6] == "FINISHED")
+    first[1] = "NoSuchTeam"
+    data["Matches"] = matches
+    _, storage = make_storage(data)
+
+    _, ref = make_storage()
+    run(ref, Checkpoint(str(tmp_path / "ref.json")))
+
+    job = run(storage, Checkpoint(str(tmp_path / "ck.json")))
+    assert job.progress()["status"] == DONE
+    settled = {str(r["match_id"]): r["is_settled"] for r in storage.table("Matches").get_all_records()}
+    assert settled[first[0]] == "TRUE"
+    # 팀 이름은 당첨금과 상관없으므로 지급 내역은 그대로
+    assert sorted(payouts(storage)["entry_id"]) == sorted(payouts(ref)["entry_id"])
+    assert storage.table("Users").get_all_records() == ref.table("Users").get_all_records()
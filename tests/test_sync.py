@@ -0,0 +1,45 @@
+from fakesheet import FakeSpreadsheet
+from storage import GoogleSheetsStorage, _to_records
+from sync import DeltaSync
+
+HEADER = ["nickname", "match_id", "choice", "amount", "timestamp"]
+
+
+def make_storage():
+    ss = FakeSpreadsheet()
+    ss.load({"Users": [["a", 3000]], "Matches": [], "Bets": [["a", "M1", "HOME", 500, ""]]})
+    return ss, GoogleSheetsStorage(ss)
+
+
+def test_empty_tail_has_no_records():
+    # gspread 는 범위에 데이터가 없으면 [[]] 를 돌려줌
+    assert _to_records(HEADER, [[]]) == []
+    assert _to_records(HEADER, [["a", "M1"], ["", ""]]) == [
+        {"nickname": "a", "match_id": "M1", "choice": "", "amount": "", "timestamp": ""}
+    ]
+    _, storage = make_storage()
+    assert storage.records_since("Bets", 3) == []
+
+
+def test_tail_poll_without_new_rows_does_not_skip_the_next_row():
+    ss, storage = make_storage()
+    sync = DeltaSync(storage, ("Bets",))
+    assert len(sync.sync()["Bets"]) == 1
+    for _ in range(3):
+        ss.worksheet("Users").update_cell(2, 2, 2500)   # 문서 revision 만 바뀜
+        assert len(sync.sync()["Bets"]) == 1
+    assert sync.rows["Bets"] == 1
+    ss.worksheet("Bets").append_rows([["b", "M1", "AWAY", 700, ""]])
+    bets = sync.sync()["Bets"]
+    assert bets["nickname"].astype(str).tolist() == ["a", "b"]
+    assert sync.rows["Bets"] == 2
+
+
+def test_unchanged_full_table_keeps_its_frame():
+    ss, storage = make_storage()
+    sync = DeltaSync(storage, ("Matches", "Users"))
+    first = sync.sync()
+    ss.worksheet("Users").update_cell(2, 2, 2500)
+    second = sync.sync()
+    assert second["Matches"] is first["Matches"]
+    assert second["Users"] is not first["Users"]
@@ -0,0 +1,116 @@
+import queue
+import threading
+import time
+
+import pytest
+
+from fakesheet import FakeSpreadsheet
+from storage import GoogleSheetsStorage
+from write_queue import DeadLetters, WriteBehindQueue
+
+
+class APIError(Exception):
+    def __init__(self, code):
+        super().__init__(code)
+        self.code = code
+
+
+def failing(fn, errors):
+    """errors 를 차례로 raise 하고 다 쓰면 원래 함수 호출."""
+    errors = list(errors)
+    calls = []
+
+    def wrapped(*args, **kwargs):
+        calls.append(args)
+        if errors:
+            raise errors.pop(0)
+        return fn(*args, **kwargs)
+    wrapped.calls = calls
+    return wrapped
+
+
+@pytest.fixture
+def bets(tmp_path):
+    ss = FakeSpreadsheet()
+    return GoogleSheetsStorage(ss).table("Bets"), ss.worksheet("Bets")
+
+
+def make_queue(tmp_path, **kwargs):
+    opts = dict(max_delay=0.01, base_delay=0.001, attempts=3, hold_rounds=2, hold_delay=0.01,
+                dead_letters=DeadLetters(str(tmp_path / "dead.jsonl")))
+    opts.update(kwargs)
+    return WriteBehindQueue(**opts)
+
+
+def test_append_resent_on_429(tmp_path, bets):
+    table, ws = bets
+    ws.append_rows = failing(ws.append_rows, [APIError(429), APIError(429)])
+    q = make_queue(tmp_path)
+    ticket = q.append_row(table, ["u", "M1", "HOME", 500, ""])
+    assert q.close(5)
+    assert ticket.error is None
+    assert len(ws.rows) == 2
+    assert len(q.dead_letters) == 0
+
+
+@pytest.mark.parametrize("error", [APIError(503), TimeoutError("read timed out")])
+def test_append_not_resent_when_it_may_have_landed(tmp_path, bets, error):
+    table, ws = bets
+    ws.append_rows = failing(ws.append_rows, [error])
+    q = make_queue(tmp_path)
+    ticket = q.append_row(table, ["u", "M1", "HOME", 500, ""])
+    assert q.close(5)
+    assert ticket.error is error
+    assert len(ws.append_rows.calls) == 1
+    [entry] = q.dead_letters.entries()
+    assert entry["table"] == "Bets" and entry["payload"][0] == "u"
+
+
+def test_cell_update_resent_on_5xx(tmp_path):
+    ss = FakeSpreadsheet()
+    ss.load({"Users": [["u", 1000]]})
+    users = GoogleSheetsStorage(ss).table("Users")
+    ws = ss.worksheet("Users")
+    ws.batch_update = failing(ws.batch_update, [APIError(503)])
+    q = make_queue(tmp_path)
+    ticket = q.update_cell(users, 2, 2, 600)
+    assert q.close(5)
+    assert ticket.error is None
+    assert ws.rows[1][1] == "600"
+
+
+def test_persistent_429_is_bounded_and_kept(tmp_path, bets):
+    table, ws = bets
+    ws.append_rows = failing(ws.append_rows, [APIError(429)] * 100)
+    q = make_queue(tmp_path)
+    ticket = q.append_row(table, ["u", "M1", "HOME", 500, ""])
+    assert ticket.wait(5)
+    # attempts 3번씩 hold_rounds + 1 라운드까지만
+    assert len(ws.append_rows.calls) == 3 * 3
+    assert len(q.dead_letters) == 1
+    assert not q.holding
+    q.close(5)
+
+
+def test_enqueue_does_not_wait_while_holding(tmp_path, bets):
+    table, ws = bets
+    release = threading.Event()
+
+    def stuck(*args, **kwargs):
+        release.wait(5)
+        raise APIError(429)
+    ws.append_rows = stuck
+    q = make_queue(tmp_path, max_queue=1, hold_rounds=1, hold_delay=5.0, put_timeout=5.0)
+    q.append_row(table, ["a"])      # 보내는 중
+    release.set()
+    for _ in range(100):
+        if q.holding:
+            break
+        threading.Event().wait(0.01)
+    assert q.holding
+    q.append_row(table, ["b"])      # 큐 자리 1개
+    started = time.monotonic()
+    with pytest.raises(queue.Full):
+        q.append_row(table, ["c"])
+    # put_timeout(5초) 을 기다리지 않고 바로 실패
+    assert time.monotonic() - started < 1.0
@@ -0,0 +1,145 @@
+"""
+스냅샷 디스크 저장 (재시작 직후 바로 화면을 띄우기 위한 warm start).
+
+동기화가 성공할 때마다 스냅샷을 테이블별 Arrow IPC 파일로 저장하고 (버전 포함),
+서버가 다시 켜지면 이 파일을 memory-map 으로 열어서 API 호출 없이 바로 보여준다.
+그 사이 백그라운드 스레드가 시트에서 최신 데이터를 받아 덮어쓴다.
+
+파일은 임시 파일에 쓰고 os.replace 로 바꿔치기 하므로 읽는 쪽이 반쯤 쓰인 파일을 보지 않는다.
+manifest.json 의 version 과 각 파일의 version 이 다르면 (저장 도중 꺼진 경우) 통째로 무시한다.
+
+시트 연결 (인증 / 워크시트 찾기 / 원장 읽기) 은 BackgroundTask 로 화면과 따로 진행한다.
+"""
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+
+import pandas as pd
+import pyarrow as pa
+from gspread.utils import numericise
+
+from retry import backoff_delays
+
+log = logging.getLogger(__name__)
+
+FRAMES = ("matches", "bets", "users", "teams")
+MANIFEST = "manifest.json"
+
+
+def _to_arrow(df, version):
+    # 시트 열은 숫자/빈칸("")이 섞여 있을 수 있음 -> 그런 열은 문자열로 저장하고 읽을 때 다시 숫자로
+    mixed = []
+    cols = {}
+    for c in df.columns:
+        try:
+            cols[str(c)] = pa.array(df[c], from_pandas=True)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            mixed.append(str(c))
+            cols[str(c)] = pa.array(df[c].map(str))
+    meta = {b"ddc_version": str(version).encode(), b"ddc_mixed": json.dumps(mixed).encode()}
+    return pa.table(cols).replace_schema_metadata(meta)
+
+
+def _from_arrow(table):
+    meta = table.schema.metadata or {}
+    df = table.to_pandas()
+    for c in json.loads(meta.get(b"ddc_mixed", b"[]")):
+        # get_all_records 와 같은 규칙으로 다시 숫자 변환
+        df[c] = df[c].map(lambda v: numericise(v, default_blank=""))
+    return df, int(meta.get(b"ddc_version", b"0"))
+
+
+class SnapshotStore:
+    def __init__(self, path="snapshot_cache"):
+        self.path = path
+
+    def _file(self, name):
+        return os.path.join(self.path, f"{name}.arrow")
+
+    def _write(self, target, write):
+        tmp = f"{target}.tmp"
+        write(tmp)
+        os.replace(tmp, target)
+
+    def save(self, snapshot):
+        """스냅샷 -> 테이블별 .arrow 파일 + manifest.json"""
+        os.makedirs(self.path, exist_ok=True)
+        for name in FRAMES:
+            df = getattr(snapshot, name)
+            table = _to_arrow(df if df is not None else pd.DataFrame(), snapshot.version)
+
+            def write(tmp, table=table):
+                with pa.OSFile(tmp, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+            self._write(self._file(name), write)
+
+        manifest = {"version": snapshot.version, "fetched_at": snapshot.fetched_at}
+
+        def write_manifest(tmp):
+            with open(tmp, "w") as f:
+                json.dump(manifest, f)
+        self._write(os.path.join(self.path, MANIFEST), write_manifest)
+
+    def load(self):
+        """저장된 스냅샷 (version, fetched_at, {이름: DataFrame}). 없거나 깨졌으면 None."""
+        try:
+            with open(os.path.join(self.path, MANIFEST)) as f:
+                manifest = json.load(f)
+            frames = {}
+            for name in FRAMES:
+                # 복사 없이 파일을 메모리에 매핑해서 읽음
+                with pa.memory_map(self._file(name), "r") as source:
+                    df, version = _from_arrow(pa.ipc.open_file(source).read_all())
+                if version != manifest["version"]:
+                    log.warning("저장된 스냅샷 버전 불일치 (%s: %s != %s)", name, version, manifest["version"])
+                    return None
+                frames[name] = df
+            return manifest["version"], manifest["fetched_at"], frames
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            log.warning("저장된 스냅샷 읽기 실패: %s", e)
+            return None
+
+
+class BackgroundTask:
+    """fn 을 백그라운드 스레드에서 성공할 때까지 재시도. 화면은 기다리지 않고 ready 만 확인."""
+
+    def __init__(self, fn, name="background-task", sleep=time.sleep):
+        self._fn = fn
+        self._sleep = sleep
+        self.result = None
+        self.error = None           # 마지막 실패 (성공하면 None)
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+
+    def start(self):
+        if not self._thread.is_alive() and not self._done.is_set():
+            self._thread.start()
+        return self
+
+    @property
+    def ready(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        """결과. timeout 안에 못 끝나면 마지막 오류 (없으면 TimeoutError)."""
+        if not self._done.wait(timeout):
+            raise self.error or TimeoutError(f"{self._thread.name} 준비 안 됨")
+        return self.result
+
+    def _run(self):
+        # 1, 2, 4 ... 초 쉬고 다시 (최대 30초 간격으로 계속)
+        for delay in itertools.chain(backoff_delays(5, base=1.0), itertools.repeat(30.0)):
+            try:
+                self.result = self._fn()
+                self.error = None
+                self._done.set()
+                return
+            except Exception as e:
+                self.error = e
+                log.warning("%s 실패, %.1f초 후 재시도: %s", self._thread.name, delay, e)
+                self._sleep(delay)
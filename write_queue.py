@@ -0,0 +1,256 @@
+"""
+쓰기 지연(write-behind) 큐.
+
+append_row / update_cell 을 바로 API 로 보내지 않고 백그라운드 스레드가 모아서
+워크시트마다 append_rows 1번 + batch_update 1번으로 합쳐 보낸다.
+호출한 쪽은 WriteTicket 을 바로 받고 기다리지 않는다.
+
+append 는 두 번 보내면 행이 중복되므로 429 일 때만 다시 보낸다 (5xx 는 이미 반영됐을 수 있음).
+셀 덮어쓰기(batch_update)는 여러 번 보내도 같으므로 429 / 5xx 면 다시 보낸다.
+할당량이 계속 막히면 순서를 지키기 위해 같은 묶음을 붙잡고 기다리되 (행 번호가 큐 순서에 의존)
+hold_rounds 번까지만. 붙잡고 있는 동안 새 쓰기는 기다리지 않고 바로 queue.Full (holding 으로 화면에 표시).
+그 밖의 오류(5xx append / 타임아웃 등 반영됐는지 모르는 경우)는 버리지 않고 DeadLetters 파일에 남긴다.
+
+API 호출 계측은 쓰기를 넣은 함수 기준 (metrics.find_caller 를 넣을 때 기록해 두고 보낼 때 attributed).
+한 묶음에 넣은 함수가 섞여 있으면 순서를 지키며 함수별 연속 구간으로 나눠 보낸다.
+"""
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+from metrics import attributed, find_caller
+from retry import call_with_retry, is_quota_error, is_retryable
+from storage import rowcol_to_a1
+
+log = logging.getLogger(__name__)
+
+
+class WriteTicket:
+    """쓰기 접수증. 필요하면 wait() 로 실제 반영까지 기다릴 수 있음."""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self.error = None
+
+    @property
+    def done(self):
+        return self._event.is_set()
+
+    def wait(self, timeout=None):
+        return self._event.wait(timeout)
+
+    def _finish(self, error=None):
+        self.error = error
+        self._event.set()
+
+
+class DeadLetters:
+    """끝내 못 보낸 쓰기 보관 (JSON lines). 관리자가 시트와 비교해서 직접 반영."""
+
+    def __init__(self, path="write_deadletter.jsonl"):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def add(self, writes, error):
+        ts = time.time()
+        with self._lock, open(self.path, "a") as f:
+            for w in writes:
+                f.write(json.dumps({
+                    "ts": ts, "table": getattr(w.table, "title", "?"), "kind": w.kind,
+                    "payload": w.payload, "error": f"{type(error).__name__}: {error}",
+                }, ensure_ascii=False, default=str) + "\n")
+
+    def entries(self):
+        try:
+            with open(self.path) as f:
+                return [json.loads(line) for line in f if line.strip()]
+        except FileNotFoundError:
+            return []
+
+    def __len__(self):
+        if not os.path.exists(self.path):
+            return 0
+        with open(self.path) as f:
+            return sum(1 for line in f if line.strip())
+
+
+class _Write:
+    __slots__ = ("table", "kind", "payload", "ticket", "caller")
+
+    def __init__(self, table, kind, payload, ticket, caller=None):
+        self.table = table
+        self.kind = kind        # 'append' | 'update' | 'flush'
+        self.payload = payload
+        self.ticket = ticket
+        self.caller = caller    # 쓰기를 넣은 함수 (계측용)
+
+
+class WriteBehindQueue:
+    def __init__(self, max_queue=10000, max_batch=200, max_delay=1.0,
+                 attempts=5, base_delay=0.5, put_timeout=5.0, dead_letters=None, hold_rounds=4, hold_delay=15.0):
+        self.max_batch = max_batch      # 이만큼 모이면 바로 전송
+        self.max_delay = max_delay      # 첫 요청 후 이 시간(초)이 지나면 전송
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.put_timeout = put_timeout
+        self.dead_letters = dead_letters    # None 이면 로그만 (테스트용)
+        self.hold_rounds = hold_rounds      # 429 / 5xx 가 계속되면 hold_delay 초씩 쉬면서 이만큼 더 시도
+        self.hold_delay = hold_delay
+        self.holding = False                # 할당량 때문에 묶음을 붙잡고 기다리는 중
+        self._q = queue.Queue(maxsize=max_queue)
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._thread.start()
+
+    # --- 호출하는 쪽 API ---
+
+    def append_row(self, table, values):
+        return self._put(table, "append", list(values))
+
+    def update_cell(self, table, row, col, value):
+        return self._put(table, "update", (int(row), int(col), value))
+
+    def put_many(self, writes):
+        """
+        [(table, 'append', 값 목록) | (table, 'update', (row, col, value)), ...] 를 전부 넣거나 하나도 안 넣음
+        (원장 기록 + 베팅 행처럼 같이 나가야 하는 쓰기). 반환: WriteTicket 목록.
+        """
+        return self._put_many([(table, kind, list(p) if kind == "append" else p) for table, kind, p in writes])
+
+    def flush(self, timeout=None):
+        """지금까지 넣은 쓰기를 즉시 보내고, 다 끝날 때까지 기다림."""
+        ticket = WriteTicket()
+        self._q.put(_Write(None, "flush", None, ticket))
+        return ticket.wait(timeout)
+
+    def close(self, timeout=None):
+        """종료 시 호출: 남은 쓰기를 모두 보내고 스레드를 멈춤."""
+        if self._closed:
+            return True
+        self._closed = True
+        ok = self.flush(timeout)
+        self._q.put(None)
+        self._thread.join(timeout)
+        return ok
+
+    def pending(self):
+        return self._q.qsize()
+
+    def _put(self, table, kind, payload):
+        return self._put_many([(table, kind, payload)])[0]
+
+    def _put_many(self, writes):
+        if self._closed:
+            raise RuntimeError("write queue closed")
+        caller = find_caller()
+        items = [_Write(table, kind, payload, WriteTicket(), caller) for table, kind, payload in writes]
+        # 큐가 가득 차면 put_timeout 만큼 기다리다가 queue.Full.
+        # 보내는 쪽이 막혀 있으면 (holding) 자리가 날 때까지 기다리지 않고 바로 queue.Full
+        timeout = 0.0 if self.holding else self.put_timeout
+        q = self._q
+        with q.not_full:
+            # queue.Queue.put 과 같은 방식으로, 자리가 len(items) 개 날 때까지 기다렸다가 한 번에 넣음
+            deadline = time.monotonic() + timeout
+            while q.maxsize > 0 and q.maxsize - q._qsize() < len(items):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise queue.Full
+                q.not_full.wait(remaining)
+            for item in items:
+                q._put(item)
+            q.unfinished_tasks += len(items)
+            q.not_empty.notify()
+        return [item.ticket for item in items]
+
+    # --- 백그라운드 스레드 ---
+
+    def _run(self):
+        while True:
+            item = self._q.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = time.monotonic() + self.max_delay
+            while item.kind != "flush" and len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._q.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._send(batch)
+                    return
+                batch.append(item)
+            self._send(batch)
+
+    def _send(self, batch):
+        groups = {}
+        flushes = []
+        for w in batch:
+            if w.kind == "flush":
+                flushes.append(w.ticket)
+                continue
+            groups.setdefault(id(w.table), (w.table, []))[1].append(w)
+
+        for table, writes in groups.values():
+            appends = [w for w in writes if w.kind == "append"]
+            updates = [w for w in writes if w.kind == "update"]
+            # 새 행을 먼저 붙여야 같은 배치 안에서 그 행을 고치는 update 가 안전함
+            for run in _caller_runs(appends):
+                self._call(run, table.append_rows, [w.payload for w in run], is_quota_error)
+            for run in _caller_runs(updates):
+                # 같은 셀을 여러 번 고치면 마지막 값만 보냄
+                cells = {}
+                for w in run:
+                    row, col, value = w.payload
+                    cells[(row, col)] = value
+                data = [{"range": rowcol_to_a1(r, c), "values": [[v]]} for (r, c), v in cells.items()]
+                self._call(run, table.batch_update, data, is_retryable)
+
+        for ticket in flushes:
+            ticket._finish()
+
+    def _call(self, writes, fn, arg, retry_on):
+        error = None
+        try:
+            for round_ in range(self.hold_rounds + 1):
+                try:
+                    with attributed(writes[0].caller):
+                        call_with_retry(fn, arg, attempts=self.attempts, base=self.base_delay, retry_on=retry_on)
+                    error = None
+                    break
+                except Exception as e:
+                    error = e
+                    # 다시 보내도 되는 오류면 순서를 지키며 잠시 뒤 같은 묶음을 다시 (종료 중이면 그만)
+                    if not retry_on(e) or self._closed or round_ == self.hold_rounds:
+                        break
+                    log.warning("write-behind 할당량/서버 오류, %.0f초 후 다시 (%d건): %s", self.hold_delay, len(writes), e)
+                    self.holding = True
+                    time.sleep(self.hold_delay)
+        finally:
+            self.holding = False
+        if error is not None:
+            log.error("write-behind 전송 실패 (%d건), 보관함에 기록: %s", len(writes), error)
+            if self.dead_letters is not None:
+                try:
+                    self.dead_letters.add(writes, error)
+                except OSError as e:
+                    log.error("write-behind 보관함 기록 실패: %s", e)
+        for w in writes:
+            w.ticket._finish(error)
+
+
+def _caller_runs(writes):
+    """넣은 순서를 유지한 채 같은 caller 가 연속된 구간으로 나눔 (보통 1개)."""
+    runs = []
+    for w in writes:
+        if runs and runs[-1][-1].caller == w.caller:
+            runs[-1].append(w)
+        else:
+            runs.append([w])
+    return runs